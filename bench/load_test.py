@@ -0,0 +1,360 @@
+"""
+End-to-end load and replay harness for EmoBot.
+Feeds synthetic or recorded message streams straight into EmoBot.on_message
+through fake Discord objects, with PersonalityEngine pointed at a local stub
+completion server. Reports throughput, end-to-end latency percentiles and
+event-loop lag.
+
+Examples:
+    python bench/load_test.py --messages 500 --rate 20
+    python bench/load_test.py --messages 300 --record traffic.jsonl
+    python bench/load_test.py --replay traffic.jsonl --speed 4 --error-rate 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import contextvars
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_openai
+
+CHATTER = [
+    "lol ok see you tomorrow", "did anyone finish the homework", "brb grabbing food",
+    "that's so funny", "good morning everyone", "what time is the meeting", "nah I'm good",
+    "anyone playing tonight?", "can't believe it's monday again", "this weather is wild"
+]
+MUSIC = [
+    "just got tickets to see my chemical romance!!", "the cure is the best band ever",
+    "anyone recommend some metal?", "what should i listen to tonight", "pop punk never died",
+    "slipknot live is insane", "i need new emo songs", "paramore's new album though",
+    "is bad religion still touring?", "what's the best sex pistols album"
+]
+DIRECT = [
+    "hey raven how are you", "what's your favorite band?", "raven recommend me something sad",
+    "i had a rough day", "hi raven", "tell me about the black parade", "what's your fave band"
+]
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Timing of one inbound message through the bot."""
+
+    __slots__ = ('kind', 'start', 'first_output', 'last_output', 'done', 'outputs')
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.first_output = None
+        self.last_output = None
+        self.done = None
+        self.outputs = 0
+
+    def output(self):
+        now = time.perf_counter()
+        if self.first_output is None:
+            self.first_output = now
+        self.last_output = now
+        self.outputs += 1
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str, bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+
+
+class FakeMessage:
+    _ids = 0
+
+    def __init__(self, content: str, author: FakeUser, channel: "FakeChannel", mentions=None):
+        FakeMessage._ids += 1
+        self.id = FakeMessage._ids
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.mentions = mentions or []
+        self._state = channel.state  # Command context reads the connection state
+        self.reference = None
+        self.guild = channel.guild  # Synthetic traffic is guild traffic, so it takes the guild routing path
+        self.attachments = []
+
+    async def edit(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.channel.send_latency)
+        self.content = content
+        trace = _trace.get()
+        if trace:
+            trace.output()
+        return self
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, bot_user: FakeUser, send_latency: float, state=None, guild: Optional[FakeGuild] = None):
+        self.id = channel_id
+        self.guild = guild
+        self.bot_user = bot_user
+        self.state = state
+        self.send_latency = send_latency
+        self.sent = 0
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.send_latency)
+        self.sent += 1
+        trace = _trace.get()
+        # Dispatcher sends run in the channel's queue task; traced_send credits those
+        if trace and not asyncio.current_task().get_name().startswith("outbound-"):
+            trace.output()
+        return FakeMessage(content, self.bot_user, self)
+
+
+def synthetic_stream(count: int, rate: float, users: int, channels: int, direct_share: float, music_share: float) -> List[Dict]:
+    """Poisson arrivals mixing chatter, music talk and messages aimed at the bot."""
+    events = []
+    t = 0.0
+    for _ in range(count):
+        t += random.expovariate(rate)
+        roll = random.random()
+        if roll < direct_share:
+            kind, content, mention = 'direct', random.choice(DIRECT), True
+        elif roll < direct_share + music_share:
+            kind, content, mention = 'music', random.choice(MUSIC), False
+        else:
+            kind, content, mention = 'chatter', random.choice(CHATTER), False
+        events.append({
+            't': round(t, 4),
+            'user': random.randint(1, users),
+            'channel': random.randint(1, channels),
+            'content': content,
+            'mention': mention,
+            'kind': kind
+        })
+    return events
+
+
+def load_stream(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def measure_loop_lag(samples: List[float], interval: float, stop: asyncio.Event):
+    """Sleep in short ticks and record how late each wake-up is."""
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - before - interval))
+
+
+async def run(args) -> Dict:
+    stub = stub_openai.from_arguments(args)
+    base_url = await stub.start()
+
+    # Configure the bot before its modules read the environment
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+    os.environ["STREAM_RESPONSES"] = "true" if args.stream else "false"
+    if args.no_gate:
+        os.environ["GATE_ENABLED"] = "false"
+    os.environ["GENERATION_WORKERS"] = str(args.generation_workers)
+    from bot import EmoBot
+    import metrics
+
+    bot = EmoBot()
+    bot_user = FakeUser(10 ** 9, "Raven", bot=True)
+    bot._connection.user = bot_user
+    await bot._async_setup_hook()  # What login() would do; close() expects it
+    await bot.setup_hook()
+
+    send = bot.outbound.send
+
+    async def traced_send(*args, **kwargs):
+        messages = await send(*args, **kwargs)
+        trace = _trace.get()
+        if trace and messages:
+            trace.output()
+        return messages
+
+    bot.outbound.send = traced_send
+
+    events = load_stream(args.replay) if args.replay else synthetic_stream(
+        args.messages, args.rate, args.users, args.channels, args.direct_share, args.music_share
+    )
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    guild = FakeGuild(1)
+    channels = {}
+    authors = {}
+    traces: List[Trace] = []
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples, 0.01, stop))
+
+    async def deliver(event: Dict):
+        trace = Trace(event.get('kind', 'replay'))
+        _trace.set(trace)
+        traces.append(trace)
+        channel = channels.setdefault(event['channel'], FakeChannel(event['channel'], bot_user, args.send_latency, bot._connection, guild))
+        author = authors.setdefault(event['user'], FakeUser(event['user'], f"user{event['user']}"))
+        message = FakeMessage(event['content'], author, channel, [bot_user] if event.get('mention') else [])
+        try:
+            await bot.on_message(message)
+        finally:
+            trace.done = time.perf_counter()
+
+    # Dispatch each message in its own task, as discord.py does
+    started = time.perf_counter()
+    tasks = []
+    for event in events:
+        delay = event['t'] / args.speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver(event)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        print(f"{len(errors)} messages raised, first: {errors[0]!r}", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    generation = bot.generation_pool.stats() if bot.generation_pool else None
+    await bot.close()
+    await stub.stop()
+
+    answered = [t for t in traces if t.outputs]
+    e2e = [t.last_output - t.start for t in answered]
+    first = [t.first_output - t.start for t in answered]
+    per_kind = {}
+    for trace in traces:
+        counts = per_kind.setdefault(trace.kind, {'messages': 0, 'answered': 0})
+        counts['messages'] += 1
+        counts['answered'] += 1 if trace.outputs else 0
+
+    return {
+        'messages': len(traces),
+        'answered': len(answered),
+        'errors': len(errors),
+        'elapsed_s': elapsed,
+        'throughput_msg_s': len(traces) / elapsed if elapsed else 0.0,
+        'e2e_ms': {p: percentile(e2e, p) * 1000 for p in (50, 95, 99)},
+        'first_output_ms': {p: percentile(first, p) * 1000 for p in (50, 95, 99)},
+        'loop_lag_ms': {
+            'p50': percentile(lag_samples, 50) * 1000,
+            'p99': percentile(lag_samples, 99) * 1000,
+            'max': max(lag_samples, default=0.0) * 1000
+        },
+        'by_kind': per_kind,
+        'stub': stub.stats(),
+        'scheduler': bot.personality.scheduler.stats(),
+        'gate': bot.message_gate.stats(),
+        'outbound': bot.outbound.stats(),
+        'routing': bot.personality.router.stats() if bot.personality.router else None,
+        'breaker': bot.personality.breaker.stats() if bot.personality.breaker else None,
+        'generation': generation,
+        'stages_ms': {
+            stage: {'p50': f['p50'] * 1000, 'p95': f['p95'] * 1000, 'count': f['count']}
+            for stage, f in metrics.summary()['stages'].items()
+        },
+        'enrichment_delay_ms': {
+            stage: {'p50': f['p50'] * 1000, 'p95': f['p95'] * 1000, 'count': f['count']}
+            for stage, f in metrics.summary()['enrichment'].items()
+        }
+    }
+
+
+def print_report(report: Dict):
+    print(f"messages:      {report['messages']} ({report['answered']} answered, {report['errors']} errors) in {report['elapsed_s']:.2f}s")
+    print(f"throughput:    {report['throughput_msg_s']:.1f} msg/s")
+    for label, key in (("end-to-end", 'e2e_ms'), ("first output", 'first_output_ms')):
+        values = report[key]
+        print(f"{label + ':':<15}p50 {values[50]:.0f}ms  p95 {values[95]:.0f}ms  p99 {values[99]:.0f}ms")
+    lag = report['loop_lag_ms']
+    print(f"loop lag:      p50 {lag['p50']:.1f}ms  p99 {lag['p99']:.1f}ms  max {lag['max']:.1f}ms")
+    for kind, counts in sorted(report['by_kind'].items()):
+        print(f"  {kind:<10}{counts['answered']}/{counts['messages']} answered")
+    print(f"stub:          {report['stub']}")
+    print(f"scheduler:     {report['scheduler']}")
+    print(f"gate:          {report['gate']}")
+    print(f"outbound:      {report['outbound']}")
+    if report['routing']:
+        print(f"routing:       {report['routing']}")
+    if report['breaker']:
+        print(f"breaker:       {report['breaker']}")
+    if report['generation']:
+        print(f"generation:    {report['generation']}")
+    for stage, figures in report['stages_ms'].items():
+        print(f"  {stage:<15}p50 {figures['p50']:.1f}ms  p95 {figures['p95']:.1f}ms  ({figures['count']})")
+    for stage, figures in report['enrichment_delay_ms'].items():
+        print(f"  +{stage:<14}p50 {figures['p50']:.1f}ms  p95 {figures['p95']:.1f}ms  ({figures['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="Synthetic messages to send")
+    parser.add_argument("--rate", type=float, default=10.0, help="Synthetic arrivals per second")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--direct-share", type=float, default=0.2, help="Share of messages mentioning the bot")
+    parser.add_argument("--music-share", type=float, default=0.3, help="Share of music chatter")
+    parser.add_argument("--replay", help="JSONL stream to replay instead of synthetic traffic")
+    parser.add_argument("--record", help="Write the stream that was sent to this JSONL file")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="Simulated Discord send/edit latency")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Use single-send replies")
+    parser.add_argument("--no-gate", action="store_true", help="Send all chatter to the AI")
+    parser.add_argument("--generation-workers", type=int, default=0, help="Generate in this many worker processes")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--log-level", default="CRITICAL", help="Bot log level during the run")
+    stub_openai.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    if args.seed is not None:
+        random.seed(args.seed)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Micro-benchmarks for the music matching, recommendation and prompt hot paths.
+Scales the catalog (10 -> 100k bands) and message length (short -> 2000 chars)
+to show how each path grows, and compares runs against a saved baseline.
+Baselines are machine-specific; record one on the box you compare on.
+
+Examples:
+    python bench/micro.py                       # full sweep, print results
+    python bench/micro.py --save                # record bench/baseline.json
+    python bench/micro.py --compare             # fail on >25% regressions
+    python bench/micro.py --sizes 10,1000 --messages short
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import itertools
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from music_catalog import MusicCatalog
+from music_knowledge import MusicKnowledge
+from context_store import UserContext
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MESSAGE_LENGTHS = {'short': 40, 'medium': 300, 'long': 2000}
+FILLER = (
+    "honestly today was so long and i just want to lie in bed with headphones on "
+    "and forget about everything for a while you know what i mean"
+).split()
+SYLLABLES = ["ra", "ven", "mor", "tal", "ash", "grim", "vel", "nox", "cry", "sin", "lux", "dra", "kor", "vex", "ul", "sha"]
+VIBE_WORDS = "dark heavy fast melodic raw theatrical gothic jangly political anthemic screaming acoustic moody brooding".split()
+
+
+def synthetic_catalog(bands: int, seed: int = 7) -> Dict:
+    """Built-in bands plus generated ones, in the nested genre layout."""
+    rnd = random.Random(seed)
+    database = MusicKnowledge._initialize_music_database()
+    genres = list(database) + [f"subgenre_{i}" for i in range(max(0, bands // 2000))]
+    for genre in genres:
+        database.setdefault(genre, {"bands": [], "songs": []})
+
+    existing = sum(len(data['bands']) for data in database.values())
+    for i in range(max(0, bands - existing)):
+        name = "".join(rnd.choice(SYLLABLES) for _ in range(3)).title() + f" {i}"
+        genre = rnd.choice(genres)
+        database[genre]['bands'].append({
+            "name": name,
+            "era": f"{rnd.randint(1965, 2020)}-present",
+            "vibe": " ".join(rnd.sample(VIBE_WORDS, 4))
+        })
+        if rnd.random() < 0.5:
+            database[genre]['songs'].append(f"{''.join(rnd.choice(SYLLABLES) for _ in range(2)).title()} Song {i} - {name}")
+
+    # Trim the built-in bands when a tiny catalog is requested
+    if bands < existing:
+        kept = 0
+        for data in database.values():
+            data['bands'] = data['bands'][:max(0, bands - kept)]
+            kept += len(data['bands'])
+        database = {genre: data for genre, data in database.items() if data['bands']}
+    return database
+
+
+def synthetic_message(length: int, music: MusicKnowledge, rnd: random.Random) -> str:
+    """Chatty filler with a band mention and a keyword, padded to length."""
+    band_ids = music.catalog.band_ids(rnd.choice(music.catalog.genres()))
+    words = [music.catalog.band(rnd.choice(band_ids))['name'], "is my favorite band"]
+    while len(" ".join(words)) < length:
+        words.insert(rnd.randint(0, len(words)), rnd.choice(FILLER))
+    return " ".join(words)[:length]
+
+
+def time_case(func: Callable, min_time: float, repeats: int) -> float:
+    """Best seconds per call over several timed batches; the minimum is the least noisy."""
+    func()
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeats:
+            break
+        iterations *= 2
+
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        samples.append((time.perf_counter() - started) / iterations)
+    return min(samples)
+
+
+class FakeContext:
+    """Just enough of commands.Context for the rendering commands."""
+
+    def __init__(self):
+        self.author = type("Author", (), {"id": 1, "display_name": "bench"})()
+        self.sent = None
+
+    async def send(self, content=None, **kwargs):
+        self.sent = content
+
+
+def build_bot(loop: asyncio.AbstractEventLoop, music: MusicKnowledge):
+    """A command-only EmoBot wired to the benchmark catalog."""
+    from bot import EmoBot
+    from commands import setup_commands
+
+    bot = EmoBot()
+    bot.music_knowledge = music
+    loop.run_until_complete(bot._async_setup_hook())  # What login() would do; close() expects it
+    loop.run_until_complete(setup_commands(bot))
+    return bot
+
+
+def run_command(loop: asyncio.AbstractEventLoop, command, *args, **kwargs) -> Callable:
+    ctx = FakeContext()
+    return lambda: loop.run_until_complete(command.callback(ctx, *args, **kwargs))
+
+
+def run_suite(sizes: List[int], lengths: List[str], min_time: float, repeats: int) -> Dict[str, float]:
+    from personality import PersonalityEngine
+
+    results = {}
+    rnd = random.Random(1)
+    engine = PersonalityEngine()
+    workdir = tempfile.mkdtemp(prefix="emobot-bench-")
+    loop = asyncio.new_event_loop()
+
+    for size in sizes:
+        path = os.path.join(workdir, f"catalog-{size}.db")
+        MusicCatalog.build(path, synthetic_catalog(size))
+        Config.MUSIC_CATALOG_PATH = path
+
+        started = time.perf_counter()
+        music = MusicKnowledge()
+        loop.run_until_complete(music.reload())
+        results[f"startup/music_knowledge[bands={size}]"] = time.perf_counter() - started
+        print(f"catalog {size}: loaded in {results[f'startup/music_knowledge[bands={size}]'] * 1000:.0f}ms", file=sys.stderr)
+
+        for label in lengths:
+            messages = [synthetic_message(MESSAGE_LENGTHS[label], music, rnd) for _ in range(64)]
+            cycle = itertools.cycle(messages)
+            # Each call sees a fresh message so the single-entry scan cache can't help
+            cases = {
+                'is_music_related': lambda: music.is_music_related(next(cycle)),
+                'get_music_response': lambda: loop.run_until_complete(music.get_music_response(next(cycle))),
+                '_get_band_response': lambda: music._get_band_response(next(cycle)),
+                '_get_genre_response': lambda: music._get_genre_response(next(cycle)),
+            }
+            for name, func in cases.items():
+                results[f"{name}[bands={size},msg={label}]"] = time_case(func, min_time, repeats)
+
+            if size == sizes[0]:
+                # Prompt building doesn't touch the catalog, so time it once per length
+                context = UserContext(messages[0][:Config.CONTEXT_MAX_TEXT_CHARS], "", 5, time.time())
+                results[f"_build_context_prompt[msg={label}]"] = time_case(
+                    lambda: engine._build_context_prompt(messages[1], context, "bench"), min_time, repeats
+                )
+
+        bot = build_bot(loop, music)
+        results[f"render/playlist[bands={size}]"] = time_case(
+            run_command(loop, bot.get_command('playlist'), 'heartbreak'), min_time, repeats
+        )
+        results[f"render/recommend_genre[bands={size}]"] = time_case(
+            run_command(loop, bot.get_command('recommend'), query='metal'), min_time, repeats
+        )
+        results[f"render/recommend_band[bands={size}]"] = time_case(
+            run_command(loop, bot.get_command('recommend'), query='the cure --fresh'), min_time, repeats
+        )
+        loop.run_until_complete(bot.close())
+        music.catalog.close()
+
+    loop.run_until_complete(engine.close())
+    loop.close()
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Cases slower than the baseline by more than threshold."""
+    regressions = []
+    for name, seconds in results.items():
+        if name.startswith("startup/"):
+            continue  # Single cold measurement, too noisy to gate on
+        before = baseline.get(name)
+        if before and seconds > before * (1 + threshold):
+            regressions.append(f"{name}: {before * 1e6:.1f}us -> {seconds * 1e6:.1f}us (+{(seconds / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results: Dict[str, float], baseline: Dict[str, float]):
+    width = max(len(name) for name in results)
+    for name, seconds in results.items():
+        line = f"{name:<{width}}  {seconds * 1e6:>12.2f} us"
+        if name in baseline:
+            line += f"  ({(seconds / baseline[name] - 1) * 100:+.0f}% vs baseline)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="Comma-separated catalog sizes")
+    parser.add_argument("--messages", default="short,medium,long", help="Comma-separated message lengths")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds spent timing each case")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Exit non-zero on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before a case regresses")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    lengths = args.messages.split(",")
+    results = run_suite(sizes, lengths, args.min_time, args.repeats)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        if not baseline:
+            print(f"\nNo baseline at {args.baseline}, run with --save first")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+Answers with canned text after a configurable delay, can stream tokens,
+and can inject 429s so rate-limit handling is exercised.
+
+Standalone:
+    python bench/stub_openai.py --port 8089 --latency 0.8 --error-rate 0.05
+then run the bot with OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+REPLY_WORDS = (
+    "ugh babe that hits different 🖤 honestly nothing beats screaming along to "
+    "the black parade at 3am while the rain does its whole dramatic thing outside 🥀 "
+    "tell me what's haunting you tonight gorgeous"
+).split()
+
+class StubOpenAI:
+    """aiohttp app that imitates /v1/chat/completions."""
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 60
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._runner = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve in the current loop and return the base URL for the OpenAI client."""
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completion)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'peak_in_flight': self.peak_in_flight
+        }
+
+    def _delay(self) -> float:
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def _reply(self, body: dict) -> list:
+        # Routed requests ask for fewer tokens; honour the cap like the API would
+        count = min(self.reply_tokens, body.get("max_tokens") or self.reply_tokens)
+        return [random.choice(REPLY_WORDS) for _ in range(count)]
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+
+        if random.random() < self.error_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429,
+                headers={"retry-after": "1"}
+            )
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if body.get("stream"):
+                return await self._stream(request, body)
+            await asyncio.sleep(self._delay())
+            return web.json_response({
+                "id": f"chatcmpl-stub-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(self._reply(body))},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": self.reply_tokens, "total_tokens": self.reply_tokens}
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request: web.Request, body: dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self._delay())
+
+        chunk_id = f"chatcmpl-stub-{self.requests}"
+        for word in self._reply(body):
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(1.0 / self.tokens_per_second)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Stub options shared with the load harness."""
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Std-dev of that delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Streaming speed")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Words per reply")
+
+
+def from_arguments(args) -> StubOpenAI:
+    return StubOpenAI(args.latency, args.jitter, args.error_rate, args.tokens_per_second, args.reply_tokens)
+
+
+async def _serve(args):
+    stub = from_arguments(args)
+    url = await stub.start(args.host, args.port)
+    print(f"Stub OpenAI listening at {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -4,18 +4,33 @@ Main Discord bot class with AI personality integration.
 
 import discord
 from discord.ext import commands
+import time
 import asyncio
 import logging
 from personality import PersonalityEngine
 from music_knowledge import MusicKnowledge
 from commands import setup_commands
+from streaming import StreamingReply
+from outbound import OutboundDispatcher
+from response_pools import ResponsePools
+from long_term_memory import DM_SCOPE, LongTermMemory
+from context_store import ContextStore
+from persistent_store import PersistentContextStore
+from conversation_history import ConversationHistory
+from generation_pool import GenerationPool, JobCancelled, DELTA, DONE
+from llm_scheduler import LLMBusyError
+from message_gate import MessageGate, LLM, LOCAL
+from enrichment import default_pipeline
+from diagnostics import LoopWatchdog, SamplingProfiler, StartupTimer
+from metrics import registry, MetricsServer, STAGE_SECONDS, CONVERSATIONS
 from config import Config
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class EmoBot(commands.Bot):
-    def __init__(self):
+class EmoBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids=None, shard_count=None, startup=None):
+        self.startup = startup or StartupTimer()
         # Use minimal intents that don't require privileged access
         intents = discord.Intents.default()
         # Only enable message_content if it's available (needs to be enabled in Discord Developer Portal)
@@ -24,23 +39,125 @@ class EmoBot(commands.Bot):
         super().__init__(
             command_prefix=Config.COMMAND_PREFIX,
             intents=intents,
-            help_command=None
+            help_command=None,
+            # Left unset, discord.py asks the gateway how many shards to run;
+            # the shard coordinator hands each worker process a fixed range
+            shard_ids=shard_ids,
+            shard_count=shard_count
         )
         
         self.personality = PersonalityEngine()
         self.music_knowledge = MusicKnowledge()
-        self.last_interactions = {}  # Track user interactions for context
+        self.message_gate = MessageGate(self.music_knowledge)
+        # Lookups appended to replies, run while the model is answering
+        self.enrichment = default_pipeline(self.music_knowledge)
+        # Paces, splits and coalesces everything the bot posts in conversations
+        self.outbound = OutboundDispatcher()
+        # Track user interactions for context, optionally surviving restarts
+        if Config.CONTEXT_DB_PATH:
+            self.context_store = PersistentContextStore(Config.CONTEXT_DB_PATH)
+        else:
+            self.context_store = ContextStore()
+        # Optionally hand generation to worker processes; the gateway then only talks to Discord
+        self.generation_pool = GenerationPool() if Config.GENERATION_WORKERS > 0 else None
+        # Recent turns per user and channel, summarized as they age out
+        summarizer = self.generation_pool.summarize if self.generation_pool else self.personality.summarize
+        self.history = ConversationHistory(summarizer=summarizer)
+        # Older things users have said, recalled by similarity to the new message
+        self.memory = LongTermMemory(Config.MEMORY_PATH) if Config.MEMORY_ENABLED else None
+        # Fresh lines for !vibe, !lyrics and greetings, written while the LLM is idle
+        if Config.RESPONSE_POOLS_ENABLED:
+            writer = self.generation_pool.write_variations if self.generation_pool else self.personality.write_variations
+            self.response_pools = ResponsePools(writer, self._llm_idle)
+        else:
+            self.response_pools = None
+        self.metrics_server = MetricsServer() if Config.METRICS_PORT else None
+        self.loop_watchdog = LoopWatchdog() if Config.LOOP_WATCHDOG_ENABLED else None
+        self.profiler = SamplingProfiler()
+        self._warm_up_task = None
+        self._register_gauges()
+        self.startup.mark('init')
+        
+    def _register_gauges(self):
+        """Expose subsystem sizes as gauges read at scrape time."""
+        scheduler = self.personality.scheduler
+        registry.gauge("emobot_context_users", "Users held in the context store", lambda: self.context_store.stats()['users'])
+        registry.gauge("emobot_context_bytes", "Approximate bytes used by the context store", lambda: self.context_store.bytes_used)
+        if self.memory:
+            registry.gauge("emobot_memory_snippets", "Snippets held in long-term memory", lambda: len(self.memory))
+        registry.gauge("emobot_history_conversations", "Conversations with recent turns in memory", lambda: len(self.history))
+        registry.gauge("emobot_outbound_pending", "Messages queued behind a channel's send bucket", lambda: self.outbound.stats()['pending'])
+        registry.gauge("emobot_llm_queue_depth", "Messages waiting for a completion slot", lambda: scheduler.queue_depth)
+        registry.gauge("emobot_llm_in_flight", "Completions currently running", lambda: scheduler.stats()['in_flight'])
+        registry.gauge("emobot_shard_latency_seconds", "Gateway heartbeat latency per shard",
+                       lambda: {(str(shard_id),): latency for shard_id, latency in self.latencies}, ("shard",))
+        registry.gauge("emobot_shard_up", "Whether each shard's gateway connection is open",
+                       lambda: {(str(shard_id),): 0.0 if shard.is_closed() else 1.0 for shard_id, shard in self.shards.items()}, ("shard",))
+        if self.generation_pool:
+            registry.gauge("emobot_generation_jobs_in_flight", "Jobs submitted to the generation pool and not yet answered",
+                           lambda: self.generation_pool.stats()['in_flight'])
+            registry.gauge("emobot_generation_workers_alive", "Generation worker processes running",
+                           lambda: self.generation_pool.stats()['alive'])
+        if self.response_pools:
+            registry.gauge("emobot_response_pool_lines", "Pre-generated lines ready per command pool",
+                           self.response_pools.sizes, ("pool",))
+        if self.generation_pool:
+            registry.gauge("emobot_breakers_open", "OpenAI circuit breakers currently open, one per generating process",
+                           lambda: self.generation_pool.stats()['breakers_open'])
+        elif self.personality.breaker:
+            registry.gauge("emobot_breakers_open", "OpenAI circuit breakers currently open, one per generating process",
+                           lambda: 1.0 if self.personality.breaker.is_open else 0.0)
+        if self.personality.router:
+            registry.gauge("emobot_route_degraded", "Whether replies are held on the fast model tier",
+                           lambda: 1.0 if self.personality.router.degraded else 0.0)
+        if self.personality.response_cache is not None:
+            registry.gauge("emobot_response_cache_hit_rate", "Share of cacheable prompts served from cache",
+                           lambda: self.personality.response_cache.stats()['hit_rate'])
+        registry.gauge("emobot_startup_seconds", "Seconds spent in each startup phase",
+                       lambda: {(phase,): seconds for phase, seconds in self.startup.phases.items()}, ("phase",))
+        
+    def _llm_idle(self) -> bool:
+        """Whether there's spare completion capacity for background work."""
+        if self.generation_pool:
+            return self.generation_pool.stats()['in_flight'] < self.generation_pool.size
+        scheduler = self.personality.scheduler
+        return scheduler.queue_depth == 0 and scheduler.stats()['in_flight'] * 2 < scheduler.max_concurrency
         
     async def setup_hook(self):
         """Called when the bot is starting up."""
+        self.startup.mark('login')
         logger.info("Setting up bot...")
+        # Build the OpenAI client while setup and the gateway handshake run, not on the first message
+        self._warm_up_task = asyncio.create_task(self._warm_up())
         await setup_commands(self)
+        await self.context_store.start()
+        await self.music_knowledge.start()
+        if self.generation_pool:
+            await self.generation_pool.start()
+        if self.response_pools:
+            await self.response_pools.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.loop_watchdog:
+            await self.loop_watchdog.start()
         logger.info("Bot setup complete")
+        self.startup.mark('setup')
+        
+    async def _warm_up(self):
+        try:
+            with self.startup.background('warm_up'):
+                await self.personality.warm_up()
+        except Exception as e:
+            # The first completion will try again and answer with a fallback if it can't
+            logger.error(f"Couldn't build the OpenAI client: {e}")
         
     async def on_ready(self):
         """Called when the bot has connected to Discord."""
         logger.info(f'{self.user} has connected to Discord!')
         logger.info(f'Connected to {len(self.guilds)} guilds')
+        if not self.startup.reported:
+            self.startup.mark('gateway')
+            self.startup.report()
         
         # Set bot status
         activity = discord.Activity(
@@ -61,52 +178,212 @@ class EmoBot(commands.Bot):
         is_dm = isinstance(message.channel, discord.DMChannel)
         is_mentioned = self.user and self.user in message.mentions
         is_command_like = message.content.startswith(Config.COMMAND_PREFIX)
+        resolved = message.reference.resolved if message.reference else None
+        is_reply = isinstance(resolved, discord.Message) and resolved.author == self.user
         
-        if is_dm or is_mentioned or (not is_command_like and len(message.content) > 3):
+        if is_dm or is_mentioned or is_reply:
             await self.handle_conversation(message)
+        elif not is_command_like and len(message.content) > 3:
+            if not Config.GATE_ENABLED:
+                await self.handle_conversation(message)
+                return
+                
+            # Guild chatter only reaches the AI when it's likely worth it
+            decision = self.message_gate.decide(message.content, message.channel.id)
+            if decision.action == LLM:
+                await self.handle_conversation(message)
+            elif decision.action == LOCAL:
+                await self.outbound.send(message.channel, decision.reply)
+                
+    async def on_raw_message_delete(self, payload):
+        """Stop generating replies to messages that have been deleted."""
+        if self.generation_pool and self.generation_pool.cancel_message(payload.message_id):
+            logger.info(f"Cancelled generation for deleted message {payload.message_id}")
             
     async def handle_conversation(self, message):
         """Handle AI conversation with personality."""
+        started = time.perf_counter()
+        # Queueing and generation both count against how long the user will wait
+        deadline = time.monotonic() + Config.REPLY_DEADLINE
+        enrichment = None
         try:
             # Show typing indicator
             async with message.channel.typing():
+                STAGE_SECONDS.observe(time.perf_counter() - started, 'typing')
+                
                 # Get user context
                 user_id = message.author.id
-                user_context = self.last_interactions.get(user_id, {})
-                
-                # Check if message is about music
-                is_music_related = self.music_knowledge.is_music_related(message.content)
+                with STAGE_SECONDS.time('context'):
+                    user_context = await self.context_store.load(user_id)
+                    history = self.history.window(user_id, message.channel.id)
+                with STAGE_SECONDS.time('memory'):
+                    memories = None
+                    if self.memory:
+                        # Turns already in the window needn't be recalled too
+                        recent = [turn.text for turn in history.turns] if history else ()
+                        scope = message.guild.id if message.guild else DM_SCOPE
+                        memories = self.memory.recall(user_id, scope, message.content, exclude=recent)
                 
-                # Generate response with personality
-                response = await self.personality.generate_response(
-                    message.content,
-                    user_context,
-                    is_music_related,
-                    message.author.display_name
-                )
-                
-                # Add music knowledge if relevant
-                if is_music_related:
-                    music_info = await self.music_knowledge.get_music_response(message.content)
-                    if music_info:
-                        response += f"\n\n{music_info}"
+                # Check if message is about music (pool workers check for themselves)
+                is_music_related = False
+                if not self.generation_pool:
+                    with STAGE_SECONDS.time('music_detect'):
+                        is_music_related = self.music_knowledge.is_music_related(message.content)
+
+                breaker = self.personality.breaker
+                if not self.generation_pool and breaker and breaker.is_open:
+                    # OpenAI keeps failing; answer from local music knowledge at once
+                    with STAGE_SECONDS.time('local'):
+                        response = await self.music_knowledge.local_reply(message.content)
+                    with STAGE_SECONDS.time('send'):
+                        await self.outbound.send(message.channel, response)
+                elif self.generation_pool:
+                    # Generation happens in a worker process; we only relay the reply
+                    response = await self._pooled_conversation(message, user_context, history, memories)
+                    if response is None:
+                        CONVERSATIONS.inc('cancelled')
+                        return
+                elif Config.STREAM_RESPONSES:
+                    enrichment = self.enrichment.start(message.content, is_music_related, deadline)
+                    # Post and edit the reply while tokens are still arriving
+                    response = await self._stream_conversation(message, user_context, is_music_related, history, memories, deadline, enrichment)
+                else:
+                    # Lookups run while the model answers and are merged once it's done
+                    enrichment = self.enrichment.start(message.content, is_music_related, deadline)
+                    # Generate response with personality
+                    with STAGE_SECONDS.time('llm'):
+                        response = await self.personality.generate_response(
+                            message.content,
+                            user_context,
+                            is_music_related,
+                            message.author.display_name,
+                            message.author.id,
+                            history,
+                            memories,
+                            message.guild is None,
+                            deadline
+                        )
+                    
+                    appendix = await enrichment.collect()
+                    if appendix:
+                        response += f"\n\n{appendix}"
+                            
+                    # Send response
+                    with STAGE_SECONDS.time('send'):
+                        await self.outbound.send(message.channel, response)
                 
                 # Update user context
-                self.last_interactions[user_id] = {
-                    'last_message': message.content,
-                    'last_response': response,
-                    'message_count': user_context.get('message_count', 0) + 1
-                }
-                
-                # Send response
-                await message.channel.send(response)
+                self.context_store.update(user_id, message.content, response)
+                self.history.append(user_id, message.channel.id, message.content, response)
+                if self.memory:
+                    self.memory.remember(user_id, message.guild.id if message.guild else DM_SCOPE, message.content)
+            CONVERSATIONS.inc('ok')
                 
         except Exception as e:
             logger.error(f"Error handling conversation: {e}")
-            await message.channel.send(
+            CONVERSATIONS.inc('error')
+            await self.outbound.send(
+                message.channel,
                 "Ugh, my brain's all scrambled right now... try again? 😵‍💫"
             )
+        finally:
+            if enrichment:
+                enrichment.cancel()
+            STAGE_SECONDS.observe(time.perf_counter() - started, 'total')
+            
+    async def close(self):
+        """Release the OpenAI connection pool and flush context before disconnecting."""
+        if self._warm_up_task:
+            self._warm_up_task.cancel()
+        await self.history.close()
+        if self.response_pools:
+            await self.response_pools.close()
+        if self.generation_pool:
+            await self.generation_pool.close()
+        await self.outbound.close()
+        await self.personality.close()
+        await self.context_store.close()
+        if self.memory:
+            self.memory.close()
+        await self.music_knowledge.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        if self.loop_watchdog:
+            await self.loop_watchdog.close()
+        await super().close()
+        
+    async def _stream_conversation(self, message, user_context, is_music_related, history=None, memories=None, deadline=None, enrichment=None):
+        """Stream the AI reply into Discord, adding enrichment as the last edit."""
+        reply = StreamingReply(message.channel, outbound=self.outbound)
+        started = time.perf_counter()
+        first = True
+        try:
+            # The llm stage includes the progressive edits made while streaming
+            async for delta in self.personality.stream_response(
+                message.content,
+                user_context,
+                is_music_related,
+                message.author.display_name,
+                message.author.id,
+                history,
+                memories,
+                message.guild is None,
+                deadline
+            ):
+                if first:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, 'first_token')
+                    first = False
+                await reply.feed(delta)
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            # Keep whatever already made it out; otherwise answer in character
+            if not reply.text.strip():
+                await reply.feed(self.personality.fallback_response(e))
+        STAGE_SECONDS.observe(time.perf_counter() - started, 'llm')
+                
+        appendix = await enrichment.collect() if enrichment else None
             
+        with STAGE_SECONDS.time('send'):
+            return await reply.finish(appendix)
+        
+    async def _pooled_conversation(self, message, user_context, history=None, memories=None):
+        """Relay a worker's reply into Discord; None if the message was deleted meanwhile."""
+        try:
+            job = self.generation_pool.submit_reply(message, user_context, history, memories)
+        except LLMBusyError as e:
+            response = self.personality.fallback_response(e)
+            with STAGE_SECONDS.time('send'):
+                await self.outbound.send(message.channel, response)
+            return response
+        reply = StreamingReply(message.channel, outbound=self.outbound)
+        music_info = None
+        first = True
+        try:
+            async for kind, payload in job.events():
+                if kind == DELTA:
+                    if first:
+                        STAGE_SECONDS.observe(time.perf_counter() - job.submitted, 'first_token')
+                        first = False
+                    await reply.feed(payload)
+                elif kind == DONE:
+                    music_info = payload
+        except JobCancelled:
+            # Take back anything already posted in answer to the deleted message
+            for posted in reply.messages:
+                try:
+                    await posted.delete()
+                except discord.HTTPException:
+                    pass
+            return None
+        except asyncio.TimeoutError as e:
+            logger.error(f"Generation job {job.job_id} missed its deadline")
+            if not reply.text.strip():
+                await reply.feed(self.personality.fallback_response(e))
+        STAGE_SECONDS.observe(time.perf_counter() - job.submitted, 'llm')
+        
+        with STAGE_SECONDS.time('send'):
+            return await reply.finish(music_info)
+        
     async def start_bot(self):
         """Start the bot with proper error handling."""
         try:
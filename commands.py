@@ -4,24 +4,33 @@ Discord bot commands for music and interaction.
 
 import discord
 from discord.ext import commands
+import os
 import random
 import logging
+import metrics
+from config import Config
 
 logger = logging.getLogger(__name__)
 
 async def setup_commands(bot):
     """Set up all bot commands."""
     
+    def pooled(kind: str, username: str = None):
+        """A pre-generated line if one is ready, else None for the static list."""
+        return bot.response_pools.take(kind, username) if bot.response_pools else None
+    
     @bot.command(name='recommend', aliases=['rec', 'music'])
-    async def recommend_music(ctx, genre: str = None):
-        """Recommend music based on genre."""
-        if genre:
-            genre = genre.lower().replace('-', '_').replace(' ', '_')
-            if genre in ['pop_punk', 'poppunk']:
-                genre = 'pop_punk'
-                
-        music_response = await bot.music_knowledge.get_music_response(
-            f"recommend {genre or 'music'}"
+    async def recommend_music(ctx, *, query: str = None):
+        """Recommend music similar to a band or genre; add --fresh to skip past picks."""
+        exclude_seen = False
+        if query and '--fresh' in query:
+            exclude_seen = True
+            query = query.replace('--fresh', '').strip() or None
+            
+        music_response = bot.music_knowledge.recommend(
+            query,
+            user_id=ctx.author.id,
+            exclude_seen=exclude_seen
         )
         
         if music_response:
@@ -42,8 +51,11 @@ async def setup_commands(bot):
             "Nostalgic emo kid energy... *adjusts striped arm warmers* 🖤"
         ]
         
-        personality_response = await bot.personality.get_flirty_response(ctx.author.display_name)
-        vibe_response = random.choice(vibes)
+        personality_response = (
+            pooled('greeting', ctx.author.display_name)
+            or await bot.personality.get_flirty_response(ctx.author.display_name)
+        )
+        vibe_response = pooled('vibe') or random.choice(vibes)
         
         await ctx.send(f"{personality_response}\n\nCurrent vibe: {vibe_response}")
         
@@ -61,7 +73,7 @@ async def setup_commands(bot):
                 "\"I'm drowning in the sea of my own tears\" - Dashboard Confessional 🖤",
                 "\"We are the kids from yesterday\" - My Chemical Romance 🥀"
             ]
-            await ctx.send(f"*whispers poetically*\n\n{random.choice(lyrics)}")
+            await ctx.send(f"*whispers poetically*\n\n{pooled('lyrics') or random.choice(lyrics)}")
         else:
             await ctx.send(f"*searches through lyric journals* Looking for something about '{query}'... Let me feel into that energy 🖤")
             
@@ -150,6 +162,46 @@ async def setup_commands(bot):
         
         await ctx.send(embed=embed)
         
+    @bot.command(name='stats')
+    @commands.is_owner()
+    async def show_stats(ctx):
+        """Latency and health figures for the bot owner."""
+        summary = metrics.summary()
+        lines = ["stage            p50       p95     count"]
+        for stage, figures in summary['stages'].items():
+            lines.append(f"{stage:<14}{figures['p50'] * 1000:>7.1f}ms{figures['p95'] * 1000:>8.1f}ms{figures['count']:>8}")
+        for tier, figures in summary['tiers'].items():
+            lines.append(f"{tier:<14}{figures['p50'] * 1000:>7.1f}ms{figures['p95'] * 1000:>8.1f}ms{figures['count']:>8}")
+        for stage, figures in summary['enrichment'].items():
+            # How long each lookup held back a reply that was otherwise ready
+            lines.append(f"{'+' + stage:<14}{figures['p50'] * 1000:>7.1f}ms{figures['p95'] * 1000:>8.1f}ms{figures['count']:>8}")
+        lines.append("")
+        for name, value in summary['counters'].items():
+            lines.append(f"{name.replace('emobot_', '')} {value:g}")
+        lines.append("")
+        for name, value in summary['gauges'].items():
+            lines.append(f"{name.replace('emobot_', '')} {value:g}")
+        await ctx.send("```\n" + "\n".join(lines)[:1900] + "\n```")
+        
+    @bot.command(name='profile')
+    @commands.is_owner()
+    async def run_profile(ctx, seconds: float = 10.0):
+        """Sample the running bot and send back a flamegraph-ready profile."""
+        if bot.profiler.running:
+            await ctx.send("*taps foot* I'm already watching myself think, wait for that one 🖤")
+            return
+            
+        seconds = max(1.0, min(seconds, Config.PROFILE_MAX_SECONDS))
+        await ctx.send(f"*closes eyes* Profiling for {seconds:.0f}s...")
+        path, stacks = await bot.profiler.profile(seconds)
+        
+        lines = [f"{samples:>6}  {frame}" for frame, samples in bot.profiler.top_functions(stacks)]
+        summary = "```\n" + "\n".join(lines)[:1800] + "\n```"
+        if os.path.getsize(path) < 8 * 1024 * 1024:
+            await ctx.send(f"Hottest frames (folded stacks attached, open with speedscope or flamegraph.pl):\n{summary}", file=discord.File(path))
+        else:
+            await ctx.send(f"Hottest frames, full profile at `{path}`:\n{summary}")
+            
     @bot.command(name='help')
     async def help_command(ctx):
         """Custom help command."""
@@ -157,7 +209,7 @@ async def setup_commands(bot):
 🖤 **RAVEN'S COMMANDS** 🖤
 
 **Music Commands:**
-`!recommend [genre]` - Get music recommendations
+`!recommend [genre or band] [--fresh]` - Get music recommendations (--fresh skips ones I've already given you)
 `!vibe` - Check my current mood
 `!lyrics [query]` - Get meaningful lyrics
 `!playlist [theme]` - Create themed playlists
@@ -178,6 +230,8 @@ async def setup_commands(bot):
     async def on_command_error(ctx, error):
         if isinstance(error, commands.CommandNotFound):
             await ctx.send("*raises eyebrow* That's not a command I know, babe. Try `!help` 🖤")
+        elif isinstance(error, commands.NotOwner):
+            await ctx.send("*smirks* Nice try, babe. That one's just for my keeper 🖤")
         elif isinstance(error, commands.MissingRequiredArgument):
             await ctx.send("*sighs dramatically* You need to give me more to work with. Check `!help` 💀")
         else:
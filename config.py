@@ -3,10 +3,9 @@ Configuration settings for the Discord bot.
 """
 
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Read from the environment at import; main.py loads .env first and validates
+# before starting the bot, so tools can import modules without credentials
 
 class Config:
     """Configuration class for bot settings."""
@@ -17,14 +16,156 @@ class Config:
     
     # OpenAI settings
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Point at a local stub for load testing
+    OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))  # Seconds per completion request
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))  # Shared HTTP pool size
+    OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
     
     # Bot settings
     MAX_MESSAGE_LENGTH = 2000
     TYPING_DELAY = 1.0  # Seconds to show typing indicator
     
+    # Streaming settings
+    STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+    STREAM_EDIT_INTERVAL = 1.0  # Minimum seconds between progressive edits
+    STREAM_EDIT_MIN_CHARS = 40  # Coalesce at least this many new characters per edit
+    STREAM_EDIT_MAX_INTERVAL = 5.0  # Backoff ceiling when Discord rate limits edits
+    
+    # Reply enrichment settings
+    ENRICHMENT_GRACE = float(os.getenv("ENRICHMENT_GRACE", "0.05"))  # Seconds a finished reply waits for optional lookups before dropping them
+    
+    # Outbound message settings
+    OUTBOUND_CHANNEL_BURST = 5  # Messages Discord lets a bot post to one channel per window
+    OUTBOUND_CHANNEL_WINDOW = 5.0  # Seconds
+    OUTBOUND_MAX_PENDING = 50  # Queued sends per channel before new ones are dropped
+    
+    # LLM admission control settings
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Completions in flight at once
+    LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "60"))  # Token bucket refill, sized to the API quota
+    LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "50"))  # Waiters beyond this are shed
+    LLM_MAX_QUEUED_PER_USER = 2
+    LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "15"))  # Seconds a message may wait for a slot
+    LLM_RATE_LIMIT_COOLDOWN = 10.0  # Seconds to pause admissions after a 429
+    
+    # Failure handling settings
+    REPLY_DEADLINE = float(os.getenv("REPLY_DEADLINE", "25"))  # Seconds a user will wait for a reply, queueing included
+    BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+    BREAKER_FAILURES = 5  # Rate limits, timeouts or outages within the window that open the breaker
+    BREAKER_WINDOW = 30.0
+    BREAKER_COOLDOWN = 30.0  # Seconds open before a probe call; doubles after each failed probe
+    BREAKER_MAX_COOLDOWN = 300.0
+    HEDGE_AFTER = float(os.getenv("HEDGE_AFTER", "0"))  # Seconds before a slow completion is raced by a second one; 0 disables
+    
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "21600"))  # Seconds before cached replies go stale
+    RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))  # Replies collected per prompt before serving from cache
+    RESPONSE_CACHE_MAX_KEY_CHARS = 80  # Longer messages are too specific to cache
+    RESPONSE_CACHE_REGULAR_AFTER = 10  # Messages before cached replies treat a user as a regular
+    
+    # Pre-generated command reply settings
+    RESPONSE_POOLS_ENABLED = os.getenv("RESPONSE_POOLS_ENABLED", "true").lower() == "true"
+    RESPONSE_POOL_SIZE = 20  # Lines kept per command
+    RESPONSE_POOL_LOW_WATER = 5  # Refill once a pool is down to this many
+    RESPONSE_POOL_CALLS_PER_HOUR = float(os.getenv("RESPONSE_POOL_CALLS_PER_HOUR", "12"))  # Budget for refill completions
+    RESPONSE_POOL_CHECK_INTERVAL = 60.0  # Seconds between idle checks for low pools
+    
+    # Message gate settings
+    GATE_ENABLED = os.getenv("GATE_ENABLED", "true").lower() == "true"
+    GATE_LLM_THRESHOLD = float(os.getenv("GATE_LLM_THRESHOLD", "3.0"))  # Guild messages scoring this much get the AI
+    GATE_LOCAL_THRESHOLD = float(os.getenv("GATE_LOCAL_THRESHOLD", "1.0"))  # ...this much get a local band/genre blurb
+    GATE_LOCAL_COOLDOWN = 60.0  # Seconds between local blurbs in one channel
+    BOT_NAME = "raven"  # Saying the bot's name counts as addressing it
+    
+    # Metrics settings
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)  # Prometheus text endpoint; 0 disables it
+    
+    # Diagnostics settings
+    LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+    LOOP_WATCHDOG_INTERVAL = 0.1  # Seconds between event-loop heartbeats
+    LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))  # Log the running stack past this much lag
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Where !profile writes folded stacks
+    PROFILE_SAMPLE_INTERVAL = 0.01
+    PROFILE_MAX_SECONDS = 60
+    
     # Personality settings
     PERSONALITY_TEMPERATURE = 0.8
-    MAX_CONTEXT_MESSAGES = 10
+    MAX_CONTEXT_MESSAGES = 10  # Most recent turns kept verbatim in the prompt
+    
+    # Model routing settings
+    # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+    # do not change this unless explicitly requested by the user
+    MODEL_STANDARD = os.getenv("MODEL_STANDARD", "gpt-4o")
+    MODEL_FAST = os.getenv("MODEL_FAST", "gpt-4o-mini")  # Small talk, and everything while degraded
+    FAST_TEMPERATURE = 0.9  # Banter can be looser than considered replies
+    ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "true").lower() == "true"
+    ROUTE_SHORT_CHARS = 60  # Shorter messages without a question or music talk go to the fast model
+    ROUTE_SHORT_MAX_TOKENS = 100
+    ROUTE_GUILD_MAX_TOKENS = 200  # Channel replies stay brief; DMs get the full cap
+    ROUTE_MAX_TOKENS = 300
+    ROUTE_LATENCY_SLO = float(os.getenv("ROUTE_LATENCY_SLO", "8"))  # p95 seconds to a streamed reply's first text on the standard model before degrading
+    ROUTE_COMPLETE_SLO = float(os.getenv("ROUTE_COMPLETE_SLO", "15"))  # ...and to a whole non-streamed reply
+    ROUTE_DEGRADE_QUEUE_DEPTH = int(os.getenv("ROUTE_DEGRADE_QUEUE_DEPTH", "10"))  # Queued completions before degrading
+    ROUTE_DEGRADE_HOLD = 60.0  # Seconds to stay on the fast model once degraded
+    ROUTE_LATENCY_SAMPLES = 100  # Recent completions per tier and measure the p95 is taken over
+    ROUTE_MIN_SAMPLES = 10
+    
+    # Conversation history settings
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))  # Recent turns plus summary per prompt
+    HISTORY_TTL = float(os.getenv("HISTORY_TTL", "3600"))  # Seconds of silence before a conversation starts fresh
+    HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", "5000"))
+    HISTORY_SUMMARIZE_AFTER_TOKENS = 300  # Aged-out tokens that trigger a background summary
+    HISTORY_MAX_PENDING_TOKENS = 2000  # Aged-out turns beyond this are dropped unsummarized
+    HISTORY_SUMMARY_TOKENS = 150  # Length cap for the running summary
+    HISTORY_TRIM_RATIO = 0.6  # Trim to this share of the limits so prompt prefixes stay stable
+    
+    # Music catalog settings
+    MUSIC_CATALOG_PATH = os.getenv("MUSIC_CATALOG_PATH")  # Optional catalog built with music_catalog.py
+    MUSIC_CATALOG_RELOAD_INTERVAL = 30.0  # Seconds between checks for a changed catalog file
+    RECOMMEND_POOL_FACTOR = 3  # Sample recommendations from this many times the requested neighbours
+    RECOMMEND_SCORE_MARGIN = 0.25  # Only sample neighbours this close to the best match
+    RECOMMEND_CACHE_QUERIES = 4096  # Band/genre neighbourhoods kept in memory
+    RECOMMEND_HISTORY_USERS = 10000  # Users whose past recommendations are remembered
+    
+    # User context store settings
+    CONTEXT_MAX_USERS = int(os.getenv("CONTEXT_MAX_USERS", "10000"))
+    CONTEXT_TTL = float(os.getenv("CONTEXT_TTL", "86400"))  # Seconds of inactivity before a user is forgotten
+    CONTEXT_MAX_BYTES = int(os.getenv("CONTEXT_MAX_BYTES", str(16 * 1024 * 1024)))
+    CONTEXT_MAX_TEXT_CHARS = 500  # Stored prefix of each message/response
+    CONTEXT_RECORD_OVERHEAD = 128  # Approximate bytes per record besides the strings
+    CONTEXT_DB_PATH = os.getenv("CONTEXT_DB_PATH")  # Optional SQLite file for persistent context
+    CONTEXT_FLUSH_INTERVAL = float(os.getenv("CONTEXT_FLUSH_INTERVAL", "5"))  # Seconds between write-behind flushes
+    CONTEXT_FLUSH_BATCH = 100  # Flush early once this many users are dirty
+    CONTEXT_SHARED_REFRESH = float(os.getenv("CONTEXT_SHARED_REFRESH", "0"))  # Seconds between re-reads when shards share the DB
+    
+    # Long-term memory settings
+    MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+    MEMORY_PATH = os.getenv("MEMORY_PATH")  # Optional .npy file, memory-mapped so snippets survive restarts
+    MEMORY_MAX_ROWS = int(os.getenv("MEMORY_MAX_ROWS", "50000"))  # Snippets across all users; the oldest are evicted
+    MEMORY_MAX_PER_USER = 200
+    MEMORY_DIMS = 256  # Hashed n-gram vector size
+    MEMORY_SNIPPET_BYTES = 240
+    MEMORY_MIN_CHARS = 15  # Shorter messages aren't worth remembering
+    MEMORY_TOP_K = 3  # Snippets added to a prompt
+    MEMORY_MIN_SCORE = 0.2  # Cosine similarity a snippet needs to be included
+    MEMORY_FLUSH_EVERY = 50  # Appends between flushes of the memory file
+    
+    # Sharding settings
+    SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "1"))  # Worker processes; 1 runs the bot in this process
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # Total shards; 0 asks Discord for its recommendation
+    SHARD_HEALTH_INTERVAL = 10.0  # Seconds between worker health reports
+    SHARD_READY_TIMEOUT = 15.0  # Seconds per shard to wait for a worker before starting the next
+    SHARD_RESTART_MAX_BACKOFF = 60.0
+    SHARD_STABLE_AFTER = 300.0  # Seconds a restarted worker must stay up before its backoff resets
+    
+    # Generation pool settings
+    GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "0"))  # Processes that generate replies; 0 generates in the gateway
+    GENERATION_JOB_TIMEOUT = float(os.getenv("GENERATION_JOB_TIMEOUT", "45"))  # Seconds a summary or pool refill job may take; replies use REPLY_DEADLINE
     
     @classmethod
     def validate_config(cls):
@@ -43,6 +184,3 @@ class Config:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
             
         return True
-
-# Validate configuration on import
-Config.validate_config()
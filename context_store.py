@@ -0,0 +1,122 @@
+"""
+Bounded per-user conversation context with LRU and TTL eviction.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+
+class UserContext:
+    """Compact record of what the bot remembers about one user."""
+
+    __slots__ = ('last_message', 'last_response', 'message_count', 'last_seen', 'size')
+
+    def __init__(self, last_message: str = "", last_response: str = "", message_count: int = 0, last_seen: float = 0.0):
+        self.last_message = last_message
+        self.last_response = last_response
+        self.message_count = message_count
+        self.last_seen = last_seen
+        self.size = sys.getsizeof(last_message) + sys.getsizeof(last_response) + Config.CONTEXT_RECORD_OVERHEAD
+
+
+class ContextStore:
+    """LRU + TTL store of UserContext records with a memory cap."""
+
+    def __init__(self, max_users: Optional[int] = None, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.max_users = max_users if max_users is not None else Config.CONTEXT_MAX_USERS
+        self.ttl = ttl if ttl is not None else Config.CONTEXT_TTL
+        self.max_bytes = max_bytes if max_bytes is not None else Config.CONTEXT_MAX_BYTES
+        self._records: "OrderedDict[int, UserContext]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._records
+
+    def get(self, user_id: int) -> Optional[UserContext]:
+        """Look up a user's context, refreshing its recency."""
+        record = self._records.get(user_id)
+        now = time.time()
+        if record is None:
+            self.misses += 1
+            return None
+        if now - record.last_seen > self.ttl:
+            self._remove(user_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        record.last_seen = now
+        self._records.move_to_end(user_id)
+        return record
+
+    async def load(self, user_id: int) -> Optional[UserContext]:
+        """Async lookup used by the bot; persistent stores may hit disk here."""
+        return self.get(user_id)
+
+    async def start(self):
+        """Start any background work the store needs."""
+
+    async def close(self):
+        """Release store resources."""
+
+    def update(self, user_id: int, message: str, response: str) -> UserContext:
+        """Record the latest exchange with a user."""
+        previous = self._records.get(user_id)
+        message_count = previous.message_count + 1 if previous else 1
+        if previous:
+            self._remove(user_id)
+
+        limit = Config.CONTEXT_MAX_TEXT_CHARS
+        record = UserContext(message[:limit], response[:limit], message_count, time.time())
+        self.put(user_id, record)
+        return record
+
+    def put(self, user_id: int, record: UserContext):
+        """Insert a prebuilt record and enforce the size limits."""
+        if user_id in self._records:
+            self._remove(user_id)
+        self._records[user_id] = record
+        self.bytes_used += record.size
+        self._evict(record.last_seen)
+
+    def stats(self) -> Dict:
+        """Counters for monitoring the store."""
+        lookups = self.hits + self.misses
+        return {
+            'users': len(self._records),
+            'bytes': self.bytes_used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+    def _remove(self, user_id: int):
+        record = self._records.pop(user_id)
+        self.bytes_used -= record.size
+
+    def _evict(self, now: float):
+        """Drop expired records, then least recently used ones until under the caps."""
+        # Records are ordered by last access, so expired ones sit at the front
+        while self._records:
+            user_id, record = next(iter(self._records.items()))
+            if now - record.last_seen <= self.ttl:
+                break
+            self._remove(user_id)
+            self.expirations += 1
+
+        while self._records and (len(self._records) > self.max_users or self.bytes_used > self.max_bytes):
+            user_id = next(iter(self._records))
+            self._remove(user_id)
+            self.evictions += 1
@@ -0,0 +1,215 @@
+"""
+Rolling multi-turn history per user and channel.
+Keeps the most recent turns inside a token budget; turns that age out are
+folded into a running summary in the background so long chats stay coherent
+without the prompt growing.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators the chat format adds per message
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def load_encoding():
+    """Load gpt-4o's tokenizer once, e.g. in a warm-up thread; a cold cache downloads it."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if _encoding_loaded:
+            return _encoding
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:  # Not installed, or the encoding can't be fetched offline
+            logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+        _encoding_loaded = True
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Exact count with tiktoken, otherwise ~4 UTF-8 bytes per token (emoji cost more)."""
+    encoding = _encoding if _encoding_loaded else load_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS
+    return (len(text.encode("utf-8")) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class Turn:
+    """One message in a conversation, with its token count worked out once."""
+
+    __slots__ = ('role', 'text', 'tokens', 'message')
+
+    def __init__(self, role: str, text: str):
+        self.role = role
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.message = {"role": role, "content": text}  # Reused as-is in every prompt
+
+
+class HistoryWindow:
+    """What goes into the next prompt: the running summary and recent turns."""
+
+    __slots__ = ('key', 'summary', 'summary_tokens', 'turns', 'tokens')
+
+    def __init__(self, key: Tuple[int, int], summary: str, summary_tokens: int, turns: List[Turn], tokens: int):
+        self.key = key
+        self.summary = summary
+        self.summary_tokens = summary_tokens
+        self.turns = turns
+        self.tokens = tokens
+
+
+class Conversation:
+    __slots__ = ('turns', 'tokens', 'summary', 'summary_tokens', 'pending', 'summarizing', 'last_seen')
+
+    def __init__(self):
+        self.turns: Deque[Turn] = deque()
+        self.tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.pending: List[Turn] = []  # Aged-out turns not yet in the summary
+        self.summarizing = False
+        self.last_seen = time.time()
+
+
+Summarizer = Callable[[str, List[Turn]], Awaitable[str]]
+
+class ConversationHistory:
+    """LRU + TTL map of (user, channel) conversations with token-budgeted windows."""
+
+    def __init__(
+        self,
+        summarizer: Optional[Summarizer] = None,
+        token_budget: Optional[int] = None,
+        max_turns: Optional[int] = None,
+        max_conversations: Optional[int] = None,
+        ttl: Optional[float] = None
+    ):
+        self.summarizer = summarizer
+        self.token_budget = token_budget or Config.HISTORY_TOKEN_BUDGET
+        self.max_turns = max_turns or Config.MAX_CONTEXT_MESSAGES
+        self.max_conversations = max_conversations or Config.HISTORY_MAX_CONVERSATIONS
+        self.ttl = ttl or Config.HISTORY_TTL
+        self._conversations: "OrderedDict[Tuple[int, int], Conversation]" = OrderedDict()
+        self._tasks = set()
+        self.summaries = 0
+        self.summary_failures = 0
+        self.dropped_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def window(self, user_id: int, channel_id: int) -> Optional[HistoryWindow]:
+        """Summary and recent turns for the next prompt, or None for a fresh conversation."""
+        key = (user_id, channel_id)
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return None
+        if time.time() - conversation.last_seen > self.ttl:
+            del self._conversations[key]
+            return None
+        if not conversation.turns and not conversation.summary:
+            return None
+        return HistoryWindow(
+            key,
+            conversation.summary,
+            conversation.summary_tokens,
+            list(conversation.turns),
+            conversation.tokens + conversation.summary_tokens
+        )
+
+    def append(self, user_id: int, channel_id: int, message: str, response: str):
+        """Record an exchange and push older turns out of the window."""
+        key = (user_id, channel_id)
+        conversation = self._conversations.get(key)
+        now = time.time()
+        if conversation is None or now - conversation.last_seen > self.ttl:
+            conversation = self._conversations[key] = Conversation()
+        self._conversations.move_to_end(key)
+        conversation.last_seen = now
+
+        limit = Config.CONTEXT_MAX_TEXT_CHARS
+        for turn in (Turn("user", message[:limit]), Turn("assistant", response[:limit])):
+            conversation.turns.append(turn)
+            conversation.tokens += turn.tokens
+
+        if len(conversation.turns) > self.max_turns or conversation.tokens + conversation.summary_tokens > self.token_budget:
+            # Trim well below the limits so the next few prompts share this prefix
+            max_turns = int(self.max_turns * Config.HISTORY_TRIM_RATIO)
+            budget = self.token_budget * Config.HISTORY_TRIM_RATIO
+            while conversation.turns and (
+                len(conversation.turns) > max_turns
+                or conversation.tokens + conversation.summary_tokens > budget
+                or conversation.turns[0].role != "user"
+            ):
+                turn = conversation.turns.popleft()
+                conversation.tokens -= turn.tokens
+                conversation.pending.append(turn)
+
+        self._maybe_summarize(conversation)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    async def close(self):
+        """Cancel summaries still in flight."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            'conversations': len(self._conversations),
+            'summaries': self.summaries,
+            'summary_failures': self.summary_failures,
+            'dropped_turns': self.dropped_turns,
+            'summarizing': len(self._tasks)
+        }
+
+    def _maybe_summarize(self, conversation: Conversation):
+        pending_tokens = sum(turn.tokens for turn in conversation.pending)
+        if pending_tokens > Config.HISTORY_MAX_PENDING_TOKENS and not conversation.summarizing:
+            # Summaries keep failing or are disabled; forget the oldest turns outright
+            while conversation.pending and pending_tokens > Config.HISTORY_MAX_PENDING_TOKENS:
+                pending_tokens -= conversation.pending.pop(0).tokens
+                self.dropped_turns += 1
+        if (
+            self.summarizer is None
+            or conversation.summarizing
+            or pending_tokens < Config.HISTORY_SUMMARIZE_AFTER_TOKENS
+        ):
+            return
+        conversation.summarizing = True
+        task = asyncio.create_task(self._summarize(conversation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, conversation: Conversation):
+        batch = list(conversation.pending)
+        try:
+            summary = await self.summarizer(conversation.summary, batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Turns stay pending and are retried after the next exchange
+            self.summary_failures += 1
+            logger.debug(f"Conversation summary deferred: {e}")
+            return
+        finally:
+            conversation.summarizing = False
+
+        # Turns that aged out while we waited stay pending for the next round
+        del conversation.pending[:len(batch)]
+        conversation.summary = summary.strip()
+        conversation.summary_tokens = count_tokens(conversation.summary) if conversation.summary else 0
+        self.summaries += 1
@@ -0,0 +1,215 @@
+"""
+Runtime diagnostics for the bot.
+A watchdog thread that catches event-loop stalls and logs what was running,
+a sampling profiler that writes folded stacks for flamegraph tools, and
+per-phase timing of startup.
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from config import Config
+from metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+class LoopWatchdog:
+    """Heartbeat task in the loop, checked from a thread that can see it stall."""
+
+    def __init__(self, threshold: Optional[float] = None, interval: Optional[float] = None):
+        self.threshold = threshold or Config.LOOP_STALL_THRESHOLD
+        self.interval = interval or Config.LOOP_WATCHDOG_INTERVAL
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.last_stack: Optional[str] = None
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._thread:
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        return {'stalls': self.stalls, 'max_lag': self.max_lag, 'threshold': self.threshold}
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self._beat = now
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                logger.warning(f"Event loop was blocked for {lag:.2f}s")
+
+    def _watch(self):
+        reported = False
+        while not self._stop.wait(self.interval):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Report each stall once, with the stack that is hogging the loop
+            reported = True
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            self.last_stack = "".join(traceback.format_stack(frame, limit=25)) if frame else "<no frame>"
+            logger.warning(f"Event loop stalled for over {overdue:.2f}s, currently running:\n{self.last_stack}")
+
+
+class SamplingProfiler:
+    """Samples every thread's stack for a while and folds them for flamegraphs."""
+
+    def __init__(self, interval: Optional[float] = None, output_dir: Optional[str] = None):
+        self.interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+        self.output_dir = output_dir or Config.PROFILE_DIR
+        self.running = False
+
+    async def profile(self, seconds: float) -> Tuple[str, Counter]:
+        """Profile the running process and write a .folded file; returns its path and the stacks."""
+        if self.running:
+            raise RuntimeError("a profile is already running")
+        self.running = True
+        duration = min(seconds, Config.PROFILE_MAX_SECONDS)
+        try:
+            if threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer"):
+                stacks = await self._sample_loop_with_timer(duration)
+            else:
+                stacks = await asyncio.to_thread(self.sample, duration)
+            path = await asyncio.to_thread(self.write, stacks)
+        finally:
+            self.running = False
+        return path, stacks
+
+    async def _sample_loop_with_timer(self, duration: float) -> Counter:
+        """
+        Sample the loop thread from a SIGALRM handler and the other threads from a
+        sampler thread. A sampler thread alone only wins the GIL when the loop
+        releases it in select(), so a busy loop would look idle.
+        """
+        stacks = Counter()
+        name = threading.current_thread().name
+
+        def on_alarm(signum, frame):
+            stacks[self._fold(name, frame)] += 1
+
+        previous = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        try:
+            others = await asyncio.to_thread(self.sample, duration, threading.get_ident())
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        stacks.update(others)
+        return stacks
+
+    def sample(self, duration: float, skip: Optional[int] = None) -> Counter:
+        """Blocking sampler loop; run it off the event loop."""
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me and ident != skip:
+                    stacks[self._fold(names.get(ident, str(ident)), frame)] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    def write(self, stacks: Counter) -> str:
+        """One 'frame;frame;frame count' line per stack, as flamegraph.pl and speedscope expect."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    @staticmethod
+    def top_functions(stacks: Counter, count: int = 5) -> List[Tuple[str, int]]:
+        """Leaf frames with the most samples, i.e. where time is actually spent."""
+        leaves = Counter()
+        for stack, samples in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += samples
+        return leaves.most_common(count)
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            # Function start line so samples from one function merge
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.append(thread_name.replace(" ", "_"))
+        return ";".join(reversed(frames))
+
+
+class StartupTimer:
+    """Wall time of each startup phase, from process start until the gateway is ready."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.reported = False
+        self._last = self.started
+        self._background: Set[str] = set()
+
+    def mark(self, phase: str):
+        """End phase, which ran since the previous mark."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    @contextmanager
+    def background(self, phase: str):
+        """Time work that overlaps the other phases, like warming up during the handshake."""
+        self._background.add(phase)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] = time.perf_counter() - started
+            if self.reported:
+                logger.info(f"Startup {phase} finished after {self.phases[phase]:.2f}s")
+
+    def report(self):
+        """Log the phases once; reconnects fire on_ready again."""
+        if self.reported:
+            return
+        self.reported = True
+        phases = ", ".join(
+            f"{phase} {seconds:.2f}s{' (background)' if phase in self._background else ''}"
+            for phase, seconds in self.phases.items()
+        )
+        logger.info(f"Ready {self._last - self.started:.2f}s after start: {phases}")
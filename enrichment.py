@@ -0,0 +1,124 @@
+"""
+Reply enrichment that runs alongside the completion.
+Stages (the music lookup today, any local tool later) start as soon as a
+message is accepted and run while the model is answering; once the reply is
+ready their results are appended in stage order. Optional stages still running
+then get a short grace period and are dropped after it, so a slow lookup never
+holds the reply back.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from config import Config
+from metrics import STAGE_SECONDS, ENRICHMENT_STAGES, ENRICHMENT_DELAY
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """One lookup: an async function of the message text returning text to append, or None."""
+
+    __slots__ = ('name', 'run', 'music_only', 'optional')
+
+    def __init__(self, name: str, run: Callable[[str], Awaitable[Optional[str]]], music_only: bool, optional: bool):
+        self.name = name
+        self.run = run
+        self.music_only = music_only
+        self.optional = optional
+
+
+class EnrichmentPipeline:
+    """Registered stages, started together for each reply."""
+
+    def __init__(self, grace: Optional[float] = None):
+        self.grace = grace if grace is not None else Config.ENRICHMENT_GRACE
+        self.stages: List[Stage] = []
+
+    def add(
+        self,
+        name: str,
+        run: Callable[[str], Awaitable[Optional[str]]],
+        music_only: bool = False,
+        optional: bool = True
+    ):
+        """Register a stage; results are merged in the order stages were added."""
+        self.stages.append(Stage(name, run, music_only, optional))
+
+    def start(self, message: str, is_music_related: bool, deadline: Optional[float] = None) -> "Enrichment":
+        """Start every stage that applies to message; deadline is a time.monotonic() value."""
+        tasks = [
+            (stage, asyncio.create_task(self._run(stage, message)))
+            for stage in self.stages
+            if is_music_related or not stage.music_only
+        ]
+        return Enrichment(tasks, self.grace, deadline)
+
+    @staticmethod
+    async def _run(stage: Stage, message: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return await stage.run(message)
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage.name)
+
+
+class Enrichment:
+    """The stages running for one reply."""
+
+    def __init__(self, tasks: List[Tuple[Stage, asyncio.Task]], grace: float, deadline: Optional[float]):
+        self.grace = grace
+        self.deadline = deadline
+        self._tasks = tasks
+        self._finished: Dict[str, float] = {}
+        for stage, task in tasks:
+            task.add_done_callback(lambda _, name=stage.name: self._finished.setdefault(name, time.monotonic()))
+
+    async def collect(self) -> Optional[str]:
+        """Call once the reply is ready: wait as long as each stage may, then merge what finished."""
+        ready = time.monotonic()
+        # Required stages may use whatever is left of the deadline, optional ones only the grace period
+        required = [task for stage, task in self._tasks if not stage.optional and not task.done()]
+        if required:
+            await asyncio.wait(required, timeout=self._left())
+        optional = [task for stage, task in self._tasks if stage.optional and not task.done()]
+        if optional:
+            left = self._left()
+            await asyncio.wait(optional, timeout=self.grace if left is None else min(self.grace, left))
+
+        collected = time.monotonic()
+        parts = []
+        for stage, task in self._tasks:
+            ENRICHMENT_DELAY.observe(max(0.0, self._finished.get(stage.name, collected) - ready), stage.name)
+            if not task.done() or task.cancelled():
+                task.cancel()
+                ENRICHMENT_STAGES.inc(stage.name, 'dropped')
+                logger.debug(f"Dropped enrichment stage {stage.name} after {collected - ready:.3f}s")
+            elif task.exception() is not None:
+                ENRICHMENT_STAGES.inc(stage.name, 'error')
+                logger.error(f"Enrichment stage {stage.name} failed: {task.exception()}")
+            elif task.result():
+                ENRICHMENT_STAGES.inc(stage.name, 'ok')
+                parts.append(task.result())
+            else:
+                ENRICHMENT_STAGES.inc(stage.name, 'empty')
+        self._tasks = []
+        return "\n\n".join(parts) or None
+
+    def cancel(self):
+        """Stop stages nobody will collect, e.g. when the reply failed."""
+        for _, task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _left(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+def default_pipeline(music_knowledge) -> EnrichmentPipeline:
+    """The stages every process that generates replies runs."""
+    pipeline = EnrichmentPipeline()
+    pipeline.add('music', music_knowledge.get_music_response, music_only=True)
+    return pipeline
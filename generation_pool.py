@@ -0,0 +1,445 @@
+"""
+Out-of-process reply generation.
+In pool mode the gateway process only receives and sends Discord messages:
+prompt building, the OpenAI call and music matching run in worker processes
+that pull jobs from a shared local queue. Each job carries a deadline and can
+be cancelled when the user deletes their message; results come back on one
+result queue and are routed to the waiting conversation by job and channel.
+"""
+
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import Config
+from context_store import UserContext
+from conversation_history import HistoryWindow, Turn
+from llm_scheduler import LLMBusyError, budget_share
+from resilience import CLOSED, OPEN, STATE_CODES
+
+logger = logging.getLogger(__name__)
+
+# Events a worker sends back for a job
+DELTA = 'delta'  # Reply text, streamed or whole
+DONE = 'done'  # Finished; payload is the enrichment appendix or None
+EXPIRED = 'expired'  # Deadline passed before or during generation
+CANCELLED = 'cancelled'  # The user deleted the message
+ERROR = 'error'  # A job with no in-character fallback failed; payload is the reason
+
+DEADLINE_GRACE = 1.0  # Seconds allowed for a worker's last event to cross the queue
+MAX_REMEMBERED_CANCELS = 1000
+
+class JobCancelled(Exception):
+    """The message a job was answering has been deleted."""
+
+
+def snapshot_context(user_context: Optional[UserContext]) -> Optional[Tuple]:
+    if user_context is None:
+        return None
+    return (user_context.last_message, user_context.last_response, user_context.message_count, user_context.last_seen)
+
+
+def snapshot_history(history: Optional[HistoryWindow]) -> Optional[Tuple]:
+    if history is None:
+        return None
+    return (history.key, history.summary, history.summary_tokens, [(turn.role, turn.text) for turn in history.turns])
+
+
+def restore_history(snapshot: Optional[Tuple]) -> Optional[HistoryWindow]:
+    if snapshot is None:
+        return None
+    key, summary, summary_tokens, turns = snapshot
+    turns = [Turn(role, text) for role, text in turns]
+    return HistoryWindow(tuple(key), summary, summary_tokens, turns, summary_tokens + sum(turn.tokens for turn in turns))
+
+
+class PendingJob:
+    """Gateway-side handle for one submitted job."""
+
+    def __init__(self, job_id: int, message_id: Optional[int], channel_id: Optional[int], deadline: float):
+        self.job_id = job_id
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.deadline = deadline
+        self.submitted = time.perf_counter()
+        self._events: asyncio.Queue = asyncio.Queue()
+
+    def put(self, kind: str, payload):
+        self._events.put_nowait((kind, payload))
+
+    async def events(self) -> AsyncIterator[Tuple[str, object]]:
+        """Yield (kind, payload) until DONE; raises on expiry or cancellation."""
+        while True:
+            remaining = self.deadline + DEADLINE_GRACE - time.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            kind, payload = await asyncio.wait_for(self._events.get(), remaining)
+            if kind == CANCELLED:
+                raise JobCancelled()
+            if kind == EXPIRED:
+                raise asyncio.TimeoutError()
+            if kind == ERROR:
+                raise RuntimeError(payload)
+            yield kind, payload
+            if kind == DONE:
+                return
+
+    async def result(self):
+        """Joined text for jobs that don't stream."""
+        parts = []
+        async for kind, payload in self.events():
+            if kind == DELTA:
+                parts.append(payload)
+        return "".join(parts)
+
+
+class GenerationPool:
+    """Gateway side of the pool: submits jobs, routes results and keeps workers alive."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.size = workers or Config.GENERATION_WORKERS
+        # Same ceiling the in-process scheduler enforces: running plus queued replies
+        self.capacity = Config.LLM_MAX_CONCURRENCY + Config.LLM_MAX_QUEUE
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = self._context.Queue()
+        self._results = self._context.Queue()
+        self._controls = []
+        # Each worker's circuit breaker state, written by the worker
+        self._breakers = self._context.Array('b', self.size, lock=False)
+        self._processes: List[Optional[multiprocessing.Process]] = []
+        self._pending: Dict[int, PendingJob] = {}
+        self._by_message: Dict[int, PendingJob] = {}
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.shed = 0
+        self.restarts = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        overrides = budget_share(self.size)
+        for index in range(self.size):
+            self._controls.append(self._context.Queue())
+            self._processes.append(None)
+            self._spawn(index, overrides)
+        # Blocking reads stay on a thread; only routing touches the loop
+        self._reader = threading.Thread(target=self._read_results, name="generation-results", daemon=True)
+        self._reader.start()
+        self._supervisor = asyncio.create_task(self._supervise(overrides))
+        logger.info(f"Generation pool started with {self.size} workers")
+
+    async def close(self):
+        if self._supervisor:
+            self._supervisor.cancel()
+            self._supervisor = None
+        for control in self._controls:
+            control.put(None)
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            if process:
+                await asyncio.to_thread(process.join, 5)
+                if process.is_alive():
+                    process.terminate()
+        self._results.put(None)
+        if self._reader:
+            await asyncio.to_thread(self._reader.join, 1.0)
+            self._reader = None
+        for job in list(self._pending.values()):
+            job.put(CANCELLED, None)
+        self._pending.clear()
+        self._by_message.clear()
+
+    def submit_reply(
+        self,
+        message,
+        user_context: Optional[UserContext],
+        history: Optional[HistoryWindow],
+        memories: Optional[List[str]] = None
+    ) -> PendingJob:
+        """Queue a conversation reply; events stream back if STREAM_RESPONSES is on."""
+        if len(self._pending) >= self.capacity:
+            self.shed += 1
+            raise LLMBusyError(f"{len(self._pending)} generation jobs already in flight")
+        return self._submit('reply', {
+            'content': message.content,
+            'username': message.author.display_name,
+            'user_id': message.author.id,
+            'user_context': snapshot_context(user_context),
+            'history': snapshot_history(history),
+            'memories': memories,
+            'is_dm': message.guild is None,
+            'stream': Config.STREAM_RESPONSES
+        }, message.id, message.channel.id, Config.REPLY_DEADLINE)
+
+    async def summarize(self, summary: str, turns: List[Turn]) -> str:
+        """History summarizer that runs in a worker."""
+        job = self._submit('summary', {'summary': summary, 'turns': [(turn.role, turn.text) for turn in turns]})
+        return await job.result()
+
+    async def write_variations(self, instructions: str, count: int) -> List[str]:
+        """Response pool writer that runs in a worker."""
+        job = self._submit('variations', {'instructions': instructions, 'count': count})
+        return (await job.result()).splitlines()
+
+    def cancel_message(self, message_id: int) -> bool:
+        """Drop the job answering a deleted message, wherever it is."""
+        job = self._by_message.pop(message_id, None)
+        if job is None:
+            return False
+        self._pending.pop(job.job_id, None)
+        self.cancelled += 1
+        job.put(CANCELLED, None)
+        # Whichever worker holds it (or pulls it later) stops working on it
+        for control in self._controls:
+            control.put(job.job_id)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.size,
+            'alive': sum(1 for process in self._processes if process and process.is_alive()),
+            'in_flight': len(self._pending),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'expired': self.expired,
+            'shed': self.shed,
+            'restarts': self.restarts,
+            'breakers_open': sum(1 for state in self._breakers if state == STATE_CODES[OPEN])
+        }
+
+    def _submit(
+        self,
+        kind: str,
+        payload: Dict,
+        message_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> PendingJob:
+        deadline = time.time() + (timeout or Config.GENERATION_JOB_TIMEOUT)
+        job = PendingJob(next(self._ids), message_id, channel_id, deadline)
+        self._pending[job.job_id] = job
+        if message_id is not None:
+            self._by_message[message_id] = job
+        self.submitted += 1
+        self._jobs.put({
+            'id': job.job_id,
+            'kind': kind,
+            'channel_id': channel_id,
+            'deadline': job.deadline,
+            **payload
+        })
+        return job
+
+    def _read_results(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._route, item)
+
+    def _route(self, item: Tuple[int, Optional[int], str, object]):
+        job_id, channel_id, kind, payload = item
+        job = self._pending.get(job_id)
+        if job is None or job.channel_id != channel_id:
+            return  # Cancelled, timed out or already finished
+        job.put(kind, payload)
+        if kind in (DONE, EXPIRED, CANCELLED, ERROR):
+            self._pending.pop(job_id, None)
+            if job.message_id is not None:
+                self._by_message.pop(job.message_id, None)
+            if kind == DONE:
+                self.completed += 1
+            elif kind == EXPIRED:
+                self.expired += 1
+
+    def _forget_stale(self):
+        """Drop jobs whose worker died with them; their callers have timed out."""
+        cutoff = time.time() - DEADLINE_GRACE * 2
+        for job_id, job in list(self._pending.items()):
+            if job.deadline < cutoff:
+                self._route((job_id, job.channel_id, EXPIRED, None))
+
+    def _spawn(self, index: int, overrides: Dict):
+        self._breakers[index] = STATE_CODES[CLOSED]
+        process = self._context.Process(
+            target=run_generation_worker,
+            args=(index, overrides, self._jobs, self._controls[index], self._results, self._breakers),
+            name=f"emobot-generation-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _supervise(self, overrides: Dict):
+        while True:
+            await asyncio.sleep(1.0)
+            self._forget_stale()
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logger.error(f"Generation worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._spawn(index, overrides)
+
+
+def run_generation_worker(index: int, overrides: Dict, jobs, control, results, breakers):
+    """Process entry point for one generation worker."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - generation{index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    try:
+        asyncio.run(GenerationWorker(jobs, control, results, index, breakers).run())
+    except KeyboardInterrupt:
+        pass
+
+
+class GenerationWorker:
+    """Runs PersonalityEngine and MusicKnowledge for jobs pulled off the shared queue."""
+
+    def __init__(self, jobs, control, results, index: int = 0, breakers=None):
+        from personality import PersonalityEngine
+        from music_knowledge import MusicKnowledge
+        from enrichment import default_pipeline
+
+        self.jobs = jobs
+        self.control = control
+        self.results = results
+        self.personality = PersonalityEngine()
+        if breakers is not None and self.personality.breaker:
+            # Publish breaker changes for the gateway's gauges
+            self.personality.breaker.on_change = lambda state: breakers.__setitem__(index, STATE_CODES[state])
+        self.music_knowledge = MusicKnowledge()
+        self.enrichment = default_pipeline(self.music_knowledge)
+        # Only pull what our scheduler would run or queue, so idle workers get the rest
+        self._capacity = asyncio.Semaphore(Config.LLM_MAX_CONCURRENCY + Config.LLM_MAX_QUEUE)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: "OrderedDict[int, None]" = OrderedDict()
+
+    async def run(self):
+        await self.music_knowledge.start()
+        await self.personality.warm_up()
+        listener = asyncio.create_task(self._listen_for_cancels())
+        try:
+            await self._pull_jobs()
+        finally:
+            listener.cancel()
+            for task in list(self._tasks.values()):
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            await self.personality.close()
+            await self.music_knowledge.close()
+
+    async def _pull_jobs(self):
+        while True:
+            await self._capacity.acquire()
+            job = await asyncio.to_thread(self.jobs.get)
+            if job is None:
+                return
+            if job['id'] in self._cancelled:
+                self._capacity.release()
+                continue
+            if job['deadline'] <= time.time():
+                self._send(job, EXPIRED, None)
+                self._capacity.release()
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._tasks[job['id']] = task
+            task.add_done_callback(lambda _, job_id=job['id']: self._finished(job_id))
+
+    def _finished(self, job_id: int):
+        self._tasks.pop(job_id, None)
+        self._capacity.release()
+
+    async def _listen_for_cancels(self):
+        while True:
+            job_id = await asyncio.to_thread(self.control.get)
+            if job_id is None:
+                return
+            task = self._tasks.get(job_id)
+            if task:
+                task.cancel()
+            else:
+                # Not pulled yet (or by another worker); skip it if it turns up here
+                self._cancelled[job_id] = None
+                while len(self._cancelled) > MAX_REMEMBERED_CANCELS:
+                    self._cancelled.popitem(last=False)
+
+    async def _run(self, job: Dict):
+        try:
+            await asyncio.wait_for(self._generate(job), job['deadline'] - time.time())
+        except asyncio.TimeoutError:
+            self._send(job, EXPIRED, None)
+        except asyncio.CancelledError:
+            self._send(job, CANCELLED, None)
+        except Exception as e:
+            if job['kind'] != 'reply':
+                self._send(job, ERROR, str(e))
+                return
+            logger.error(f"Generation job {job['id']} failed: {e}")
+            self._send(job, DELTA, self.personality.fallback_response(e))
+            self._send(job, DONE, None)
+
+    async def _generate(self, job: Dict):
+        if job['kind'] == 'summary':
+            turns = [Turn(role, text) for role, text in job['turns']]
+            self._send(job, DELTA, await self.personality.summarize(job['summary'], turns))
+            self._send(job, DONE, None)
+            return
+        if job['kind'] == 'variations':
+            lines = await self.personality.write_variations(job['instructions'], job['count'])
+            self._send(job, DELTA, "\n".join(lines))
+            self._send(job, DONE, None)
+            return
+
+        content = job['content']
+        user_context = UserContext(*job['user_context']) if job['user_context'] else None
+        history = restore_history(job['history'])
+        breaker = self.personality.breaker
+        if breaker and breaker.is_open:
+            # OpenAI keeps failing; answer from local music knowledge at once
+            self._send(job, DELTA, await self.music_knowledge.local_reply(content))
+            self._send(job, DONE, None)
+            return
+
+        is_music_related = self.music_knowledge.is_music_related(content)
+        # The job's wall-clock deadline, on the clock the scheduler and calls use
+        deadline = time.monotonic() + job['deadline'] - time.time()
+        args = (content, user_context, is_music_related, job['username'], job['user_id'], history, job['memories'], job['is_dm'], deadline)
+        # Lookups run while the model answers and go out with DONE
+        enrichment = self.enrichment.start(content, is_music_related, deadline)
+        try:
+            if job['stream']:
+                sent = False
+                try:
+                    async for delta in self.personality.stream_response(*args):
+                        self._send(job, DELTA, delta)
+                        sent = True
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error streaming response: {e}")
+                    # Keep whatever already went out; otherwise answer in character
+                    if not sent:
+                        self._send(job, DELTA, self.personality.fallback_response(e))
+            else:
+                self._send(job, DELTA, await self.personality.generate_response(*args))
+
+            self._send(job, DONE, await enrichment.collect())
+        finally:
+            enrichment.cancel()
+
+    def _send(self, job: Dict, kind: str, payload):
+        self.results.put((job['id'], job['channel_id'], kind, payload))
@@ -0,0 +1,213 @@
+"""
+Admission control for OpenAI calls.
+Bounds concurrent completions, paces them with a token bucket sized to the
+API quota, queues waiters fairly per user and sheds load when the queue is full.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def budget_share(processes: int) -> Dict:
+    """Config overrides giving each of several processes an even slice of the OpenAI budget."""
+    return {
+        'LLM_MAX_CONCURRENCY': max(1, Config.LLM_MAX_CONCURRENCY // processes),
+        'LLM_RATE_PER_MINUTE': Config.LLM_RATE_PER_MINUTE / processes,
+        'LLM_BURST': max(1, Config.LLM_BURST // processes),
+        'LLM_MAX_QUEUE': max(1, Config.LLM_MAX_QUEUE // processes),
+        'OPENAI_MAX_CONNECTIONS': max(2, Config.OPENAI_MAX_CONNECTIONS // processes)
+    }
+
+
+class LLMBusyError(Exception):
+    """Raised when a completion is shed instead of queued."""
+
+
+class LLMScheduler:
+    """Concurrency limit + token bucket + per-user round-robin wait queue."""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        rate_per_minute: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_wait: Optional[float] = None
+    ):
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.rate = (rate_per_minute or Config.LLM_RATE_PER_MINUTE) / 60.0
+        self.burst = burst or Config.LLM_BURST
+        self.max_queue = max_queue if max_queue is not None else Config.LLM_MAX_QUEUE
+        self.max_wait = max_wait or Config.LLM_MAX_WAIT
+
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._queues: Dict[int, Deque[asyncio.Future]] = {}
+        self._ring: Deque[int] = deque()  # Users with waiters, in round-robin order
+        self._waiting = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, max_wait: Optional[float] = None):
+        """Hold one completion slot for the duration of the block."""
+        await self.acquire(user_id, max_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, user_id: int, max_wait: Optional[float] = None):
+        """Wait for a slot, or raise LLMBusyError if the bot is saturated."""
+        started = time.monotonic()
+        # A caller's own deadline can only shorten the wait
+        max_wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        queue = self._queues.get(user_id)
+        if self._waiting >= self.max_queue or (queue and len(queue) >= Config.LLM_MAX_QUEUED_PER_USER):
+            self.shed += 1
+            raise LLMBusyError("completion queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ring.append(user_id)
+        queue.append(waiter)
+        self._waiting += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max_wait)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted right at the deadline; keep the slot rather than leak it
+                pass
+            else:
+                self._abandon(user_id, waiter)
+                self.shed += 1
+                raise LLMBusyError(f"waited more than {max_wait:.0f}s for a completion slot")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._abandon(user_id, waiter)
+            raise
+
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now and nobody is waiting for it."""
+        now = time.monotonic()
+        self._refill(now)
+        if self._waiting or self._in_flight >= self.max_concurrency or now < self._paused_until or self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        self._in_flight += 1
+        return True
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def throttle(self, seconds: float):
+        """Stop admitting for a while, e.g. after the API answers 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        logger.warning(f"OpenAI rate limited, pausing completions for {seconds:.0f}s")
+
+    def stats(self) -> Dict:
+        """Queue and wait-time figures for monitoring."""
+        return {
+            'in_flight': self._in_flight,
+            'queue_depth': self._waiting,
+            'users_waiting': len(self._ring),
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'avg_wait': self.total_wait / self.admitted if self.admitted else 0.0,
+            'max_wait': self.max_wait_seen,
+            'tokens': self._tokens
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _abandon(self, user_id: int, waiter: asyncio.Future):
+        """Drop a waiter that gave up so queue depth stays accurate."""
+        waiter.cancel()
+        queue = self._queues.get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[user_id]
+                self._ring.remove(user_id)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Oldest live waiter of the next user in the ring, dropping abandoned ones."""
+        while self._ring:
+            user_id = self._ring[0]
+            queue = self._queues[user_id]
+            while queue and queue[0].done():
+                queue.popleft()
+                self._waiting -= 1
+            if queue:
+                return queue[0]
+            self._ring.popleft()
+            del self._queues[user_id]
+        return None
+
+    def _dispatch(self):
+        """Admit as many waiters as slots and tokens allow."""
+        while self._in_flight < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until or self._tokens < 1.0:
+                self._schedule_retry(now)
+                return
+
+            # Admit and move this user to the back of the ring
+            user_id = self._ring.popleft()
+            queue = self._queues[user_id]
+            queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._ring.append(user_id)
+            else:
+                del self._queues[user_id]
+
+            self._tokens -= 1.0
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def _schedule_retry(self, now: float):
+        if self._timer is not None and not self._timer.cancelled():
+            return
+        delay = max(self._paused_until - now, (1.0 - self._tokens) / self.rate, 0.01)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
@@ -0,0 +1,214 @@
+"""
+Long-term memory of what users have told the bot.
+Messages are embedded offline as signed hashed word and character n-gram
+vectors and kept in one fixed-size record array (optionally a memory-mapped
+.npy file, so it survives restarts). Recall scores a user's rows against the
+new message in one matrix product and returns the few most relevant snippets
+for the prompt, rather than the user's whole history. Snippets are scoped to
+the guild they were said in, with DMs a scope of their own, so nothing said in
+private or in another server is repeated in a channel.
+"""
+
+import os
+import re
+import time
+import zlib
+import logging
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = {
+    'the', 'and', 'a', 'an', 'to', 'of', 'i', 'im', "i'm", 'you', 'it', 'is', 'in', 'on', 'my',
+    'me', 'so', 'that', 'this', 'was', 'for', 'with', 'just', 'be', 'are', 'at', 'do', 'but',
+    'what', "what's", 'how', "how's", 'your', 'again', 'should', 'about', 'tell', 'doing', 'have',
+    'has', "it's", 'its', 'or', 'if', 'can', 'will', 'get', 'got', 'like', 'really', 'been'
+}
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.4  # Character trigrams catch typos and word forms ("band"/"bands")
+DUPLICATE_SCORE = 0.95  # Closer than this to a stored snippet counts as the same thing
+QUANT_SCALE = 127.0  # Unit vectors are stored as int8; widening int8 is far cheaper than float16
+DM_SCOPE = 0  # Scope of snippets from direct messages; guild snippets use the guild id
+
+def embed(text: str, dims: Optional[int] = None) -> np.ndarray:
+    """Unit vector of signed hashed words and character trigrams."""
+    dims = dims or Config.MEMORY_DIMS
+    vec = np.zeros(dims, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        h = zlib.crc32(word.encode())
+        # The top hash bit picks the sign so collisions cancel instead of pile up
+        vec[h % dims] += WORD_WEIGHT if h & 0x80000000 else -WORD_WEIGHT
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            h = zlib.crc32(padded[i:i + 3].encode())
+            vec[h % dims] += TRIGRAM_WEIGHT if h & 0x80000000 else -TRIGRAM_WEIGHT
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _clip_utf8(text: str, limit: int) -> bytes:
+    """UTF-8 bytes of text cut to limit without splitting a character."""
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore").encode("utf-8")
+
+
+class LongTermMemory:
+    """Fixed-capacity snippet index with per-user caps and oldest-first eviction."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: Optional[int] = None,
+        per_user: Optional[int] = None,
+        dims: Optional[int] = None
+    ):
+        self.path = path
+        self.capacity = capacity or Config.MEMORY_MAX_ROWS
+        self.per_user = per_user or Config.MEMORY_MAX_PER_USER
+        self.dims = dims or Config.MEMORY_DIMS
+        self.dtype = np.dtype([
+            ('user', np.int64),
+            ('scope', np.int64),
+            ('time', np.float64),  # 0 marks a free row
+            ('vec', np.int8, (self.dims,)),
+            ('text', f"S{Config.MEMORY_SNIPPET_BYTES}")
+        ])
+        self.rows = self._open()
+        # Rebuild each user's rows, oldest first, from whatever the file held
+        times = self.rows['time']
+        used = np.nonzero(times)[0]
+        used = used[np.argsort(times[used], kind='stable')]
+        self._user_rows: Dict[int, List[int]] = {}
+        for row, user_id in zip(used.tolist(), self.rows['user'][used].tolist()):
+            self._user_rows.setdefault(user_id, []).append(row)
+        self._free: List[int] = np.nonzero(times == 0)[0][::-1].tolist()
+        self._last_embedded = ("", None)
+        self._unflushed = 0
+        self.evictions = 0
+        self.recalls = 0
+
+    def _open(self) -> np.ndarray:
+        if not self.path:
+            return np.zeros(self.capacity, dtype=self.dtype)
+        if os.path.exists(self.path):
+            try:
+                rows = np.lib.format.open_memmap(self.path, mode='r+')
+                if rows.dtype == self.dtype and rows.shape == (self.capacity,):
+                    return rows
+                logger.warning(f"{self.path} has a different layout, starting a fresh memory file")
+            except (ValueError, OSError) as e:
+                logger.warning(f"Couldn't open {self.path} ({e}), starting a fresh memory file")
+            os.replace(self.path, f"{self.path}.old")
+        return np.lib.format.open_memmap(self.path, mode='w+', dtype=self.dtype, shape=(self.capacity,))
+
+    def __len__(self) -> int:
+        return self.capacity - len(self._free)
+
+    def embed(self, text: str) -> np.ndarray:
+        # The same message is usually recalled against and then remembered
+        if self._last_embedded[0] != text:
+            self._last_embedded = (text, embed(text, self.dims))
+        return self._last_embedded[1]
+
+    def _scores(self, rows, vec: np.ndarray) -> np.ndarray:
+        return self.rows['vec'][rows].astype(np.float32) @ (vec / QUANT_SCALE)
+
+    def _scoped(self, rows: List[int], scope: int) -> np.ndarray:
+        index = np.array(rows, dtype=np.int64)
+        return index[self.rows['scope'][index] == scope]
+
+    def recall(self, user_id: int, scope: int, text: str, k: Optional[int] = None, exclude: Iterable[str] = ()) -> List[str]:
+        """Up to k of the user's snippets from scope most similar to text, best first."""
+        rows = self._user_rows.get(user_id)
+        if not rows:
+            return []
+        index = self._scoped(rows, scope)
+        if not len(index):
+            return []
+        k = k or Config.MEMORY_TOP_K
+        self.recalls += 1
+        scores = self._scores(index, self.embed(text))
+        top = np.argpartition(-scores, min(k * 2, len(index)) - 1)[:k * 2]
+        skip = set(exclude)
+        results = []
+        for i in top[np.argsort(-scores[top])]:
+            if scores[i] < Config.MEMORY_MIN_SCORE:
+                break
+            snippet = self.rows['text'][index[i]].decode("utf-8", "ignore")
+            if snippet not in skip:
+                results.append(snippet)
+                if len(results) == k:
+                    break
+        return results
+
+    def remember(self, user_id: int, scope: int, text: str):
+        """Store a message said in scope worth recalling later, evicting the oldest row if full."""
+        text = " ".join(text.split())
+        if len(text) < Config.MEMORY_MIN_CHARS:
+            return
+        vec = self.embed(text)
+        rows = self._user_rows.setdefault(user_id, [])
+        index = self._scoped(rows, scope) if rows else None
+        if index is not None and len(index):
+            scores = self._scores(index, vec)
+            best = int(index[int(np.argmax(scores))])
+            if scores.max() >= DUPLICATE_SCORE:
+                # Already known; just mark it as recent again
+                rows.remove(best)
+                self.rows['time'][best] = time.time()
+                rows.append(best)
+                return
+
+        if len(rows) >= self.per_user:
+            row = rows.pop(0)
+            self.evictions += 1
+        else:
+            row = self._take_free_row()
+        self.rows[row] = (user_id, scope, time.time(), np.round(vec * QUANT_SCALE).astype(np.int8), _clip_utf8(text, Config.MEMORY_SNIPPET_BYTES))
+        rows.append(row)
+        self._user_rows[user_id] = rows  # Eviction may have dropped an emptied list
+
+        self._unflushed += 1
+        if self._unflushed >= Config.MEMORY_FLUSH_EVERY:
+            self.flush()
+
+    def forget(self, user_id: int):
+        """Drop everything stored for a user."""
+        for row in self._user_rows.pop(user_id, []):
+            self.rows['time'][row] = 0.0
+            self._free.append(row)
+
+    def flush(self):
+        if isinstance(self.rows, np.memmap):
+            self.rows.flush()
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'rows': len(self),
+            'users': len(self._user_rows),
+            'capacity': self.capacity,
+            'evictions': self.evictions,
+            'recalls': self.recalls
+        }
+
+    def _take_free_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        # Full: reuse the oldest row in the whole index
+        row = int(np.argmin(self.rows['time']))
+        owner = int(self.rows['user'][row])
+        owner_rows = self._user_rows.get(owner)
+        if owner_rows:
+            owner_rows.remove(row)
+            if not owner_rows:
+                del self._user_rows[owner]
+        self.evictions += 1
+        return row
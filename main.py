@@ -4,9 +4,19 @@ Entry point for the Discord bot.
 Handles bot initialization and startup.
 """
 
+import time
+started = time.perf_counter()  # Startup timing includes the imports below
+
 import asyncio
 import logging
-from bot import EmoBot
+from dotenv import load_dotenv
+
+# Config reads the environment when it's imported, so .env goes in first
+load_dotenv()
+
+from config import Config
+from diagnostics import StartupTimer
+from sharding import ShardCoordinator
 
 # Configure logging
 logging.basicConfig(
@@ -14,9 +24,28 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+async def run_sharded():
+    """Run shard ranges in worker processes under a coordinator."""
+    coordinator = ShardCoordinator()
+    try:
+        await coordinator.run()
+    except Exception as e:
+        logging.error(f"Fatal error: {e}")
+    finally:
+        await coordinator.close()
+
 async def main():
     """Main entry point for the bot."""
-    bot = EmoBot()
+    Config.validate_config()
+    if Config.SHARD_PROCESSES > 1:
+        await run_sharded()
+        return
+
+    # Only a bot running in this process needs the bot's modules here
+    from bot import EmoBot
+    startup = StartupTimer(started)
+    startup.mark('imports')
+    bot = EmoBot(startup=startup)
     try:
         await bot.start_bot()
     except KeyboardInterrupt:
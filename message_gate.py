@@ -0,0 +1,107 @@
+"""
+Cheap local gate in front of the AI.
+Scores guild chatter from the music matcher and decides whether a message
+needs a completion, a local band/genre blurb, or no reply at all.
+"""
+
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+IGNORE = 'ignore'
+LOCAL = 'local'
+LLM = 'llm'
+
+# Score contributions, tuned so one stray keyword isn't worth a completion
+KEYWORD_WEIGHT = 1.0
+RECOMMEND_WEIGHT = 2.0
+BAND_WEIGHT = 1.5
+GENRE_WEIGHT = 1.0
+QUESTION_WEIGHT = 0.5
+
+# The bot's name as a word, so "ravenous" or "ravenclaw" don't count as addressing it
+NAME_PATTERN = re.compile(rf"\b{re.escape(Config.BOT_NAME)}\b", re.IGNORECASE)
+
+class GateDecision:
+    """What to do with one message."""
+
+    __slots__ = ('action', 'score', 'reply')
+
+    def __init__(self, action: str, score: float = 0.0, reply: Optional[str] = None):
+        self.action = action
+        self.score = score
+        self.reply = reply
+
+
+class MessageGate:
+    """Decides which messages are worth an LLM round trip."""
+
+    def __init__(self, music_knowledge, llm_threshold: Optional[float] = None, local_threshold: Optional[float] = None):
+        self.music_knowledge = music_knowledge
+        self.llm_threshold = llm_threshold if llm_threshold is not None else Config.GATE_LLM_THRESHOLD
+        self.local_threshold = local_threshold if local_threshold is not None else Config.GATE_LOCAL_THRESHOLD
+        # Last local blurb per channel, oldest first so expired entries can be dropped from the front
+        self._last_local: "OrderedDict[int, float]" = OrderedDict()
+        self.counts = {IGNORE: 0, LOCAL: 0, LLM: 0}
+
+    def score(self, content: str) -> float:
+        """How strongly a message invites a music-savvy reply."""
+        matches = self.music_knowledge.scan(content)
+        score = KEYWORD_WEIGHT * len(matches.keywords)
+        if matches.recommend:
+            score += RECOMMEND_WEIGHT
+        score += BAND_WEIGHT * len(matches.bands)
+        score += GENRE_WEIGHT * len(matches.genres)
+        if '?' in content:
+            score += QUESTION_WEIGHT
+        return score
+
+    def decide(self, content: str, channel_id: int, addressed: bool = False) -> GateDecision:
+        """Route a message: DMs, mentions and replies to the bot always get the AI."""
+        if addressed or NAME_PATTERN.search(content):
+            return self._count(GateDecision(LLM))
+
+        score = self.score(content)
+        if score >= self.llm_threshold:
+            return self._count(GateDecision(LLM, score))
+
+        if score >= self.local_threshold and self._local_allowed(channel_id):
+            matches = self.music_knowledge.scan(content)
+            reply = None
+            if matches.bands and self._band_meant(content, matches):
+                reply = self.music_knowledge._get_band_response(content)
+            elif matches.genres:
+                reply = self.music_knowledge._get_genre_response(content)
+            if reply:
+                self._last_local[channel_id] = time.monotonic()
+                self._last_local.move_to_end(channel_id)
+                return self._count(GateDecision(LOCAL, score, reply))
+
+        return self._count(GateDecision(IGNORE, score))
+
+    def stats(self) -> Dict:
+        total = sum(self.counts.values())
+        return dict(self.counts, llm_share=self.counts[LLM] / total if total else 0.0)
+
+    @staticmethod
+    def _band_meant(content: str, matches) -> bool:
+        """A band named with everyday words ("the used car") needs other music talk, or its name written as a name."""
+        if matches.keywords or matches.genre_words or matches.recommend:
+            return True
+        return any(band['name'] in content for band in matches.bands)
+
+    def _local_allowed(self, channel_id: int) -> bool:
+        # Don't let blurbs take over a busy channel
+        now = time.monotonic()
+        while self._last_local and now - next(iter(self._last_local.values())) >= Config.GATE_LOCAL_COOLDOWN:
+            self._last_local.popitem(last=False)
+        return channel_id not in self._last_local
+
+    def _count(self, decision: GateDecision) -> GateDecision:
+        self.counts[decision.action] += 1
+        return decision
@@ -0,0 +1,298 @@
+"""
+In-process metrics for the bot.
+Counters, callback gauges and fixed-bucket histograms cheap enough to leave on,
+rendered as Prometheus text for a local scrape endpoint and summarized for !stats.
+"""
+
+import time
+import bisect
+import logging
+from aiohttp import web
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Seconds; fine at the low end for local stages, wide at the top for completions
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so the hot path pays nothing."""
+
+    def __init__(self, name: str, help: str, callback: Callable, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        # With labels the callback returns {label values: value}
+        self.labelnames = labelnames
+
+    def value(self) -> Optional[float]:
+        samples = self.samples()
+        return samples[0][1] if len(samples) == 1 and not self.labelnames else None
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], float]]:
+        try:
+            if self.labelnames:
+                return [(labels, float(value)) for labels, value in sorted(self.callback().items())]
+            return [((), float(self.callback()))]
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            return []
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Timer:
+    """Context manager that observes its elapsed time into a histogram."""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Histogram:
+    """Fixed-bucket histogram per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels: str) -> Timer:
+        return Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Estimate a quantile by interpolating inside the matching bucket."""
+        series = self._series.get(labels)
+        if not series:
+            return 0.0
+        counts = series[0]
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def series(self) -> List[Tuple[str, ...]]:
+        return sorted(self._series)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + bound + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        # Gauges are re-bound when a new bot instance registers its callbacks
+        gauge = Gauge(name, help, callback, labelnames)
+        self._metrics[name] = gauge
+        return gauge
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "emobot_stage_seconds", "Time spent in each stage of a conversation reply", ("stage",)
+)
+LLM_CALLS = registry.counter(
+    "emobot_llm_calls_total", "Completion attempts by mode and outcome", ("mode", "outcome")
+)
+LLM_FALLBACKS = registry.counter(
+    "emobot_llm_fallbacks_total", "In-character fallback replies by reason (quota, timeout, busy, error)", ("reason",)
+)
+CONVERSATIONS = registry.counter(
+    "emobot_conversations_total", "Conversation replies by outcome", ("outcome",)
+)
+PROMPT_TOKENS = registry.counter(
+    "emobot_prompt_tokens_total", "Estimated prompt tokens by part (prefix_reused, prefix_new, tail)", ("part",)
+)
+PROMPT_CACHED_TOKENS = registry.counter(
+    "emobot_prompt_cached_tokens_total", "Prompt tokens the API reported serving from its prefix cache"
+)
+LOOP_LAG = registry.histogram(
+    "emobot_loop_lag_seconds", "How late event-loop heartbeats woke up"
+)
+LOOP_STALLS = registry.counter(
+    "emobot_loop_stalls_total", "Event-loop stalls longer than LOOP_STALL_THRESHOLD"
+)
+POOLED_RESPONSES = registry.counter(
+    "emobot_pooled_responses_total", "Canned command replies by pool and source (pool, static)", ("pool", "source")
+)
+OUTBOUND_MESSAGES = registry.counter(
+    "emobot_outbound_messages_total", "Outbound Discord sends by outcome (sent, coalesced, split, rate_limited, dropped)", ("outcome",)
+)
+ROUTE_DECISIONS = registry.counter(
+    "emobot_route_decisions_total", "Replies routed per model tier and reason", ("tier", "reason")
+)
+MODEL_SECONDS = registry.histogram(
+    "emobot_model_seconds", "Seconds per model tier to a streamed reply's first text (first) or a whole non-streamed reply (full)", ("tier", "measure")
+)
+BREAKER_TRANSITIONS = registry.counter(
+    "emobot_breaker_transitions_total", "OpenAI circuit breaker state changes by new state", ("state",)
+)
+HEDGED_REQUESTS = registry.counter(
+    "emobot_hedged_requests_total", "Hedged completions sent, and whether the hedge or the original won", ("outcome",)
+)
+ENRICHMENT_STAGES = registry.counter(
+    "emobot_enrichment_stages_total", "Enrichment stage results by outcome (ok, empty, dropped, error)", ("stage", "outcome")
+)
+ENRICHMENT_DELAY = registry.histogram(
+    "emobot_enrichment_delay_seconds", "Seconds each enrichment stage held back a reply that was otherwise ready", ("stage",)
+)
+
+
+def summary() -> Dict:
+    """Compact view of the registry for the !stats command."""
+    stages = {}
+    for (stage,) in STAGE_SECONDS.series():
+        stages[stage] = {
+            'count': STAGE_SECONDS.count(stage),
+            'p50': STAGE_SECONDS.quantile(0.5, stage),
+            'p95': STAGE_SECONDS.quantile(0.95, stage)
+        }
+    tiers = {}
+    for tier, measure in MODEL_SECONDS.series():
+        tiers[f"{tier} {measure}"] = {
+            'count': MODEL_SECONDS.count(tier, measure),
+            'p50': MODEL_SECONDS.quantile(0.5, tier, measure),
+            'p95': MODEL_SECONDS.quantile(0.95, tier, measure)
+        }
+    enrichment = {}
+    for (stage,) in ENRICHMENT_DELAY.series():
+        enrichment[stage] = {
+            'count': ENRICHMENT_DELAY.count(stage),
+            'p50': ENRICHMENT_DELAY.quantile(0.5, stage),
+            'p95': ENRICHMENT_DELAY.quantile(0.95, stage)
+        }
+    counters = {}
+    gauges = {}
+    for name, metric in registry._metrics.items():
+        if isinstance(metric, Counter):
+            for labels, value in sorted(metric._values.items()):
+                counters[f"{name}{_format_labels(metric.labelnames, labels)}"] = value
+        elif isinstance(metric, Gauge):
+            for labels, value in metric.samples():
+                gauges[f"{name}{_format_labels(metric.labelnames, labels)}"] = value
+    return {'stages': stages, 'tiers': tiers, 'enrichment': enrichment, 'counters': counters, 'gauges': gauges}
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving the registry in Prometheus text format."""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
+        self.host = host or Config.METRICS_HOST
+        self.port = port if port is not None else Config.METRICS_PORT
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,109 @@
+"""
+Latency-aware model routing.
+Picks the model tier, token cap and temperature for each reply from cheap local
+features (length, music talk, DM vs guild, queue pressure), and drops replies
+to the fast tier while the standard tier is missing its latency SLO or the
+completion queue is backed up. Streamed replies are timed to their first text
+and non-streamed ones to the whole reply; the two are tracked and judged apart.
+"""
+
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from config import Config
+from metrics import ROUTE_DECISIONS, MODEL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FAST = 'fast'
+STANDARD = 'standard'
+FIRST_TEXT = 'first'  # Time to a streamed reply's first text
+FULL = 'full'  # Time to a whole non-streamed reply
+
+class Route:
+    """Which tier answers one message, and with how many tokens."""
+
+    __slots__ = ('tier', 'max_tokens', 'reason')
+
+    def __init__(self, tier: str, max_tokens: int, reason: str):
+        self.tier = tier
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+
+class ModelRouter:
+    """Routes replies between model tiers and tracks how each tier is performing."""
+
+    def __init__(self, scheduler, latency_slo: Optional[float] = None, queue_limit: Optional[int] = None):
+        self.scheduler = scheduler
+        self.slos = {FIRST_TEXT: latency_slo or Config.ROUTE_LATENCY_SLO, FULL: Config.ROUTE_COMPLETE_SLO}
+        self.queue_limit = queue_limit or Config.ROUTE_DEGRADE_QUEUE_DEPTH
+        # Recent latencies per tier and measure; the SLOs are checked against these, not all-time figures
+        keys = [(tier, measure) for tier in (FAST, STANDARD) for measure in (FIRST_TEXT, FULL)]
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {key: deque(maxlen=Config.ROUTE_LATENCY_SAMPLES) for key in keys}
+        self._p95: Dict[Tuple[str, str], float] = {key: 0.0 for key in keys}
+        self._degraded_until = 0.0
+        self.degradations = 0
+
+    def route(self, message: str, is_music_related: bool, is_dm: bool) -> Route:
+        """Tier and token cap for a reply to message."""
+        # Small talk ("hey", "lol same") doesn't need the big model or a long answer
+        short = len(message) <= Config.ROUTE_SHORT_CHARS and not is_music_related and '?' not in message
+        if short:
+            cap = Config.ROUTE_SHORT_MAX_TOKENS
+        else:
+            cap = Config.ROUTE_MAX_TOKENS if is_dm else Config.ROUTE_GUILD_MAX_TOKENS
+        reason = self._pressure()
+        if reason:
+            # Under pressure only the model changes; the reply keeps its usual length
+            return self._count(Route(FAST, cap, reason))
+        if short:
+            return self._count(Route(FAST, cap, 'short'))
+        if is_music_related:
+            return self._count(Route(STANDARD, cap, 'music'))
+        return self._count(Route(STANDARD, cap, 'dm' if is_dm else 'guild'))
+
+    def record(self, route: Route, seconds: float, measure: str):
+        """Note how long route's tier took, to first text (FIRST_TEXT) or the whole reply (FULL)."""
+        MODEL_SECONDS.observe(seconds, route.tier, measure)
+        samples = self._latencies[(route.tier, measure)]
+        samples.append(seconds)
+        if len(samples) >= Config.ROUTE_MIN_SAMPLES:
+            ordered = sorted(samples)
+            self._p95[(route.tier, measure)] = ordered[int(0.95 * (len(ordered) - 1))]
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self._degraded_until
+
+    def stats(self) -> Dict:
+        return {
+            'degraded': self.degraded,
+            'degradations': self.degradations,
+            'p95': {f"{tier} {measure}": p95 for (tier, measure), p95 in self._p95.items()},
+            'samples': {f"{tier} {measure}": len(samples) for (tier, measure), samples in self._latencies.items()}
+        }
+
+    def _pressure(self) -> Optional[str]:
+        """Why replies should go to the fast tier right now, if they should."""
+        if self.degraded:
+            return 'degraded'
+        if self.scheduler.queue_depth >= self.queue_limit:
+            reason = 'queue'
+        elif any(self._p95[(STANDARD, measure)] > slo for measure, slo in self.slos.items()):
+            reason = 'latency'
+        else:
+            return None
+        # Hold the fast tier for a while, then let fresh standard samples decide again
+        self._degraded_until = time.monotonic() + Config.ROUTE_DEGRADE_HOLD
+        for measure in self.slos:
+            self._latencies[(STANDARD, measure)].clear()
+            self._p95[(STANDARD, measure)] = 0.0
+        self.degradations += 1
+        logger.warning(f"Routing replies to the fast model for {Config.ROUTE_DEGRADE_HOLD:.0f}s ({reason})")
+        return reason
+
+    def _count(self, route: Route) -> Route:
+        ROUTE_DECISIONS.inc(route.tier, route.reason)
+        return route
@@ -0,0 +1,194 @@
+"""
+Indexed music catalog stored in a read-only SQLite file.
+Records are fetched on demand through the memory-mapped file, so opening
+a catalog with tens of thousands of artists doesn't parse all of them.
+
+Build a catalog file from a JSON export of the genre/band/song layout:
+    python music_catalog.py catalog.json catalog.db
+or from the built-in database:
+    python music_catalog.py catalog.db
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = "1"
+MMAP_SIZE = 256 * 1024 * 1024
+
+class MusicCatalog:
+    """Read-only view of bands and songs with name, genre and song indexes."""
+
+    def __init__(self, db: sqlite3.Connection, path: Optional[str] = None):
+        self._db = db
+        self.path = path
+        self._bands: Dict[int, Dict] = {}
+        self._genres: Optional[List[str]] = None
+        self._genre_bands: Dict[str, List[int]] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "MusicCatalog":
+        """Open a catalog file without loading its records."""
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        db.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not version or version[0] != SCHEMA_VERSION:
+            db.close()
+            raise ValueError(f"Unsupported music catalog format in {path}")
+        return cls(db, path)
+
+    @classmethod
+    def from_database(cls, database: Dict) -> "MusicCatalog":
+        """Build an in-memory catalog from the nested genre -> bands/songs layout."""
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        cls._populate(db, database)
+        return cls(db)
+
+    @classmethod
+    def build(cls, path: str, database: Dict):
+        """Write a catalog file, replacing any existing one atomically."""
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        db = sqlite3.connect(tmp_path)
+        try:
+            cls._populate(db, database)
+            db.execute("VACUUM")
+        finally:
+            db.close()
+        # Readers holding the old file keep their snapshot; new opens see the new one
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _populate(db: sqlite3.Connection, database: Dict):
+        db.executescript(
+            """
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE bands (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                name_lower TEXT NOT NULL,
+                genre TEXT NOT NULL,
+                era TEXT NOT NULL,
+                vibe TEXT NOT NULL
+            );
+            CREATE TABLE songs (
+                id INTEGER PRIMARY KEY,
+                title_lower TEXT NOT NULL,
+                label TEXT NOT NULL,
+                band_id INTEGER
+            );
+            """
+        )
+        db.execute("INSERT INTO meta (key, value) VALUES ('version', ?)", (SCHEMA_VERSION,))
+
+        # Band ids follow catalog order, which decides ties when several bands match
+        band_ids = {}
+        for genre, data in database.items():
+            for band in data['bands']:
+                cursor = db.execute(
+                    "INSERT INTO bands (name, name_lower, genre, era, vibe) VALUES (?, ?, ?, ?, ?)",
+                    (band['name'], band['name'].lower(), genre, band['era'], band['vibe'])
+                )
+                band_ids.setdefault(band['name'].lower(), cursor.lastrowid)
+
+        for data in database.values():
+            for song in data['songs']:
+                title, _, artist = song.rpartition(' - ')
+                title = title or song
+                db.execute(
+                    "INSERT INTO songs (title_lower, label, band_id) VALUES (?, ?, ?)",
+                    (title.lower(), song, band_ids.get(artist.lower()))
+                )
+
+        db.executescript(
+            """
+            CREATE INDEX idx_bands_name ON bands (name_lower);
+            CREATE INDEX idx_bands_genre ON bands (genre, id);
+            CREATE INDEX idx_songs_title ON songs (title_lower);
+            """
+        )
+        db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM bands").fetchone()[0]
+
+    def genres(self) -> List[str]:
+        """Genres in catalog order."""
+        if self._genres is None:
+            rows = self._db.execute("SELECT genre FROM bands GROUP BY genre ORDER BY MIN(id)").fetchall()
+            self._genres = [row[0] for row in rows]
+        return self._genres
+
+    def band_ids(self, genre: str) -> List[int]:
+        """Ids of every band in a genre, in catalog order."""
+        ids = self._genre_bands.get(genre)
+        if ids is None:
+            rows = self._db.execute("SELECT id FROM bands WHERE genre = ? ORDER BY id", (genre,)).fetchall()
+            ids = self._genre_bands[genre] = [row[0] for row in rows]
+        return ids
+
+    def band(self, band_id: int) -> Optional[Dict]:
+        """Fetch one band record, caching it after the first read."""
+        band = self._bands.get(band_id)
+        if band is None:
+            row = self._db.execute(
+                "SELECT name, genre, era, vibe FROM bands WHERE id = ?", (band_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            band = self._bands[band_id] = {'id': band_id, 'name': row[0], 'genre': row[1], 'era': row[2], 'vibe': row[3]}
+        return band
+
+    def find_band(self, name: str) -> Optional[Dict]:
+        """Look a band up by name, case-insensitively."""
+        row = self._db.execute(
+            "SELECT id FROM bands WHERE name_lower = ? ORDER BY id LIMIT 1", (name.lower(),)
+        ).fetchone()
+        return self.band(row[0]) if row else None
+
+    def song_artist(self, title: str) -> Optional[Dict]:
+        """The band behind a song title, if the catalog knows it."""
+        row = self._db.execute(
+            "SELECT band_id FROM songs WHERE title_lower = ? AND band_id IS NOT NULL LIMIT 1", (title.lower(),)
+        ).fetchone()
+        return self.band(row[0]) if row else None
+
+    def song_label(self, song_id: int) -> Optional[str]:
+        row = self._db.execute("SELECT label FROM songs WHERE id = ?", (song_id,)).fetchone()
+        return row[0] if row else None
+
+    def iter_band_names(self) -> Iterator[Tuple[int, str]]:
+        """(id, lowercase name) for every band, streamed from disk."""
+        yield from self._db.execute("SELECT id, name_lower FROM bands ORDER BY id")
+
+    def iter_band_features(self) -> Iterator[Tuple[int, str, str, str]]:
+        """(id, genre, era, vibe) for every band, streamed from disk."""
+        yield from self._db.execute("SELECT id, genre, era, vibe FROM bands ORDER BY id")
+
+    def iter_song_titles(self) -> Iterator[Tuple[int, str]]:
+        """(id, lowercase title) for every song, streamed from disk."""
+        yield from self._db.execute("SELECT id, title_lower FROM songs ORDER BY id")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            source = json.load(f)
+        out_path = sys.argv[2]
+    elif len(sys.argv) == 2:
+        from music_knowledge import MusicKnowledge
+        source = MusicKnowledge._initialize_music_database()
+        out_path = sys.argv[1]
+    else:
+        sys.exit(__doc__)
+    MusicCatalog.build(out_path, source)
+    print(f"Wrote {out_path}")
@@ -3,21 +3,181 @@ Music knowledge database and recommendation system.
 Focused on punk, pop punk, metal, and emo genres.
 """
 
+import os
 import json
 import random
 import re
-from typing import Dict, List, Optional
+import sqlite3
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from keyword_matcher import AhoCorasick
+from music_catalog import MusicCatalog
+from recommender import Recommender
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RECOMMEND_TRIGGERS = ['recommend', 'suggestion', 'what should i listen']
+GENRE_WORDS = ['punk', 'pop', 'metal', 'emo', 'alternative']
+
+def _whole_word(text: str, start: int, end: int, plural: bool = False) -> bool:
+    """No letter or digit touches text[start:end], so "emo" isn't found in "memory" or Tool in "stool"."""
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    if plural and text.startswith('s', end):
+        end += 1  # "songs", "bands"
+    return end >= len(text) or not text[end].isalnum()
+
+
+class MusicMatches:
+    """Everything one scan of a message found, grouped by kind."""
+
+    __slots__ = ('keywords', 'recommend', 'genre_words', 'bands', 'songs', 'genres')
+
+    def __init__(self):
+        self.keywords = set()
+        self.recommend = False
+        self.genre_words = set()
+        self.bands = []
+        self.songs = []
+        self.genres = []
 
 class MusicKnowledge:
     def __init__(self):
-        self.music_database = self._initialize_music_database()
         self.music_keywords = [
             'music', 'band', 'song', 'album', 'concert', 'guitar', 'drums',
             'punk', 'metal', 'emo', 'rock', 'lyrics', 'recommend', 'listen',
             'favorite', 'genre', 'artist', 'playlist', 'chord', 'riff'
         ]
+        self.genre_responses = {
+            'punk': "Punk is like... pure rebellion in sound form 🖤 Raw, fast, and unapologetic. It's about saying 'fuck the system' with three chords and attitude.",
+            'metal': "Metal is where I go when I need to feel powerful 💀 Heavy riffs, thunderous drums, and vocals that can shake your soul. It's cathartic chaos.",
+            'emo': "Emo is emotional honesty set to music 🥀 It's about feeling everything deeply and not being ashamed of it. My heart lives in emo lyrics.",
+            'pop punk': "Pop punk is like... punk's younger sibling who went mainstream but kept the attitude ⚡ Catchy hooks with rebellious spirit.",
+            'alternative': "Alternative is where the outcasts found their voice 🌙 It's moody, introspective, and beautifully dark. Gothic romance in music form."
+        }
+        
+        # The built-in bands answer until start() has loaded the external catalog file, if there is one
+        self.catalog_path = Config.MUSIC_CATALOG_PATH
+        self.catalog = MusicCatalog.from_database(self._initialize_music_database())
+        self.matcher = self._build_matcher(self.catalog)
+        self.recommender = Recommender(self.catalog)
+        self._catalog_stamp = None
+        self._last_scan = (None, None)
+        self.recommendation_history: "OrderedDict[int, Set[int]]" = OrderedDict()
+        self._reload_task: Optional[asyncio.Task] = None
+        
+    def _build_matcher(self, catalog: MusicCatalog) -> AhoCorasick:
+        """Compile keywords, triggers, bands, songs and genres into one automaton."""
+        matcher = AhoCorasick()
+        for keyword in self.music_keywords:
+            matcher.add(keyword, ('keyword', keyword))
+        for trigger in RECOMMEND_TRIGGERS:
+            matcher.add(trigger, ('recommend', trigger))
+        for word in GENRE_WORDS:
+            matcher.add(word, ('genre_word', word))
+        # Band ids follow catalog order, which decides which band wins when several are mentioned
+        for band_id, name in catalog.iter_band_names():
+            matcher.add(name, ('band', band_id))
+        for song_id, title in catalog.iter_song_titles():
+            matcher.add(title, ('song', song_id))
+        for order, genre in enumerate(self.genre_responses):
+            matcher.add(genre, ('genre', order))
+        matcher.build()
+        return matcher
+        
+    def _load_catalog(self, path: str) -> Tuple[MusicCatalog, AhoCorasick, Recommender]:
+        """Open a catalog file and compile its matcher and recommender (safe to run in a thread)."""
+        catalog = MusicCatalog.open(path)
+        return catalog, self._build_matcher(catalog), Recommender(catalog)
+        
+    @staticmethod
+    def _stat_catalog(path: str) -> Tuple:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
         
-    def _initialize_music_database(self) -> Dict:
+    async def start(self):
+        """Load the catalog file in the background and keep watching it for changes."""
+        if self.catalog_path and self._reload_task is None:
+            self._reload_task = asyncio.create_task(self._watch_catalog())
+            
+    async def close(self):
+        """Stop the catalog watcher."""
+        if self._reload_task:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
+            
+    async def reload(self):
+        """Load the catalog file again in the background and swap it in atomically."""
+        started = time.perf_counter()
+        stamp = self._stat_catalog(self.catalog_path)
+        catalog, matcher, recommender = await asyncio.to_thread(self._load_catalog, self.catalog_path)
+        
+        # No await between these assignments, so handlers never see a mixed state
+        old_catalog = self.catalog
+        self.catalog, self.matcher, self.recommender = catalog, matcher, recommender
+        self._last_scan = (None, None)
+        self._catalog_stamp = stamp
+        old_catalog.close()
+        logger.info(f"Loaded music catalog from {self.catalog_path} ({len(catalog)} bands) in {time.perf_counter() - started:.2f}s")
+        
+    async def _watch_catalog(self):
+        while True:
+            # The first pass loads the file, since nothing has been loaded from it yet
+            try:
+                if self._stat_catalog(self.catalog_path) != self._catalog_stamp:
+                    await self.reload()
+            except (OSError, ValueError, sqlite3.Error) as e:
+                # Keep serving the catalog we have until a good file shows up
+                logger.error(f"Failed to load music catalog: {e}")
+            await asyncio.sleep(Config.MUSIC_CATALOG_RELOAD_INTERVAL)
+                
+    def scan(self, message: str) -> MusicMatches:
+        """Match every music pattern in one pass, reusing the last scan for the same text.
+
+        Keywords, bands, songs and genres only count as whole words; recommend
+        triggers also match inside longer words such as "recommendation".
+        """
+        text = message.lower().replace('_', ' ')
+        if self._last_scan[0] == text:
+            return self._last_scan[1]
+            
+        matches = MusicMatches()
+        band_ids = set()
+        genre_orders = set()
+        for start, end, (kind, value) in self.matcher.iter_spans(text):
+            if kind == 'recommend':
+                matches.recommend = True
+            elif not _whole_word(text, start, end, plural=kind == 'keyword'):
+                continue
+            elif kind == 'keyword':
+                matches.keywords.add(value)
+            elif kind == 'genre_word':
+                matches.genre_words.add(value)
+            elif kind == 'band':
+                band_ids.add(value)
+            elif kind == 'song':
+                label = self.catalog.song_label(value)
+                if label not in matches.songs:
+                    matches.songs.append(label)
+            elif kind == 'genre':
+                genre_orders.add(value)
+                
+        matches.bands = [self.catalog.band(band_id) for band_id in sorted(band_ids)]
+        genres = list(self.genre_responses)
+        matches.genres = [genres[order] for order in sorted(genre_orders)]
+        self._last_scan = (text, matches)
+        return matches
+        
+    @staticmethod
+    def _initialize_music_database() -> Dict:
         """Initialize the music knowledge database."""
         return {
             "punk": {
@@ -103,86 +263,112 @@ class MusicKnowledge:
         
     def is_music_related(self, message: str) -> bool:
         """Check if a message is music-related."""
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in self.music_keywords)
+        return bool(self.scan(message).keywords)
         
     async def get_music_response(self, message: str) -> Optional[str]:
         """Get music knowledge response based on the message."""
-        message_lower = message.lower()
+        matches = self.scan(message)
         
         # Check for recommendation requests
-        if any(word in message_lower for word in ['recommend', 'suggestion', 'what should i listen']):
-            return self._get_recommendation_response(message_lower)
+        if matches.recommend:
+            return self._get_recommendation_response(message)
             
         # Check for specific band mentions
-        band_response = self._get_band_response(message_lower)
+        band_response = self._get_band_response(message)
         if band_response:
             return band_response
             
         # Check for genre discussions
-        genre_response = self._get_genre_response(message_lower)
+        genre_response = self._get_genre_response(message)
         if genre_response:
             return genre_response
             
         return None
         
+    async def local_reply(self, message: str) -> str:
+        """In-character answer without the AI: whatever the message hooks into, else something to listen to."""
+        response = await self.get_music_response(message)
+        if response:
+            return response
+        return f"*static crackles* My head's a little foggy right now, babe... but here's something to listen to while it clears 🖤\n\n{self.recommend()}"
+        
     def _get_recommendation_response(self, message: str) -> str:
         """Generate music recommendations."""
-        recommendations = []
-        
-        # Genre-specific recommendations
-        if 'punk' in message and 'pop' in message:
-            genre = 'pop_punk'
-        elif 'metal' in message:
-            genre = 'metal'
-        elif 'emo' in message:
-            genre = 'emo'
-        elif 'punk' in message:
-            genre = 'punk'
-        elif 'alternative' in message:
-            genre = 'alternative'
+        return self.recommend(message)
+        
+    def recommend(self, query: Optional[str] = None, user_id: Optional[int] = None, exclude_seen: bool = False) -> str:
+        """Recommend bands close to a band or genre named in the query."""
+        query = query or ''
+        band = self.catalog.find_band(query.strip())
+        if band is None:
+            bands = self.scan(query).bands
+            band = bands[0] if bands else None
+            
+        exclude = self.recommendation_history.get(user_id, set()) if exclude_seen else set()
+        if band:
+            label = f"stuff like {band['name']}"
+            picks = self.recommender.recommend(band_id=band['id'], exclude=exclude)
         else:
-            # Random genre
-            genre = random.choice(list(self.music_database.keys()))
+            genre = self._pick_genre(query)
+            label = genre.replace('_', ' ')
+            picks = self.recommender.recommend(genre=genre, exclude=exclude)
             
-        bands = self.music_database[genre]['bands']
-        selected_bands = random.sample(bands, min(3, len(bands)))
-        
-        response = f"🎵 *whispers darkly* Here's some {genre.replace('_', ' ')} that'll feed your soul:\n\n"
+        if not picks:
+            return "*flips through vinyl collection* You've already heard everything I'd pick for that, babe... try another band or genre 🖤"
+        if user_id is not None:
+            self._remember_recommendations(user_id, picks)
+            
+        response = f"🎵 *whispers darkly* Here's some {label} that'll feed your soul:\n\n"
         
-        for band in selected_bands:
+        for band in picks:
             response += f"**{band['name']}** ({band['era']}) - {band['vibe']}\n"
             
         response += f"\n*adjusts black nail polish* Trust me, these will hit different 🖤"
         
         return response
         
+    def _pick_genre(self, query: str) -> str:
+        """Map a query to a catalog genre, falling back to a random one."""
+        normalized = query.strip().lower().replace('-', '_').replace(' ', '_')
+        if normalized == 'poppunk':
+            normalized = 'pop_punk'
+        if normalized in self.catalog.genres():
+            return normalized
+            
+        genre_words = self.scan(query).genre_words
+        if 'punk' in genre_words and 'pop' in genre_words:
+            return 'pop_punk'
+        for genre in ('metal', 'emo', 'punk', 'alternative'):
+            if genre in genre_words:
+                return genre
+        return random.choice(self.catalog.genres())
+        
+    def _remember_recommendations(self, user_id: int, bands: List[Dict]):
+        seen = self.recommendation_history.pop(user_id, set())
+        seen.update(band['id'] for band in bands)
+        self.recommendation_history[user_id] = seen
+        if len(self.recommendation_history) > Config.RECOMMEND_HISTORY_USERS:
+            self.recommendation_history.popitem(last=False)
+            
     def _get_band_response(self, message: str) -> Optional[str]:
         """Get response about specific bands."""
-        for genre, data in self.music_database.items():
-            for band in data['bands']:
-                if band['name'].lower() in message:
-                    responses = [
-                        f"Oh damn, {band['name']}? 🖤 {band['vibe']} They're absolutely perfect for late night feelings.",
-                        f"*eyes light up* {band['name']} is pure magic! {band['vibe']} They get it, you know?",
-                        f"Fuck yes, {band['name']}! {band['vibe']} That's the kind of energy I live for ⚡",
-                        f"Mmm, {band['name']}... {band['vibe']} *chef's kiss* Immaculate taste, gorgeous 🥀"
-                    ]
-                    return random.choice(responses)
-        return None
+        bands = self.scan(message).bands
+        if not bands:
+            return None
+            
+        band = bands[0]
+        responses = [
+            f"Oh damn, {band['name']}? 🖤 {band['vibe']} They're absolutely perfect for late night feelings.",
+            f"*eyes light up* {band['name']} is pure magic! {band['vibe']} They get it, you know?",
+            f"Fuck yes, {band['name']}! {band['vibe']} That's the kind of energy I live for ⚡",
+            f"Mmm, {band['name']}... {band['vibe']} *chef's kiss* Immaculate taste, gorgeous 🥀"
+        ]
+        return random.choice(responses)
         
     def _get_genre_response(self, message: str) -> Optional[str]:
         """Get response about music genres."""
-        genre_responses = {
-            'punk': "Punk is like... pure rebellion in sound form 🖤 Raw, fast, and unapologetic. It's about saying 'fuck the system' with three chords and attitude.",
-            'metal': "Metal is where I go when I need to feel powerful 💀 Heavy riffs, thunderous drums, and vocals that can shake your soul. It's cathartic chaos.",
-            'emo': "Emo is emotional honesty set to music 🥀 It's about feeling everything deeply and not being ashamed of it. My heart lives in emo lyrics.",
-            'pop punk': "Pop punk is like... punk's younger sibling who went mainstream but kept the attitude ⚡ Catchy hooks with rebellious spirit.",
-            'alternative': "Alternative is where the outcasts found their voice 🌙 It's moody, introspective, and beautifully dark. Gothic romance in music form."
-        }
-        
-        for genre, response in genre_responses.items():
-            if genre in message.replace('_', ' '):
-                return response
-                
+        genres = self.scan(message).genres
+        if genres:
+            return self.genre_responses[genres[0]]
+            
         return None
@@ -0,0 +1,299 @@
+"""
+Outbound Discord messages.
+Splits long replies on safe boundaries (never inside markdown, an emoji or a
+mention), queues sends per channel, paces each channel against Discord's
+message bucket and coalesces small replies that pile up behind it.
+"""
+
+import re
+import time
+import asyncio
+import logging
+import unicodedata
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import discord
+from config import Config
+from metrics import OUTBOUND_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+FENCE = "```"
+COALESCE_SEPARATOR = "\n\n"
+MAX_IDLE_LANES = 1000  # Idle channels whose bucket state we keep before pruning
+_FENCED = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+_INLINE_MARKERS = ("**", "__", "~~", "||")
+# Preferred split points, best first, and how many of their characters stay in the earlier chunk
+_BOUNDARIES = (("\n\n", 0), ("\n", 0), (". ", 1), ("! ", 1), ("? ", 1), (" ", 0))
+
+def _continues_cluster(text: str, i: int) -> bool:
+    """Whether text[i] belongs to the same visible character as text[i - 1]."""
+    ch, prev = text[i], text[i - 1]
+    if prev == "\u200d" or ch in "\u200d\ufe0e\ufe0f" or unicodedata.category(ch) in ("Mn", "Me", "Mc"):
+        return True
+    if "\U0001F3FB" <= ch <= "\U0001F3FF" or "\U000E0020" <= ch <= "\U000E007F":
+        return True  # Skin tones and flag tag sequences
+    if "\U0001F1E6" <= ch <= "\U0001F1FF":
+        # Regional indicators pair up into flags
+        run = 0
+        while i - run - 1 >= 0 and "\U0001F1E6" <= text[i - run - 1] <= "\U0001F1FF":
+            run += 1
+        return run % 2 == 1
+    return False
+
+
+def _hard_cut(text: str, limit: int) -> int:
+    """Cut with no whitespace to use, without splitting an emoji or a <...> mention."""
+    cut = limit
+    while cut > 1 and _continues_cluster(text, cut):
+        cut -= 1
+    opening = text.rfind("<", max(0, cut - 64), cut)
+    if opening > 0 and ">" not in text[opening:cut]:
+        cut = opening
+    return cut
+
+
+def _balanced(chunk: str) -> bool:
+    """Inline markdown is closed by the end of the chunk (code fences are handled separately)."""
+    chunk = _FENCED.sub("", chunk)
+    if chunk.count("`") % 2:
+        return False
+    for marker in _INLINE_MARKERS:
+        if chunk.count(marker) % 2:
+            return False
+        chunk = chunk.replace(marker, "")
+    return chunk.count("*") % 2 == 0
+
+
+def split_point(text: str, limit: int) -> int:
+    """Index to end the first chunk at: the best safe boundary within limit."""
+    if len(text) <= limit:
+        return len(text)
+    floor = limit // 2  # Don't make a tiny chunk just to get a nicer boundary
+    fallback = None
+    for boundary, keep in _BOUNDARIES:
+        at = text.rfind(boundary, floor, limit)
+        while at != -1:
+            cut = at + keep
+            if _balanced(text[:cut]):
+                return cut
+            if fallback is None and boundary == " ":
+                fallback = cut
+            at = text.rfind(boundary, floor, at)
+    if fallback is not None:
+        return fallback
+    return _hard_cut(text, limit)
+
+
+def _open_fence(chunk: str) -> Optional[str]:
+    """The opening line of a code block left open at the end of chunk, if any."""
+    if chunk.count(FENCE) % 2 == 0:
+        return None
+    start = chunk.rfind(FENCE)
+    end = chunk.find("\n", start)
+    return chunk[start:end] if end != -1 else chunk[start:]
+
+
+def split_message(text: str, limit: Optional[int] = None) -> List[str]:
+    """Split text into Discord-sized chunks, closing and reopening code blocks at the seams."""
+    limit = limit or Config.MAX_MESSAGE_LENGTH
+    chunks = []
+    reopen = ""
+    text = text.strip()
+    while text:
+        body = reopen + text
+        if len(body) <= limit:
+            chunks.append(body)
+            break
+        # Leave room to close a code block the cut lands in
+        cut = max(split_point(body, limit - len(FENCE) - 1), len(reopen) + 1)
+        chunk = body[:cut].rstrip()
+        fence = _open_fence(chunk)
+        if fence is not None:
+            chunks.append(f"{chunk}\n{FENCE}")
+            reopen = f"{fence}\n"
+            text = body[cut:].lstrip("\n")  # Keep code indentation
+        else:
+            chunks.append(chunk)
+            reopen = ""
+            text = body[cut:].lstrip()
+    return chunks
+
+
+class Outgoing:
+    """One queued send: its chunks, extra send() arguments and the caller's future."""
+
+    __slots__ = ('parts', 'kwargs', 'coalesce', 'future')
+
+    def __init__(self, parts: List[Optional[str]], kwargs: Dict, coalesce: bool, future: asyncio.Future):
+        self.parts = parts
+        self.kwargs = kwargs
+        self.coalesce = coalesce and not kwargs and len(parts) == 1 and bool(parts[0])
+        self.future = future
+
+
+class ChannelLane:
+    """Pending sends and the message bucket for one channel."""
+
+    __slots__ = ('channel', 'pending', 'tokens', 'refilled', 'paused_until', 'task')
+
+    def __init__(self, channel, burst: int):
+        self.channel = channel
+        self.pending: Deque[Outgoing] = deque()
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.paused_until = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class OutboundDispatcher:
+    """Per-channel send queues paced to Discord's rate limits."""
+
+    def __init__(self, burst: Optional[int] = None, window: Optional[float] = None, max_pending: Optional[int] = None):
+        self.burst = burst or Config.OUTBOUND_CHANNEL_BURST
+        self.rate = self.burst / (window or Config.OUTBOUND_CHANNEL_WINDOW)
+        self.max_pending = max_pending or Config.OUTBOUND_MAX_PENDING
+        self._lanes: Dict[int, ChannelLane] = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+    async def send(self, channel, content: Optional[str] = None, coalesce: bool = True, **kwargs) -> List[discord.Message]:
+        """Queue content for the channel; returns the Discord messages it went out in."""
+        lane = self._lanes.get(channel.id)
+        if lane is None:
+            if len(self._lanes) >= MAX_IDLE_LANES:
+                self._prune()
+            lane = self._lanes[channel.id] = ChannelLane(channel, self.burst)
+        if len(lane.pending) >= self.max_pending:
+            self.dropped += 1
+            OUTBOUND_MESSAGES.inc('dropped')
+            logger.warning(f"Outbound queue for channel {channel.id} is full, dropping a message")
+            return []
+
+        parts = split_message(content) if content else [content]
+        if len(parts) > 1:
+            OUTBOUND_MESSAGES.inc('split', amount=len(parts) - 1)
+        item = Outgoing(parts, kwargs, coalesce, asyncio.get_running_loop().create_future())
+        lane.pending.append(item)
+        if lane.task is None:
+            lane.task = asyncio.create_task(self._drain(lane), name=f"outbound-{channel.id}")
+        return await item.future
+
+    async def close(self):
+        """Let queued messages go out, then stop."""
+        tasks = [lane.task for lane in self._lanes.values() if lane.task]
+        if tasks:
+            await asyncio.wait(tasks, timeout=Config.OUTBOUND_CHANNEL_WINDOW * 2)
+        for lane in list(self._lanes.values()):
+            if lane.task:
+                lane.task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            'channels': len(self._lanes),
+            'pending': sum(len(lane.pending) for lane in self._lanes.values()),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'dropped': self.dropped
+        }
+
+    async def _drain(self, lane: ChannelLane):
+        try:
+            while lane.pending:
+                await self._take_token(lane)
+                batch = self._next_batch(lane)
+                if not batch:
+                    continue
+                if len(batch) > 1:
+                    # Replies that queued up behind the bucket go out as one message
+                    parts = [COALESCE_SEPARATOR.join(item.parts[0] for item in batch)]
+                    self.coalesced += len(batch) - 1
+                    OUTBOUND_MESSAGES.inc('coalesced', amount=len(batch) - 1)
+                else:
+                    parts = batch[0].parts
+                try:
+                    messages = await self._send_parts(lane, parts, batch[0].kwargs)
+                except Exception as e:
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_result(messages)
+        finally:
+            # The lane stays so its bucket keeps counting sends Discord remembers
+            lane.task = None
+
+    def _prune(self):
+        """Forget idle channels whose bucket has refilled."""
+        now = time.monotonic()
+        full = self.burst / self.rate
+        for channel_id, lane in list(self._lanes.items()):
+            if lane.task is None and not lane.pending and now - lane.refilled >= full:
+                del self._lanes[channel_id]
+
+    def _next_batch(self, lane: ChannelLane) -> List[Outgoing]:
+        """The next live send, plus any that would otherwise wait for the bucket."""
+        while lane.pending and lane.pending[0].future.done():
+            lane.pending.popleft()  # Caller gave up
+        if not lane.pending:
+            return []
+        batch = [lane.pending.popleft()]
+        if not batch[0].coalesce or lane.tokens >= 1.0:
+            return batch  # Separate messages while the bucket allows it
+        length = len(batch[0].parts[0])
+        while lane.pending and lane.pending[0].coalesce:
+            extra = len(COALESCE_SEPARATOR) + len(lane.pending[0].parts[0])
+            if length + extra > Config.MAX_MESSAGE_LENGTH:
+                break
+            length += extra
+            batch.append(lane.pending.popleft())
+        return batch
+
+    async def _send_parts(self, lane: ChannelLane, parts: List[Optional[str]], kwargs: Dict) -> List[discord.Message]:
+        messages = []
+        for i, part in enumerate(parts):
+            if i:
+                await self._take_token(lane)
+            # Attachments and embeds ride on the last chunk
+            extra = kwargs if i == len(parts) - 1 else {}
+            for attempt in range(3):
+                try:
+                    messages.append(await lane.channel.send(part, **extra))
+                    break
+                except discord.HTTPException as e:
+                    if e.status != 429 or attempt == 2:
+                        raise
+                    self._back_off(lane, e)
+                    await self._take_token(lane)
+            self.sent += 1
+            OUTBOUND_MESSAGES.inc('sent')
+        return messages
+
+    def _back_off(self, lane: ChannelLane, error: discord.HTTPException):
+        """Empty the bucket and wait out Discord's Retry-After before the next send."""
+        headers = getattr(error.response, 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('Retry-After', 0))
+        except ValueError:
+            retry_after = 0.0
+        retry_after = retry_after or 1.0 / self.rate
+        lane.tokens = 0.0
+        lane.paused_until = time.monotonic() + retry_after
+        self.rate_limited += 1
+        OUTBOUND_MESSAGES.inc('rate_limited')
+        logger.warning(f"Rate limited sending to channel {lane.channel.id}, pausing {retry_after:.1f}s")
+
+    async def _take_token(self, lane: ChannelLane):
+        while True:
+            now = time.monotonic()
+            lane.tokens = min(self.burst, lane.tokens + (now - lane.refilled) * self.rate)
+            lane.refilled = now
+            if now >= lane.paused_until and lane.tokens >= 1.0:
+                lane.tokens -= 1.0
+                return
+            await asyncio.sleep(max(lane.paused_until - now, (1.0 - lane.tokens) / self.rate, 0.01))
@@ -0,0 +1,217 @@
+"""
+SQLite-backed user context that survives restarts.
+Reads are served from the in-memory ContextStore; writes are batched
+and flushed on a background thread so the event loop never touches disk.
+Several shard processes can share one database file; with a refresh
+interval set, cached records are re-checked against it now and then.
+"""
+
+import time
+import sqlite3
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from context_store import ContextStore, UserContext
+
+logger = logging.getLogger(__name__)
+
+class PersistentContextStore(ContextStore):
+    """ContextStore with write-behind persistence to a local WAL database."""
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        refresh_interval: Optional[float] = None,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self.flush_interval = flush_interval if flush_interval is not None else Config.CONTEXT_FLUSH_INTERVAL
+        self.batch_size = batch_size if batch_size is not None else Config.CONTEXT_FLUSH_BATCH
+        # A single thread owns the connection, which also serializes every query
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-db")
+        self._db = self._connect()
+        self._dirty: Dict[int, UserContext] = {}
+        self._absent: "OrderedDict[int, float]" = OrderedDict()  # Users known not to be on disk, and when we checked
+        # Other processes may write the same users; 0 means this process owns the file
+        self.refresh_interval = refresh_interval if refresh_interval is not None else Config.CONTEXT_SHARED_REFRESH
+        self._synced: Dict[int, Tuple[float, float]] = {}  # user -> (last_seen on disk, when we checked)
+        self._flush_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.db_loads = 0
+        self.db_writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Wait out other processes' write transactions instead of failing
+        db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            """CREATE TABLE IF NOT EXISTS user_context (
+                user_id INTEGER PRIMARY KEY,
+                last_message TEXT NOT NULL,
+                last_response TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            )"""
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_user_context_last_seen ON user_context (last_seen)")
+        db.commit()
+        return db
+
+    async def start(self):
+        """Start the background flusher."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Flush pending writes and close the database."""
+        if self._db is None:
+            return
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self._run(self._db.close)
+        self._db = None
+        self._executor.shutdown(wait=True)
+
+    async def load(self, user_id: int) -> Optional[UserContext]:
+        """Get a user's context, pulling it from disk on a cold miss."""
+        record = self.get(user_id)
+        if record is not None:
+            if self.refresh_interval and user_id not in self._dirty:
+                return await self._refresh(user_id, record)
+            return record
+        if self._known_absent(user_id):
+            return None
+
+        row = await self._run(self._read, user_id, time.time() - self.ttl)
+        # An update may have landed while we were reading
+        if user_id in self._records:
+            return self._records[user_id]
+        if row is None:
+            self._mark_absent(user_id)
+            return None
+
+        self.db_loads += 1
+        return self._adopt(user_id, row)
+
+    def update(self, user_id: int, message: str, response: str) -> UserContext:
+        record = super().update(user_id, message, response)
+        self._synced[user_id] = (record.last_seen, time.monotonic())
+        self._absent.pop(user_id, None)
+        self._dirty[user_id] = record
+        if len(self._dirty) >= self.batch_size:
+            self._flush_event.set()
+        return record
+
+    async def flush(self):
+        """Write all dirty records in one transaction."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        rows = [
+            (user_id, r.last_message, r.last_response, r.message_count, r.last_seen)
+            for user_id, r in batch.items()
+        ]
+        try:
+            await self._run(self._write, rows, time.time() - self.ttl)
+            self.db_writes += len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist user context: {e}")
+            # Put the batch back without clobbering anything newer
+            for user_id, record in batch.items():
+                self._dirty.setdefault(user_id, record)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update({
+            'db_loads': self.db_loads,
+            'db_writes': self.db_writes,
+            'pending_writes': len(self._dirty)
+        })
+        return stats
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def _refresh(self, user_id: int, record: UserContext) -> UserContext:
+        """Pick up a newer row another process wrote, at most once per refresh interval."""
+        disk_seen, checked = self._synced.get(user_id, (0.0, 0.0))
+        if time.monotonic() - checked < self.refresh_interval:
+            return record
+
+        row = await self._run(self._read, user_id, time.time() - self.ttl)
+        self._synced[user_id] = (disk_seen, time.monotonic())
+        if row is None or row[3] <= disk_seen or user_id in self._dirty or self._records.get(user_id) is not record:
+            return self._records.get(user_id, record)
+        self.db_loads += 1
+        return self._adopt(user_id, row)
+
+    def _adopt(self, user_id: int, row: Tuple) -> UserContext:
+        record = UserContext(*row)
+        self._synced[user_id] = (record.last_seen, time.monotonic())
+        record.last_seen = time.time()  # Keep the in-memory LRU ordered by access
+        self.put(user_id, record)
+        return record
+
+    def _remove(self, user_id: int):
+        super()._remove(user_id)
+        self._synced.pop(user_id, None)
+
+    def _known_absent(self, user_id: int) -> bool:
+        checked = self._absent.get(user_id)
+        if checked is None:
+            return False
+        # Another process may have written the row since; look again once the refresh interval is up
+        if self.refresh_interval and time.monotonic() - checked >= self.refresh_interval:
+            del self._absent[user_id]
+            return False
+        return True
+
+    def _mark_absent(self, user_id: int):
+        self._absent[user_id] = time.monotonic()
+        self._absent.move_to_end(user_id)
+        if len(self._absent) > self.max_users:
+            self._absent.popitem(last=False)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _read(self, user_id: int, cutoff: float) -> Optional[Tuple]:
+        # Only recently active users are worth warming back up
+        return self._db.execute(
+            "SELECT last_message, last_response, message_count, last_seen "
+            "FROM user_context WHERE user_id = ? AND last_seen > ?",
+            (user_id, cutoff)
+        ).fetchone()
+
+    def _write(self, rows: List[Tuple], cutoff: float):
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO user_context (user_id, last_message, last_response, message_count, last_seen) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET last_message = excluded.last_message, "
+                "last_response = excluded.last_response, message_count = excluded.message_count, "
+                "last_seen = excluded.last_seen "
+                "WHERE excluded.last_seen >= user_context.last_seen",  # Don't clobber a newer write from another shard
+                rows
+            )
+            self._db.execute("DELETE FROM user_context WHERE last_seen <= ?", (cutoff,))
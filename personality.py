@@ -5,16 +5,84 @@ Handles conversation generation with consistent personality traits.
 
 import os
 import json
+import time
+import asyncio
 import logging
-from openai import OpenAI
-from typing import Dict, Optional
+import threading
+from typing import AsyncIterator, Dict, List, Optional
+from config import Config
+from context_store import UserContext
+from conversation_history import HistoryWindow, Turn, load_encoding
+from prompt_builder import PromptBuilder, PromptLayout
+from response_cache import NEW, REGULAR, ResponseCache, familiarity
+from llm_scheduler import LLMScheduler, LLMBusyError
+from model_router import FIRST_TEXT, FULL, ModelRouter, Route
+from resilience import CLOSED, CircuitBreaker, CircuitOpenError, hedged, time_left, trips_breaker
+from metrics import STAGE_SECONDS, LLM_CALLS, LLM_FALLBACKS
 
 logger = logging.getLogger(__name__)
 
+async def _prepend(first, rest: AsyncIterator) -> AsyncIterator:
+    if first is not None:
+        yield first
+    async for item in rest:
+        yield item
+
+
 class PersonalityEngine:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The OpenAI client is built by warm_up() or on first use
+        self._client = None
+        self._client_lock = threading.Lock()
         self.personality_prompt = self._build_personality_prompt()
+        self.prompts = PromptBuilder(self.personality_prompt)
+        self.response_cache = ResponseCache() if Config.RESPONSE_CACHE_ENABLED else None
+        self.scheduler = LLMScheduler()
+        self.router = ModelRouter(self.scheduler) if Config.ROUTING_ENABLED else None
+        self.breaker = CircuitBreaker() if Config.BREAKER_ENABLED else None
+        
+    @property
+    def client(self):
+        if self._client is None:
+            self._build_client()
+        return self._client
+        
+    async def warm_up(self):
+        """Import openai, build the client and load the tokenizer in a thread, e.g. while the gateway connects.
+
+        Calls made while it's running wait in their own thread, never in the event loop.
+        """
+        if self._client is None:
+            await asyncio.to_thread(self._build_client)
+            
+    def _build_client(self):
+        with self._client_lock:
+            if self._client is not None:
+                return
+            # openai is about half the bot's import time, so it isn't imported until needed
+            load_encoding()
+            import httpx
+            from openai import AsyncOpenAI
+            # One pooled HTTP client shared by every completion so concurrent
+            # conversations reuse keep-alive connections instead of blocking the loop
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=Config.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(Config.OPENAI_TIMEOUT, connect=Config.OPENAI_CONNECT_TIMEOUT)
+            )
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=Config.OPENAI_BASE_URL,
+                http_client=http_client,
+                max_retries=Config.OPENAI_MAX_RETRIES
+            )
+            
+    async def close(self):
+        """Close the pooled HTTP connections."""
+        if self._client is not None:
+            await self._client.close()
         
     def _build_personality_prompt(self) -> str:
         """Build the core personality prompt for the AI."""
@@ -55,46 +123,330 @@ Remember: You're an AI companion who's genuinely interested in connecting with p
     async def generate_response(
         self, 
         message: str, 
-        user_context: Dict, 
+        user_context: Optional[UserContext], 
         is_music_related: bool,
-        username: str
+        username: str,
+        user_id: Optional[int] = None,
+        history: Optional[HistoryWindow] = None,
+        memories: Optional[List[str]] = None,
+        is_dm: bool = False,
+        deadline: Optional[float] = None
     ) -> str:
-        """Generate a personality-driven response."""
+        """Generate a personality-driven response; deadline is when the user stops waiting (time.monotonic())."""
+        route = self.router.route(message, is_music_related, is_dm) if self.router else None
+        cache_key = self._cache_key(message, user_context, is_music_related, history, memories, is_dm, route)
+        if cache_key:
+            cached = self.response_cache.get(cache_key, username)
+            if cached:
+                LLM_CALLS.inc('complete', 'cached')
+                return cached
+                
+        budget = None
+        probe = False
         try:
+            await self.warm_up()
             # Build context-aware prompt
-            context_prompt = self._build_context_prompt(message, user_context, username)
+            layout = self._build_prompt(message, user_context, username, history, memories, cacheable=cache_key is not None)
+            request = self.prompts.request('complete', layout, route)
             
-            # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            # do not change this unless explicitly requested by the user
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": self.personality_prompt},
-                    {"role": "user", "content": context_prompt}
-                ],
-                max_tokens=300,
-                temperature=0.8
-            )
+            # Queueing and the call share the user's deadline; the call also gets a
+            # hard cap on top of the HTTP timeouts so retries can't stretch a reply
+            queued = time.perf_counter()
+            async with self.scheduler.slot(user_id or 0, time_left(deadline, Config.LLM_MAX_WAIT)):
+                started = time.perf_counter()
+                STAGE_SECONDS.observe(started - queued, 'queue')
+                # Checked once admitted, so replies queued before the breaker opened don't pile on
+                probe = self._admit()
+                budget = time_left(deadline, Config.OPENAI_TIMEOUT)
+                response = await hedged(
+                    lambda: self.client.chat.completions.create(**request),
+                    budget, self._hedge_after(), self.scheduler.try_acquire, self.scheduler.release
+                )
+            if route:
+                self.router.record(route, time.perf_counter() - started, FULL)
+            if self.breaker:
+                self.breaker.success(probe)
             
-            return response.choices[0].message.content.strip()
+            LLM_CALLS.inc('complete', 'ok')
+            self.prompts.record_usage(layout, response.usage)
+            reply = response.choices[0].message.content.strip()
+            if cache_key:
+                self.response_cache.put(cache_key, reply, username)
+            return reply
             
+        except asyncio.CancelledError:
+            if self.breaker:
+                self.breaker.release(probe)
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            if "insufficient_quota" in str(e) or "429" in str(e):
-                return "Hey gorgeous, my AI brain needs some OpenAI credits to work properly 🖤 The bot owner needs to add billing info or credits to their OpenAI account. Until then, I can still help with music commands like !recommend or !vibe!"
-            return "Ugh, my mind's like a broken record right now... give me a sec? 💀"
+            LLM_CALLS.inc('complete', 'shed' if isinstance(e, LLMBusyError) else 'error')
+            self.note_failure(e, cut_short=budget is None or budget < Config.OPENAI_TIMEOUT, probe=probe)
+            return self.fallback_response(e)
+            
+    async def stream_response(
+        self, 
+        message: str, 
+        user_context: Optional[UserContext], 
+        is_music_related: bool,
+        username: str,
+        user_id: Optional[int] = None,
+        history: Optional[HistoryWindow] = None,
+        memories: Optional[List[str]] = None,
+        is_dm: bool = False,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Stream a personality-driven response as text deltas."""
+        route = self.router.route(message, is_music_related, is_dm) if self.router else None
+        cache_key = self._cache_key(message, user_context, is_music_related, history, memories, is_dm, route)
+        if cache_key:
+            cached = self.response_cache.get(cache_key, username)
+            if cached:
+                LLM_CALLS.inc('stream', 'cached')
+                yield cached
+                return
+                
+        parts = []
+        budget = None
+        probe = False
+        settled = False
+        try:
+            await self.warm_up()
+            layout = self._build_prompt(message, user_context, username, history, memories, cacheable=cache_key is not None)
+            request = self.prompts.request('stream', layout, route)
+            # The slot is held until the stream is drained
+            queued = time.perf_counter()
+            async with self.scheduler.slot(user_id or 0, time_left(deadline, Config.LLM_MAX_WAIT)):
+                started = time.perf_counter()
+                STAGE_SECONDS.observe(started - queued, 'queue')
+                probe = self._admit()
+                # Only the wait for the first chunk is capped here; stalls between
+                # chunks are bounded by the pooled client's read timeout
+                budget = time_left(deadline, Config.OPENAI_TIMEOUT)
+                stream, chunks, first = await hedged(
+                    lambda: self._open_stream(request),
+                    budget, self._hedge_after(), self.scheduler.try_acquire, self.scheduler.release,
+                    discard=lambda opened: opened[0].close()
+                )
+                if self.breaker:
+                    self.breaker.success(probe)
+                # The probe is settled; a later failure in this stream is an ordinary one
+                probe = False
+                settled = True
+                
+                async for chunk in _prepend(first, chunks):
+                    if chunk.usage:
+                        # Arrives in a final chunk without choices
+                        self.prompts.record_usage(layout, chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if route and not parts:
+                            # Time to first text; the rest is paced by our own Discord edits
+                            self.router.record(route, time.perf_counter() - started, FIRST_TEXT)
+                        parts.append(chunk.choices[0].delta.content)
+                        yield parts[-1]
+            LLM_CALLS.inc('stream', 'ok')
+        except Exception as e:
+            settled = True
+            LLM_CALLS.inc('stream', 'shed' if isinstance(e, LLMBusyError) else 'error')
+            self.note_failure(e, cut_short=budget is None or budget < Config.OPENAI_TIMEOUT, probe=probe)
+            raise
+        finally:
+            if not settled and self.breaker:
+                # Cancelled, or the reader stopped, before OpenAI answered
+                self.breaker.release(probe)
+                
+        # Only complete streams are worth replaying
+        if cache_key and parts:
+            self.response_cache.put(cache_key, "".join(parts).strip(), username)
             
-    def _build_context_prompt(self, message: str, user_context: Dict, username: str) -> str:
-        """Build context-aware prompt for the conversation."""
+    async def _open_stream(self, request: Dict):
+        """Start a stream and wait for its first chunk, so a hedge races the whole wait."""
+        stream = await self.client.chat.completions.create(**request)
+        chunks = stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, chunks, first
+        
+    def _admit(self) -> bool:
+        """Check the breaker; True if this call holds its half-open probe."""
+        if self.breaker is None:
+            return False
+        probe = self.breaker.allow()
+        if probe is None:
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+        return probe
+            
+    def _hedge_after(self) -> float:
+        # Hedging adds load, so never while OpenAI is already struggling
+        if self.breaker and self.breaker.state != CLOSED:
+            return 0.0
+        return Config.HEDGE_AFTER
+        
+    def _cache_key(
+        self,
+        message: str,
+        user_context: Optional[UserContext],
+        is_music_related: bool,
+        history: Optional[HistoryWindow] = None,
+        memories: Optional[List[str]] = None,
+        is_dm: bool = False,
+        route: Optional[Route] = None
+    ):
+        # A reply that has to follow an ongoing conversation or recall the user can't come from the cache
+        if self.response_cache is None or (history and history.turns) or memories:
+            return None
+        return self.response_cache.make_key(message, user_context, is_music_related, is_dm, route)
+        
+    async def summarize(self, summary: str, turns: List[Turn]) -> str:
+        """Fold aged-out turns into a conversation's running summary."""
+        if self.scheduler.queue_depth:
+            # Live replies come first; the turns stay pending until it's quiet
+            raise LLMBusyError("deferring summary while replies are queued")
+        if self.breaker and self.breaker.is_open:
+            raise CircuitOpenError("deferring summary while OpenAI is failing")
+            
+        transcript = "\n".join(f"{'User' if turn.role == 'user' else 'Raven'}: {turn.text}" for turn in turns)
+        prompt = (
+            f"Summary so far: {summary or '(none)'}\n\nNew messages:\n{transcript}\n\n"
+            "Update the summary in a few short sentences. Keep names, bands, feelings and "
+            "anything the user asked Raven to remember. Reply with the summary only."
+        )
+        await self.warm_up()
+        async with self.scheduler.slot(0):
+            try:
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=Config.MODEL_STANDARD,
+                        messages=[
+                            {"role": "system", "content": "You keep concise notes about a chat between a user and Raven."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=Config.HISTORY_SUMMARY_TOKENS,
+                        temperature=0.3
+                    ),
+                    timeout=Config.OPENAI_TIMEOUT
+                )
+            except Exception:
+                LLM_CALLS.inc('summary', 'error')
+                raise
+        LLM_CALLS.inc('summary', 'ok')
+        return response.choices[0].message.content
+                
+    async def write_variations(self, instructions: str, count: int) -> List[str]:
+        """Several one-line replies in Raven's voice, for the pre-generated command pools."""
+        if self.scheduler.queue_depth:
+            raise LLMBusyError("deferring pool refill while replies are queued")
+        if self.breaker and self.breaker.is_open:
+            raise CircuitOpenError("deferring pool refill while OpenAI is failing")
+            
+        await self.warm_up()
+        async with self.scheduler.slot(0):
+            try:
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=Config.MODEL_STANDARD,
+                        messages=[
+                            self.prompts.system_message,
+                            {"role": "user", "content": f"{instructions}\n\nWrite {count} different ones, one per line, with no numbering or commentary."}
+                        ],
+                        max_tokens=60 * count,
+                        temperature=1.0
+                    ),
+                    timeout=Config.OPENAI_TIMEOUT
+                )
+            except Exception:
+                LLM_CALLS.inc('pool', 'error')
+                raise
+        LLM_CALLS.inc('pool', 'ok')
+        return response.choices[0].message.content.splitlines()
+                
+    def note_failure(self, error: Exception, cut_short: bool = False, probe: bool = False):
+        """Let admission control and the circuit breaker react to a failed completion; probe is what _admit() returned."""
+        from openai import RateLimitError
+        if isinstance(error, RateLimitError):
+            self.scheduler.throttle(Config.LLM_RATE_LIMIT_COOLDOWN)
+        if self.breaker is None or isinstance(error, CircuitOpenError):
+            return
+        # Running out of the user's own deadline says nothing about OpenAI
+        if trips_breaker(error) and not (cut_short and isinstance(error, asyncio.TimeoutError)):
+            self.breaker.failure(probe)
+        else:
+            self.breaker.release(probe)
+            
+    def fallback_response(self, error: Exception) -> str:
+        """Pick the in-character reply for a failed completion."""
+        from openai import APITimeoutError
+        if isinstance(error, CircuitOpenError):
+            LLM_FALLBACKS.inc('breaker')
+            return "My head's all static right now, babe... I'll be back soon 🖤 Until then !recommend and !vibe still work!"
+        if isinstance(error, LLMBusyError):
+            LLM_FALLBACKS.inc('busy')
+            return "Babe, everyone's talking to me at once and my head's spinning... give me a minute and try again? 🥀"
+        if isinstance(error, (asyncio.TimeoutError, APITimeoutError)):
+            LLM_FALLBACKS.inc('timeout')
+            return "Ugh, my thoughts are moving slower than a Cure ballad right now... ask me again? 🌙"
+        if "insufficient_quota" in str(error) or "429" in str(error):
+            LLM_FALLBACKS.inc('quota')
+            return "Hey gorgeous, my AI brain needs some OpenAI credits to work properly 🖤 The bot owner needs to add billing info or credits to their OpenAI account. Until then, I can still help with music commands like !recommend or !vibe!"
+        LLM_FALLBACKS.inc('error')
+        return "Ugh, my mind's like a broken record right now... give me a sec? 💀"
+            
+    def _build_prompt(
+        self,
+        message: str,
+        user_context: Optional[UserContext],
+        username: str,
+        history: Optional[HistoryWindow] = None,
+        memories: Optional[List[str]] = None,
+        cacheable: bool = False
+    ) -> PromptLayout:
+        """Stable persona/history prefix with this message's context as the tail."""
+        has_history = bool(history and history.turns)
+        tail = self._build_context_prompt(message, user_context, username, has_history, memories, cacheable)
+        return self.prompts.build(history.key if history else None, tail, username, history)
+        
+    def _build_context_prompt(
+        self,
+        message: str,
+        user_context: Optional[UserContext],
+        username: str,
+        has_history: bool = False,
+        memories: Optional[List[str]] = None,
+        cacheable: bool = False
+    ) -> str:
+        """Build context-aware prompt for the conversation.
+
+        A cacheable prompt may be answered for other users, so it describes this
+        one only by how familiar they are, never by what they said.
+        """
         context = f"User '{username}' says: {message}"
         
-        if user_context.get('message_count', 0) > 0:
-            context += f"\n\nContext: This user has messaged {user_context['message_count']} times before."
-            if user_context.get('last_message'):
-                context += f" Their last message was: '{user_context['last_message']}'"
+        if cacheable:
+            known = familiarity(user_context)
+            if known == NEW:
+                context += "\n\nContext: This is a new conversation with this user."
+            elif known == REGULAR:
+                context += "\n\nContext: This user is a regular who has messaged you many times."
+            else:
+                context += "\n\nContext: This user has messaged you a few times before."
+        elif user_context and user_context.message_count > 0:
+            context += f"\n\nContext: This user has messaged {user_context.message_count} times before."
+            # Recent turns are already in the prompt when there is history
+            if user_context.last_message and not has_history:
+                context += f" Their last message was: '{user_context.last_message}'"
         else:
             context += "\n\nContext: This is a new conversation with this user."
             
+        if memories:
+            # Only the few snippets relevant to this message, never the whole history
+            context += "\n\nThings they've told you before that may be relevant:\n"
+            context += "\n".join(f"- {memory}" for memory in memories)
+            
         return context
         
     async def get_flirty_response(self, username: str) -> str:
@@ -0,0 +1,118 @@
+"""
+Prompt assembly with a byte-stable prefix.
+Requests are laid out from least to most volatile (persona, conversation summary,
+recent turns, then this message's context) so consecutive requests share as
+long a prefix as possible for the API's prompt cache. Static pieces are built
+once and reused; each request records how much of its prefix should be reusable.
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from conversation_history import HistoryWindow, count_tokens
+from model_router import Route, FAST, STANDARD
+from metrics import PROMPT_TOKENS, PROMPT_CACHED_TOKENS
+
+logger = logging.getLogger(__name__)
+
+class PromptLayout:
+    """Messages for one request plus its prefix accounting."""
+
+    __slots__ = ('messages', 'prompt_tokens', 'prefix_tokens', 'reused_tokens')
+
+    def __init__(self, messages: List[Dict[str, str]], prompt_tokens: int, prefix_tokens: int, reused_tokens: int):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.prefix_tokens = prefix_tokens
+        self.reused_tokens = reused_tokens
+
+
+class PromptBuilder:
+    """Builds chat requests from prebuilt skeletons and a stable message prefix."""
+
+    def __init__(self, system_prompt: str, max_conversations: Optional[int] = None):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self._system_tokens: Optional[int] = None  # Counted on first use, so building this never loads the tokenizer
+        self.max_conversations = max_conversations or Config.HISTORY_MAX_CONVERSATIONS
+        standard = {"model": Config.MODEL_STANDARD, "max_tokens": Config.ROUTE_MAX_TOKENS, "temperature": Config.PERSONALITY_TEMPERATURE}
+        fast = dict(standard, model=Config.MODEL_FAST, temperature=Config.FAST_TEMPERATURE)
+        self._skeletons: Dict[Tuple[str, str], Dict] = {}
+        for tier, base in ((STANDARD, standard), (FAST, fast)):
+            self._skeletons[('complete', tier)] = base
+            self._skeletons[('stream', tier)] = dict(base, stream=True, stream_options={"include_usage": True})
+        # Fingerprint of each conversation's last prefix, to see what carried over
+        self._last_prefix: "OrderedDict[Tuple[int, int], Tuple[int, ...]]" = OrderedDict()
+        self._persona_sent = False
+
+    @property
+    def system_tokens(self) -> int:
+        if self._system_tokens is None:
+            self._system_tokens = count_tokens(self.system_message["content"])
+        return self._system_tokens
+
+    def request(self, mode: str, layout: PromptLayout, route: Optional[Route] = None) -> Dict:
+        """Keyword arguments for chat.completions.create, on the routed tier if there is one."""
+        if route is None:
+            return dict(self._skeletons[(mode, STANDARD)], messages=layout.messages)
+        return dict(self._skeletons[(mode, route.tier)], max_tokens=route.max_tokens, messages=layout.messages)
+
+    def build(
+        self,
+        conversation: Optional[Tuple[int, int]],
+        tail: str,
+        username: str,
+        history: Optional[HistoryWindow] = None
+    ) -> PromptLayout:
+        """Persona, then summary and turns if any, then the tail as the final user message."""
+        messages = [self.system_message]
+        fingerprint = []
+        segment_tokens = [self.system_tokens]
+        if history and history.summary:
+            summary = f"Earlier in your conversation with {username}: {history.summary}"
+            messages.append({"role": "system", "content": summary})
+            fingerprint.append(hash(summary))
+            segment_tokens.append(history.summary_tokens)
+        if history:
+            for turn in history.turns:
+                messages.append(turn.message)
+                fingerprint.append(hash(turn.text))
+                segment_tokens.append(turn.tokens)
+        messages.append({"role": "user", "content": tail})
+
+        prefix_tokens = sum(segment_tokens)
+        reused_tokens = self._reused(conversation, tuple(fingerprint), segment_tokens)
+        tail_tokens = count_tokens(tail)
+        PROMPT_TOKENS.inc('prefix_reused', amount=reused_tokens)
+        PROMPT_TOKENS.inc('prefix_new', amount=prefix_tokens - reused_tokens)
+        PROMPT_TOKENS.inc('tail', amount=tail_tokens)
+        return PromptLayout(messages, prefix_tokens + tail_tokens, prefix_tokens, reused_tokens)
+
+    def record_usage(self, layout: PromptLayout, usage):
+        """Log what the API actually served from its prompt cache."""
+        details = getattr(usage, 'prompt_tokens_details', None) if usage else None
+        cached = getattr(details, 'cached_tokens', None) or 0
+        PROMPT_CACHED_TOKENS.inc(amount=cached)
+        logger.debug(
+            f"Prompt {getattr(usage, 'prompt_tokens', layout.prompt_tokens)} tokens: "
+            f"{layout.reused_tokens}/{layout.prefix_tokens} prefix reusable, {cached} cached by the API"
+        )
+
+    def _reused(self, conversation: Optional[Tuple[int, int]], fingerprint: Tuple[int, ...], segment_tokens: List[int]) -> int:
+        # The persona is shared by every request once one has gone out
+        reused = self.system_tokens if self._persona_sent else 0
+        self._persona_sent = True
+        if conversation is None:
+            return reused
+
+        previous = self._last_prefix.get(conversation, ())
+        for i, (before, now) in enumerate(zip(previous, fingerprint)):
+            if before != now:
+                break
+            reused += segment_tokens[i + 1]
+
+        self._last_prefix[conversation] = fingerprint
+        self._last_prefix.move_to_end(conversation)
+        while len(self._last_prefix) > self.max_conversations:
+            self._last_prefix.popitem(last=False)
+        return reused
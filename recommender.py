@@ -0,0 +1,167 @@
+"""
+Similarity-based music recommendations.
+Each band becomes a feature vector (genre, era, vibe tags) in one
+precomputed matrix, so a query is a single batched matrix product.
+"""
+
+import re
+import zlib
+import random
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import Config
+from music_catalog import MusicCatalog
+
+DECADES = list(range(1950, 2040, 10))
+VIBE_DIMS = 64
+NEIGHBOUR_CACHE_SIZE = 64  # Neighbours kept per cached query
+STOPWORDS = {
+    'the', 'and', 'with', 'that', 'who', 'for', 'over', 'meets', 'made', 'without',
+    'their', 'its', 'from', 'into', 'your', 'you', 'all', 'like'
+}
+
+# Relative weight of each feature block before rows are normalized
+GENRE_WEIGHT = 1.0
+ERA_WEIGHT = 0.5
+ACTIVE_WEIGHT = 0.3
+VIBE_WEIGHT = 0.8
+
+class Recommender:
+    """Nearest-neighbour recommendations over a band feature matrix."""
+
+    def __init__(self, catalog: MusicCatalog):
+        self.catalog = catalog
+        self.genres = catalog.genres()
+        self._genre_index = {genre: i for i, genre in enumerate(self.genres)}
+        self._era_offset = len(self.genres)
+        self._vibe_offset = self._era_offset + len(DECADES) + 1
+        self.dims = self._vibe_offset + VIBE_DIMS
+
+        band_ids = []
+        rows = []
+        for band_id, genre, era, vibe in catalog.iter_band_features():
+            band_ids.append(band_id)
+            rows.append(self._features(genre, era, vibe))
+        self.band_ids = np.array(band_ids, dtype=np.int64)
+        self.matrix = self._normalize(np.array(rows, dtype=np.float32).reshape(len(rows), self.dims))
+        self._row_of = {band_id: row for row, band_id in enumerate(band_ids)}
+
+        # Genre centroids answer "recommend <genre>" without touching individual bands
+        centroids = np.zeros((len(self.genres), self.dims), dtype=np.float32)
+        for genre, i in self._genre_index.items():
+            rows = [self._row_of[band_id] for band_id in catalog.band_ids(genre)]
+            if rows:
+                centroids[i] = self.matrix[rows].mean(axis=0)
+        self.genre_centroids = self._normalize(centroids)
+
+        # Genre neighbourhoods are scored up front in one batch; band ones fill in lazily
+        self._neighbours: "OrderedDict[Tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        if self.genres and len(self.band_ids):
+            batch = self.nearest(self.genre_centroids, NEIGHBOUR_CACHE_SIZE)
+            for genre, result in zip(self.genres, batch):
+                self._neighbours[('genre', genre)] = result
+
+    def _features(self, genre: str, era: str, vibe: str) -> np.ndarray:
+        vec = np.zeros(self.dims, dtype=np.float32)
+        vec[self._genre_index[genre]] = GENRE_WEIGHT
+
+        match = re.search(r'\d{4}', era)
+        if match:
+            decade = min(max(int(match.group()) // 10 * 10, DECADES[0]), DECADES[-1])
+            vec[self._era_offset + DECADES.index(decade)] = ERA_WEIGHT
+        if 'present' in era:
+            vec[self._era_offset + len(DECADES)] = ACTIVE_WEIGHT
+
+        tags = self.vibe_tags(vibe)
+        for tag in tags:
+            vec[self._vibe_offset + zlib.crc32(tag.encode()) % VIBE_DIMS] += VIBE_WEIGHT / np.sqrt(len(tags))
+        return vec
+
+    @staticmethod
+    def vibe_tags(text: str) -> List[str]:
+        """Descriptive words from a vibe blurb."""
+        return [word for word in re.findall(r"[a-z]+", text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def genre_vector(self, genre: str) -> Optional[np.ndarray]:
+        i = self._genre_index.get(genre)
+        return None if i is None else self.genre_centroids[i]
+
+    def band_vector(self, band_id: int) -> Optional[np.ndarray]:
+        row = self._row_of.get(band_id)
+        return None if row is None else self.matrix[row]
+
+    def nearest(self, queries: np.ndarray, k: int, exclude: Optional[List[Iterable[int]]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k (band ids, scores) for each query vector, scored in one matrix product."""
+        scores = np.atleast_2d(queries) @ self.matrix.T
+        results = []
+        for i, row_scores in enumerate(scores):
+            available = len(row_scores)
+            if exclude and exclude[i]:
+                rows = [self._row_of[band_id] for band_id in exclude[i] if band_id in self._row_of]
+                row_scores[rows] = -np.inf
+                available -= len(rows)
+            top = min(k, available)
+            if top <= 0:
+                results.append((self.band_ids[:0], row_scores[:0]))
+                continue
+            candidates = np.argpartition(-row_scores, top - 1)[:top]
+            ordered = candidates[np.argsort(-row_scores[candidates])]
+            results.append((self.band_ids[ordered], row_scores[ordered]))
+        return results
+
+    def neighbours(self, key: Tuple, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached nearest neighbours for a genre or band query."""
+        cached = self._neighbours.get(key)
+        if cached is None:
+            cached = self._neighbours[key] = self.nearest(query, NEIGHBOUR_CACHE_SIZE)[0]
+            if len(self._neighbours) > Config.RECOMMEND_CACHE_QUERIES:
+                self._neighbours.popitem(last=False)
+        else:
+            self._neighbours.move_to_end(key)
+        return cached
+
+    def recommend(
+        self,
+        genre: Optional[str] = None,
+        band_id: Optional[int] = None,
+        count: int = 3,
+        exclude: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        """Recommend bands similar to a band or a genre, skipping any excluded ids."""
+        if band_id is not None:
+            key, query = ('band', band_id), self.band_vector(band_id)
+        else:
+            genre = genre or random.choice(self.genres)
+            key, query = ('genre', genre), self.genre_vector(genre)
+        if query is None:
+            return []
+
+        exclude = set(exclude or ())
+        if band_id is not None:
+            exclude.add(band_id)
+
+        ids, scores = self.neighbours(key, query)
+        if exclude:
+            keep = np.fromiter((band_id not in exclude for band_id in ids.tolist()), dtype=bool, count=len(ids))
+            ids, scores = ids[keep], scores[keep]
+            # Heavy exclusions can exhaust the cached neighbourhood; rescore everything once
+            if len(ids) < count and len(keep) == NEIGHBOUR_CACHE_SIZE:
+                ids, scores = self.nearest(query, count * Config.RECOMMEND_POOL_FACTOR, [exclude])[0]
+        if not len(ids):
+            return []
+
+        # Sample from the close neighbourhood so repeats feel less canned, but never
+        # reach for far-off bands while close ones remain
+        pool_size = count * Config.RECOMMEND_POOL_FACTOR
+        close = int(np.count_nonzero(scores[:pool_size] >= scores[0] - Config.RECOMMEND_SCORE_MARGIN))
+        pool = ids[:max(close, min(count, len(ids)))].tolist()
+        picked = random.sample(pool, min(count, len(pool)))
+        picked.sort(key=pool.index)
+        return [self.catalog.band(band_id) for band_id in picked]
@@ -0,0 +1,198 @@
+"""
+Failure handling for OpenAI calls.
+A circuit breaker stops sending completions after repeated rate limits,
+timeouts and outages so replies come from local music knowledge at once
+instead of each waiting to fail; deadlines carry how long the user will still
+wait down into queueing and the call itself; hedged requests race a second
+completion against one that is running slow.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+from config import Config
+from llm_scheduler import LLMBusyError
+from metrics import BREAKER_TRANSITIONS, HEDGED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'  # Cooldown over; one probe call decides whether to close
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # For sharing state across processes
+
+class CircuitOpenError(LLMBusyError):
+    """Raised instead of calling OpenAI while the breaker is open."""
+
+
+def trips_breaker(error: Exception) -> bool:
+    """Failures that say OpenAI itself is struggling, rather than one bad request."""
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    # APITimeoutError is an APIConnectionError
+    return isinstance(error, (RateLimitError, APIConnectionError, InternalServerError, asyncio.TimeoutError))
+
+
+def time_left(deadline: Optional[float], cap: float) -> float:
+    """Seconds until deadline (a time.monotonic() value), at most cap; raises once it has passed."""
+    if deadline is None:
+        return cap
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise asyncio.TimeoutError()
+    return min(cap, left)
+
+
+class CircuitBreaker:
+    """Opens after repeated failures in a window, then lets one probe through per cooldown."""
+
+    def __init__(
+        self,
+        threshold: Optional[int] = None,
+        window: Optional[float] = None,
+        cooldown: Optional[float] = None,
+        on_change: Optional[Callable[[str], None]] = None
+    ):
+        self.threshold = threshold or Config.BREAKER_FAILURES
+        self.window = window or Config.BREAKER_WINDOW
+        self.cooldown = cooldown or Config.BREAKER_COOLDOWN
+        self.on_change = on_change
+        self.state = CLOSED
+        self._failures: Deque[float] = deque()
+        self._opened_at = 0.0
+        self._open_for = self.cooldown
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Whether a call would be refused right now."""
+        if self.state == OPEN:
+            return time.monotonic() - self._opened_at < self._open_for
+        return self.state == HALF_OPEN and self._probing
+
+    def allow(self) -> Optional[bool]:
+        """Claim permission for one call: None if refused, else whether this call is the half-open probe.
+
+        Callers pass that flag back to success(), failure() or release(), so only
+        the probe's own outcome can close the breaker or free the probe slot.
+        """
+        if self.state == CLOSED:
+            return False
+        if self.is_open:
+            self.rejected += 1
+            return None
+        if self.state == OPEN:
+            self._set(HALF_OPEN)
+        self._probing = True
+        return True
+
+    def success(self, probe: bool = False):
+        if self.state == CLOSED:
+            self._failures.clear()
+        elif probe:
+            self._probing = False
+            self._failures.clear()
+            self._open_for = self.cooldown
+            self._set(CLOSED)
+
+    def failure(self, probe: bool = False):
+        now = time.monotonic()
+        if self.state == OPEN:
+            return  # Calls that started before it opened
+        if self.state == HALF_OPEN:
+            if probe:
+                # The probe failed too; stay away for longer
+                self._probing = False
+                self._open_for = min(self._open_for * 2, Config.BREAKER_MAX_COOLDOWN)
+                self._trip(now)
+            return
+        self._failures.append(now)
+        while self._failures and now - self._failures[0] > self.window:
+            self._failures.popleft()
+        if len(self._failures) >= self.threshold:
+            self._trip(now)
+
+    def release(self, probe: bool = False):
+        """The call ended without saying anything about OpenAI's health."""
+        if probe:
+            self._probing = False
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'open': self.is_open,
+            'trips': self.trips,
+            'rejected': self.rejected,
+            'recent_failures': len(self._failures)
+        }
+
+    def _trip(self, now: float):
+        self._opened_at = now
+        self._failures.clear()
+        self.trips += 1
+        logger.warning(f"OpenAI circuit breaker open for {self._open_for:.0f}s")
+        self._set(OPEN)
+
+    def _set(self, state: str):
+        self.state = state
+        BREAKER_TRANSITIONS.inc(state)
+        if self.on_change:
+            self.on_change(state)
+
+
+async def hedged(
+    attempt: Callable[[], Awaitable],
+    timeout: float,
+    hedge_after: float,
+    acquire_extra: Callable[[], bool],
+    release_extra: Callable[[], None],
+    discard: Optional[Callable[[object], Awaitable]] = None
+):
+    """Run attempt(); if it's still going after hedge_after and a spare slot is free, race a second one.
+
+    The first success wins and the other attempt is cancelled (or its result
+    discarded); if every attempt fails the last error is raised.
+    """
+    started = time.monotonic()
+    first = asyncio.ensure_future(attempt())
+    tasks = [first]
+    extra = False
+    winner = None
+    try:
+        if 0 < hedge_after < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and acquire_extra():
+                extra = True
+                HEDGED_REQUESTS.inc('sent')
+                tasks.append(asyncio.ensure_future(attempt()))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            left = timeout - (time.monotonic() - started)
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    if extra:
+                        HEDGED_REQUESTS.inc('won' if task is not first else 'lost')
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None and discard:
+                await discard(task.result())
+        if extra:
+            release_extra()
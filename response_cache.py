@@ -0,0 +1,140 @@
+"""
+Cache of AI responses keyed on normalized messages.
+Near-identical small talk ("hi raven", "recommend metal") is answered from
+memory; a small pool of variants per key keeps replies from feeling canned.
+Cacheable prompts describe the user only by a coarse familiarity bucket, so a
+reply never carries anything one user said to another.
+"""
+
+import re
+import time
+import random
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from context_store import UserContext
+
+USERNAME_PLACEHOLDER = "\x00user\x00"
+NEW = 'new'
+RETURNING = 'returning'
+REGULAR = 'regular'
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_REPEATS = re.compile(r"(.)\1{2,}")
+_SPACES = re.compile(r"\s+")
+
+def familiarity(user_context: Optional[UserContext]) -> str:
+    """How well the bot knows a user, the only per-user detail a cached prompt carries."""
+    count = user_context.message_count if user_context else 0
+    if count == 0:
+        return NEW
+    return REGULAR if count >= Config.RESPONSE_CACHE_REGULAR_AFTER else RETURNING
+
+
+class CacheEntry:
+    """Response variants collected for one normalized prompt."""
+
+    __slots__ = ('variants', 'created', 'last_served')
+
+    def __init__(self, created: float):
+        self.variants: List[str] = []
+        self.created = created
+        self.last_served = -1
+
+
+def _name_pattern(username: str) -> "re.Pattern":
+    """The name as a whole word, so "Al" is found in "hey Al!" but not in "Always"."""
+    return re.compile(rf"(?<!\w){re.escape(username)}(?!\w)")
+
+
+class ResponseCache:
+    """TTL + LRU cache of completions with a per-key variety pool."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None, variants: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        self.variants = max(1, variants if variants is not None else Config.RESPONSE_CACHE_VARIANTS)
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypassed = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Fold case, punctuation, stretched letters and spacing."""
+        text = _NON_WORD.sub(" ", message.lower())
+        text = _REPEATS.sub(r"\1\1", text)
+        return _SPACES.sub(" ", text).strip()
+
+    def make_key(
+        self,
+        message: str,
+        user_context: Optional[UserContext],
+        is_music_related: bool,
+        is_dm: bool = False,
+        route=None
+    ) -> Optional[Tuple]:
+        """Key for a prompt, or None when it's too specific to be worth caching."""
+        text = self.normalize(message)
+        if not text or len(text) > Config.RESPONSE_CACHE_MAX_KEY_CHARS:
+            self.bypassed += 1
+            return None
+        # DM and guild replies, and the model tiers, differ in model and token cap
+        model = (route.tier, route.max_tokens) if route else None
+        return (text, is_music_related, is_dm, model, familiarity(user_context))
+
+    def get(self, key: Tuple, username: str) -> Optional[str]:
+        """A cached reply once the variety pool is full, personalized for username."""
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None and now - entry.created > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None or len(entry.variants) < self.variants:
+            # Keep asking the model until there are enough variants to rotate through
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        choices = [i for i in range(len(entry.variants)) if i != entry.last_served] or [0]
+        entry.last_served = random.choice(choices)
+        return entry.variants[entry.last_served].replace(USERNAME_PLACEHOLDER, username)
+
+    def put(self, key: Tuple, response: str, username: str):
+        """Store a fresh completion as one of the key's variants."""
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is None or now - entry.created > self.ttl:
+            entry = self._entries[key] = CacheEntry(now)
+        self._entries.move_to_end(key)
+
+        # Never hand one user's name to somebody else, but leave words that merely contain it
+        template = _name_pattern(username).sub(USERNAME_PLACEHOLDER, response) if username else response
+        if len(entry.variants) < self.variants:
+            entry.variants.append(template)
+            self.fills += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Counters for monitoring the cache."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'fills': self.fills,
+            'bypassed': self.bypassed,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
@@ -0,0 +1,155 @@
+"""
+Pre-generated replies for the canned commands.
+!vibe, !lyrics and the flirty greeting answer instantly from memory; a
+background task keeps a pool of fresh AI-written lines for each, topping a
+pool up when it runs low, only while the LLM is idle and within an hourly
+call budget. An empty pool falls back to the command's static list.
+"""
+
+import re
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from config import Config
+from metrics import POOLED_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+USERNAME = "{username}"  # Placeholder the model writes where a name goes
+
+POOL_PROMPTS = {
+    'greeting': (
+        "Greet someone who just asked for a vibe check. Flirty and playful, one sentence, "
+        f"one or two emojis. Write {USERNAME} literally, exactly once, where their name goes."
+    ),
+    'vibe': (
+        "Describe your current vibe in one short line, naming a punk, pop punk, emo, metal "
+        "or goth band or song that fits it, with one emoji."
+    ),
+    'lyrics': (
+        "Write an original two-line lyric in the style of 2000s emo, both lines on one line "
+        "separated by ' / ', in double quotes, followed by ' - Raven' and one emoji. "
+        "Never quote or paraphrase real songs."
+    )
+}
+
+_LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+")
+
+Writer = Callable[[str, int], Awaitable[List[str]]]
+
+class ResponsePools:
+    """Per-command pools of AI-written lines, refilled in the background."""
+
+    def __init__(
+        self,
+        writer: Writer,
+        is_idle: Callable[[], bool],
+        size: Optional[int] = None,
+        low_water: Optional[int] = None,
+        calls_per_hour: Optional[float] = None
+    ):
+        self.writer = writer
+        self.is_idle = is_idle
+        self.size = size or Config.RESPONSE_POOL_SIZE
+        self.low_water = low_water or Config.RESPONSE_POOL_LOW_WATER
+        self.rate = (calls_per_hour or Config.RESPONSE_POOL_CALLS_PER_HOUR) / 3600.0
+        self._pools: Dict[str, Deque[str]] = {kind: deque() for kind in POOL_PROMPTS}
+        # Room for one refill of every pool at startup, then the hourly rate
+        self.burst = float(len(POOL_PROMPTS))
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.refills = 0
+        self.failures = 0
+
+    async def start(self):
+        self._wake.set()  # Every pool starts empty
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def take(self, kind: str, username: Optional[str] = None) -> Optional[str]:
+        """A fresh line from the pool, or None to use the static list."""
+        pool = self._pools[kind]
+        if len(pool) <= self.low_water:
+            self._wake.set()
+        if not pool:
+            POOLED_RESPONSES.inc(kind, 'static')
+            return None
+        # Random pick so lines from one batch don't come out in order
+        pool.rotate(-random.randrange(len(pool)))
+        line = pool.popleft()
+        POOLED_RESPONSES.inc(kind, 'pool')
+        return line.replace(USERNAME, username) if username else line
+
+    def stats(self) -> Dict:
+        return {
+            'pools': {kind: len(pool) for kind, pool in self._pools.items()},
+            'refills': self.refills,
+            'failures': self.failures,
+            'budget': self._tokens
+        }
+
+    def sizes(self) -> Dict:
+        return {(kind,): len(pool) for kind, pool in self._pools.items()}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), Config.RESPONSE_POOL_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Emptiest pool first
+            for kind in sorted(self._pools, key=lambda k: len(self._pools[k])):
+                if len(self._pools[kind]) > self.low_water:
+                    continue
+                if not self.is_idle() or not self._spend():
+                    break
+                await self._refill(kind)
+
+    def _spend(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    async def _refill(self, kind: str):
+        pool = self._pools[kind]
+        wanted = self.size - len(pool)
+        try:
+            lines = await self.writer(POOL_PROMPTS[kind], wanted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.debug(f"Couldn't refill the {kind} pool: {e}")
+            return
+
+        for line in lines:
+            line = self._clean(kind, line)
+            if line and line not in pool and len(pool) < self.size:
+                pool.append(line)
+        self.refills += 1
+        logger.info(f"Refilled the {kind} pool to {len(pool)} lines")
+
+    @staticmethod
+    def _clean(kind: str, line: str) -> Optional[str]:
+        """Drop list markers and reject lines that are empty, rambling or missing the name slot."""
+        line = _LIST_MARKER.sub("", line.strip()).strip()
+        if not 8 <= len(line) <= 300:
+            return None
+        if kind == 'greeting' and line.count(USERNAME) != 1:
+            return None
+        return line
@@ -0,0 +1,276 @@
+"""
+Multi-process sharded deployment.
+A coordinator splits the bot's gateway shards into contiguous ranges, runs each
+range in its own worker process, restarts workers that die and aggregates the
+per-shard health they report.
+
+Guild channels live on exactly one shard, so conversation history and the
+response cache partition naturally per process. User context follows people
+across guilds, so workers share one SQLite context database. The OpenAI rate
+and concurrency budget is split evenly between workers.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import multiprocessing
+from typing import Dict, List, Optional
+import discord
+from config import Config
+from metrics import registry, MetricsServer
+from llm_scheduler import budget_share
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_DB = "emobot-context.db"
+SHARED_REFRESH_SECONDS = 10.0
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Split shard ids into contiguous, near-equal ranges, one per process."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Ask the gateway how many shards this bot should run."""
+    client = discord.Client(intents=discord.Intents.default())
+    try:
+        await client.login(token)
+        shards, _, _ = await client.http.get_bot_gateway()
+        return shards
+    finally:
+        await client.close()
+
+
+def worker_overrides(index: int, processes: int) -> Dict:
+    """Config values for one worker: an even share of the LLM budget, plus shared state."""
+    memory_root, memory_ext = os.path.splitext(Config.MEMORY_PATH or "")
+    overrides = budget_share(processes)
+    overrides.update({
+        'SHARD_PROCESSES': 1,
+        'CONTEXT_DB_PATH': Config.CONTEXT_DB_PATH or DEFAULT_SHARED_DB,
+        'CONTEXT_SHARED_REFRESH': Config.CONTEXT_SHARED_REFRESH or SHARED_REFRESH_SECONDS,
+        # A memory file can only have one writer, so each worker keeps its own
+        'MEMORY_PATH': f"{memory_root}-{index}{memory_ext}" if Config.MEMORY_PATH else None,
+        # The coordinator serves METRICS_PORT; workers take the ports after it
+        'METRICS_PORT': Config.METRICS_PORT + 1 + index if Config.METRICS_PORT else 0
+    })
+    return overrides
+
+
+def shard_health(bot, index: int) -> Dict:
+    """Snapshot of one worker's shards for the coordinator."""
+    return {
+        'index': index,
+        'pid': os.getpid(),
+        'ready': bot.is_ready(),
+        'guilds': len(bot.guilds),
+        'shards': {
+            shard_id: {'latency': shard.latency, 'up': not shard.is_closed()}
+            for shard_id, shard in bot.shards.items()
+        },
+        'time': time.time()
+    }
+
+
+def run_worker(index: int, shard_ids: List[int], shard_count: int, overrides: Dict, health_queue):
+    """Process entry point: run one EmoBot over a range of shards."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+    try:
+        asyncio.run(_worker_main(index, shard_ids, shard_count, health_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_main(index: int, shard_ids: List[int], shard_count: int, health_queue):
+    from bot import EmoBot
+
+    bot = EmoBot(shard_ids=shard_ids, shard_count=shard_count)
+    reporter = asyncio.create_task(_report_health(bot, index, health_queue))
+    try:
+        await bot.start_bot()
+    finally:
+        reporter.cancel()
+        await bot.close()
+
+
+async def _report_health(bot, index: int, health_queue):
+    while True:
+        try:
+            health_queue.put_nowait(shard_health(bot, index))
+        except Exception as e:
+            logger.debug(f"Couldn't report health: {e}")
+        await asyncio.sleep(Config.SHARD_HEALTH_INTERVAL)
+
+
+class WorkerHandle:
+    """Coordinator-side view of one worker process."""
+
+    def __init__(self, index: int, shard_ids: List[int]):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.process: Optional[multiprocessing.Process] = None
+        self.health: Optional[Dict] = None
+        self.restarts = 0
+        self.crashes = 0  # Exits since the worker last ran stably; sets the restart backoff
+        self.restart_at = 0.0
+        self.started_at = 0.0
+
+
+class ShardCoordinator:
+    """Starts, supervises and reports on the shard worker processes."""
+
+    def __init__(self, processes: Optional[int] = None, shard_count: Optional[int] = None):
+        self.processes = processes or Config.SHARD_PROCESSES
+        self.shard_count = shard_count or Config.SHARD_COUNT
+        self.workers: List[WorkerHandle] = []
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = self._context.Queue()
+        self._closing = False
+        self.metrics_server = MetricsServer() if Config.METRICS_PORT else None
+
+    async def run(self):
+        if not self.shard_count:
+            self.shard_count = await recommended_shard_count(Config.DISCORD_TOKEN)
+        ranges = shard_ranges(self.shard_count, self.processes)
+        self.workers = [WorkerHandle(i, shard_ids) for i, shard_ids in enumerate(ranges)]
+        logger.info(f"Running {self.shard_count} shards in {len(self.workers)} processes: {ranges}")
+
+        self._register_gauges()
+        if self.metrics_server:
+            await self.metrics_server.start()
+
+        # Bring workers up one at a time so identifies respect Discord's rate limit
+        for worker in self.workers:
+            self._start(worker)
+            await self._wait_ready(worker, Config.SHARD_READY_TIMEOUT * len(worker.shard_ids))
+
+        last_log = time.monotonic()
+        while not self._closing:
+            await self._drain_health(timeout=1.0)
+            self._supervise()
+            if time.monotonic() - last_log >= Config.SHARD_HEALTH_INTERVAL * 6:
+                logger.info(self.describe())
+                last_log = time.monotonic()
+
+    async def close(self):
+        self._closing = True
+        for worker in self.workers:
+            if worker.process and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process:
+                await asyncio.to_thread(worker.process.join, 10)
+        if self.metrics_server:
+            await self.metrics_server.close()
+
+    def describe(self) -> str:
+        """One line per worker with its shards' state and latency."""
+        lines = ["Shard health:"]
+        for worker in self.workers:
+            health = worker.health
+            if health is None:
+                lines.append(f"  worker {worker.index} shards {worker.shard_ids}: no report yet")
+                continue
+            shards = ", ".join(
+                f"{shard_id}:{'up' if info['up'] else 'DOWN'}/{info['latency'] * 1000:.0f}ms"
+                for shard_id, info in sorted(health['shards'].items())
+            )
+            age = time.time() - health['time']
+            lines.append(
+                f"  worker {worker.index} pid {health['pid']} {'ready' if health['ready'] else 'starting'}, "
+                f"{health['guilds']} guilds, restarts {worker.restarts}, reported {age:.0f}s ago: {shards}"
+            )
+        return "\n".join(lines)
+
+    def _start(self, worker: WorkerHandle):
+        worker.health = None
+        worker.started_at = time.monotonic()
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(worker.index, worker.shard_ids, self.shard_count, worker_overrides(worker.index, len(self.workers)), self._queue),
+            name=f"emobot-shard-worker-{worker.index}",
+            daemon=False
+        )
+        worker.process.start()
+        logger.info(f"Started worker {worker.index} (pid {worker.process.pid}) for shards {worker.shard_ids}")
+
+    async def _wait_ready(self, worker: WorkerHandle, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and worker.process.is_alive():
+            await self._drain_health(timeout=1.0)
+            if worker.health and worker.health['ready']:
+                return
+        if not worker.process.is_alive():
+            logger.error(f"Worker {worker.index} exited during startup with code {worker.process.exitcode}")
+        else:
+            logger.warning(f"Worker {worker.index} not ready after {timeout:.0f}s, starting the next one anyway")
+
+    async def _drain_health(self, timeout: float):
+        try:
+            report = await asyncio.to_thread(self._queue.get, True, timeout)
+        except queue.Empty:
+            return
+        while report is not None:
+            if 0 <= report['index'] < len(self.workers):
+                self.workers[report['index']].health = report
+            try:
+                report = self._queue.get_nowait()
+            except queue.Empty:
+                report = None
+
+    def _supervise(self):
+        """Restart dead workers with exponential backoff."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            if worker.process.is_alive():
+                # A crash long ago shouldn't slow down the next restart
+                if worker.crashes and now - worker.started_at >= Config.SHARD_STABLE_AFTER:
+                    worker.crashes = 0
+                continue
+            if worker.restart_at == 0.0:
+                delay = min(Config.SHARD_RESTART_MAX_BACKOFF, 2 ** worker.crashes)
+                worker.restart_at = now + delay
+                logger.error(
+                    f"Worker {worker.index} (shards {worker.shard_ids}) exited with code "
+                    f"{worker.process.exitcode}, restarting in {delay:.0f}s"
+                )
+            elif now >= worker.restart_at:
+                worker.restarts += 1
+                worker.crashes += 1
+                worker.restart_at = 0.0
+                self._start(worker)
+
+    def _register_gauges(self):
+        def shard_values(field: str) -> Dict:
+            values = {}
+            for worker in self.workers:
+                for shard_id in worker.shard_ids:
+                    info = worker.health['shards'].get(shard_id) if worker.health else None
+                    if field == 'up':
+                        alive = worker.process is not None and worker.process.is_alive()
+                        values[(str(shard_id),)] = 1.0 if alive and info and info['up'] else 0.0
+                    elif info:
+                        values[(str(shard_id),)] = info['latency']
+            return values
+
+        registry.gauge("emobot_shard_up", "Whether each shard's gateway connection is open", lambda: shard_values('up'), ("shard",))
+        registry.gauge("emobot_shard_latency_seconds", "Gateway heartbeat latency per shard", lambda: shard_values('latency'), ("shard",))
+        registry.gauge("emobot_worker_restarts", "Restarts per shard worker process",
+                       lambda: {(str(w.index),): w.restarts for w in self.workers}, ("worker",))
@@ -0,0 +1,99 @@
+"""
+Progressive Discord delivery for streamed AI responses.
+Posts the first chunk quickly and edits it in coalesced batches.
+"""
+
+import time
+import asyncio
+import logging
+import discord
+from typing import List, Optional
+from config import Config
+from outbound import split_point
+
+logger = logging.getLogger(__name__)
+
+class StreamingReply:
+    """A Discord reply that grows as completion tokens arrive."""
+
+    def __init__(self, channel, edit_interval: Optional[float] = None, min_chars: Optional[int] = None, outbound=None):
+        self.channel = channel
+        self.outbound = outbound  # New messages queue behind the channel's other sends
+        self.edit_interval = edit_interval if edit_interval is not None else Config.STREAM_EDIT_INTERVAL
+        self.min_chars = min_chars if min_chars is not None else Config.STREAM_EDIT_MIN_CHARS
+        self.max_length = Config.MAX_MESSAGE_LENGTH
+        self.messages: List[discord.Message] = []
+        self.text = ""
+        self._offset = 0  # Where the current Discord message starts in self.text
+        self._current: Optional[discord.Message] = None
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def feed(self, delta: str):
+        """Add streamed text, flushing when the time/size window allows."""
+        self.text += delta
+
+        # Get something on screen as soon as there's a word to show
+        if not self.messages:
+            if self.text.strip():
+                await self._flush()
+            return
+
+        pending = len(self.text) - self._offset - len(self._shown)
+        elapsed = time.monotonic() - self._last_edit
+        if elapsed >= self.edit_interval and pending >= self.min_chars:
+            await self._flush()
+
+    async def finish(self, appendix: Optional[str] = None) -> str:
+        """Flush remaining text plus an optional appendix as the final edit."""
+        if appendix:
+            self.text = f"{self.text.rstrip()}\n\n{appendix}"
+        await self._flush()
+
+        # The final edit is the one that matters, so retry it once after backing off
+        if self.text[self._offset:] != self._shown and self.text[self._offset:].strip():
+            await asyncio.sleep(self.edit_interval)
+            await self._flush()
+        return self.text
+
+    async def _flush(self):
+        """Bring Discord up to date, rolling over to a new message at the length limit."""
+        while len(self.text) - self._offset > self.max_length:
+            visible = self.text[self._offset:]
+            cut = split_point(visible, self.max_length)
+            await self._show(visible[:cut])
+
+            # Start the next message after the split point
+            self._offset += cut
+            while self._offset < len(self.text) and self.text[self._offset].isspace():
+                self._offset += 1
+            self._current = None
+            self._shown = ""
+
+        visible = self.text[self._offset:]
+        if visible.strip() and visible != self._shown:
+            await self._show(visible)
+
+    async def _show(self, content: str):
+        """Send or edit the current message, backing off if Discord pushes back."""
+        try:
+            if self._current is None:
+                if self.outbound:
+                    posted = await self.outbound.send(self.channel, content, coalesce=False)
+                    if not posted:
+                        return  # Dropped by a full queue; try again on the next flush
+                    self._current = posted[0]
+                else:
+                    self._current = await self.channel.send(content)
+                self.messages.append(self._current)
+            else:
+                await self._current.edit(content=content)
+            self._shown = content
+        except discord.HTTPException as e:
+            if e.status != 429:
+                raise
+            # Edits are cosmetic until the last one, so slow down instead of fighting the bucket
+            self.edit_interval = min(self.edit_interval * 2, Config.STREAM_EDIT_MAX_INTERVAL)
+            logger.warning(f"Rate limited while streaming, edit interval now {self.edit_interval:.1f}s")
+        finally:
+            self._last_edit = time.monotonic()
@@ -0,0 +1,18 @@
+"""Token counting loads the tokenizer lazily and falls back to an estimate."""
+
+import subprocess
+import sys
+import conversation_history
+
+def test_import_does_not_load_the_tokenizer():
+    check = "import sys, conversation_history as h; assert not h._encoding_loaded and 'tiktoken' not in sys.modules"
+    subprocess.run([sys.executable, "-c", check], check=True)
+
+
+def test_falls_back_to_an_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tiktoken', None)
+    monkeypatch.setattr(conversation_history, '_encoding', None)
+    monkeypatch.setattr(conversation_history, '_encoding_loaded', False)
+    text = "x" * 40
+    assert conversation_history.count_tokens(text) == 10 + conversation_history.MESSAGE_OVERHEAD_TOKENS
+    assert conversation_history._encoding_loaded
@@ -0,0 +1,97 @@
+"""AhoCorasick finds exactly what per-pattern substring search finds."""
+
+import random
+from keyword_matcher import AhoCorasick
+from music_knowledge import GENRE_WORDS, RECOMMEND_TRIGGERS, MusicKnowledge
+
+def substring_matches(patterns, text):
+    """(end_index, payload) for every occurrence, found the slow way."""
+    found = []
+    for pattern in patterns:
+        start = text.find(pattern)
+        while start != -1:
+            found.append((start + len(pattern) - 1, pattern))
+            start = text.find(pattern, start + 1)
+    return sorted(found)
+
+
+def word_in(word, text, plural=False):
+    """Whether word occurs in text with no letter or digit touching it."""
+    start = text.find(word)
+    while start != -1:
+        end = start + len(word)
+        if plural and text.startswith('s', end):
+            end += 1
+        if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+
+def automaton(patterns) -> AhoCorasick:
+    matcher = AhoCorasick()
+    for pattern in patterns:
+        matcher.add(pattern, pattern)
+    return matcher
+
+
+def test_overlapping_and_nested_patterns():
+    patterns = ["he", "she", "his", "hers", "e"]
+    text = "ushers and his shes"
+    assert sorted(automaton(patterns).iter_matches(text)) == substring_matches(patterns, text)
+
+
+def test_matches_substring_search_on_random_inputs():
+    rng = random.Random(7)
+    for _ in range(300):
+        patterns = list({
+            "".join(rng.choice("ab c") for _ in range(rng.randint(1, 4)))
+            for _ in range(rng.randint(1, 8))
+        })
+        text = "".join(rng.choice("ab c") for _ in range(rng.randint(0, 40)))
+        assert sorted(automaton(patterns).iter_matches(text)) == substring_matches(patterns, text)
+
+
+def test_spans_cover_the_matched_text():
+    text = "ushers and his shes"
+    for start, end, pattern in automaton(["he", "she", "hers"]).iter_spans(text):
+        assert text[start:end] == pattern
+
+
+def test_patterns_added_after_a_scan_are_matched():
+    matcher = automaton(["emo"])
+    assert matcher.payloads("emo kids") == ["emo"]
+    matcher.add("kids", "kids")
+    assert matcher.payloads("emo kids") == ["emo", "kids"]
+
+
+def test_empty_pattern_is_ignored():
+    matcher = automaton(["", "a"])
+    assert matcher.payloads("aa") == ["a", "a"]
+
+
+def test_music_scan_agrees_with_whole_word_checks():
+    music = MusicKnowledge()
+    bands = list(music.catalog.iter_band_names())
+    messages = [
+        "Any album like Green Day? I need a recommendation",
+        "what should i listen to after my chemical romance",
+        "the ramones and the clash, punk forever",
+        "Metal or pop punk? what's your favorite genre",
+        "just had lunch, nothing to do with music_theory",
+        "Blink-182 ALL THE SMALL THINGS on repeat",
+        "my memory is bad, sitting on a stool with a demo of bands and songs",
+        "emotional metalheads rocking out",
+        "",
+    ]
+    for message in messages:
+        text = message.lower().replace('_', ' ')
+        matches = music.scan(message)
+        keywords = {k for k in music.music_keywords if word_in(k, text, plural=True)}
+        assert matches.keywords == keywords
+        # Triggers may sit inside longer words, as in "recommendation"
+        assert matches.recommend == any(trigger in text for trigger in RECOMMEND_TRIGGERS)
+        assert matches.genre_words == {word for word in GENRE_WORDS if word_in(word, text)}
+        assert [band['name'].lower() for band in matches.bands] == [name for _, name in bands if word_in(name, text)]
+        assert matches.genres == [genre for genre in music.genre_responses if word_in(genre, text)]
+        assert music.is_music_related(message) == bool(keywords)
@@ -0,0 +1,137 @@
+"""LLMScheduler: per-user round-robin admission and load shedding."""
+
+import asyncio
+import pytest
+from llm_scheduler import LLMBusyError, LLMScheduler
+
+def make_scheduler(**overrides) -> LLMScheduler:
+    """One slot and a bucket too deep to run dry, so only the queue decides order."""
+    options = dict(max_concurrency=1, rate_per_minute=6000, burst=100, max_queue=10, max_wait=5)
+    options.update(overrides)
+    return LLMScheduler(**options)
+
+
+def test_waiters_are_admitted_round_robin_per_user():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.acquire(0)  # Hold the only slot so everyone else queues
+        order = []
+
+        async def ask(user_id, tag):
+            await scheduler.acquire(user_id)
+            order.append(tag)
+            scheduler.release()
+
+        tasks = [
+            asyncio.create_task(ask(user_id, tag))
+            for user_id, tag in ((1, 'a1'), (1, 'a2'), (2, 'b1'), (3, 'c1'))
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.stats()['queue_depth'] == 4
+        assert scheduler.stats()['users_waiting'] == 3
+
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    # A user with two queued messages doesn't get both before the others get one
+    assert order == ['a1', 'b1', 'c1', 'a2']
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    assert stats['admitted'] == 5
+
+
+def test_full_queue_sheds_instead_of_queueing():
+    async def run():
+        scheduler = make_scheduler(max_queue=2)
+        await scheduler.acquire(0)
+        waiters = [asyncio.create_task(scheduler.acquire(user_id)) for user_id in (1, 2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMBusyError):
+            await scheduler.acquire(3)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert stats['shed'] == 1
+    assert stats['queue_depth'] == 0
+    assert stats['users_waiting'] == 0
+
+
+def test_one_user_cannot_fill_the_queue(monkeypatch):
+    monkeypatch.setattr('config.Config.LLM_MAX_QUEUED_PER_USER', 2)
+
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.acquire(0)
+        waiters = [asyncio.create_task(scheduler.acquire(1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMBusyError):
+            await scheduler.acquire(1)
+        # Someone else still gets a place in the queue
+        waiters.append(asyncio.create_task(scheduler.acquire(2)))
+        await asyncio.sleep(0)
+        depth = scheduler.queue_depth
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return depth, scheduler.stats()
+
+    depth, stats = asyncio.run(run())
+    assert depth == 3
+    assert stats['shed'] == 1
+
+
+def test_waiting_past_max_wait_sheds_and_leaves_no_waiter_behind():
+    async def run():
+        scheduler = make_scheduler(max_wait=5)
+        await scheduler.acquire(0)
+        with pytest.raises(LLMBusyError):
+            await scheduler.acquire(1, max_wait=0.01)  # A caller's deadline shortens the wait
+        stats = scheduler.stats()
+        # The slot frees up later and nobody stale is admitted into it
+        scheduler.release()
+        return stats, scheduler.stats()
+
+    waiting, after = asyncio.run(run())
+    assert waiting['shed'] == 1
+    assert waiting['queue_depth'] == 0
+    assert waiting['users_waiting'] == 0
+    assert after['in_flight'] == 0
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.acquire(0)
+        waiter = asyncio.create_task(scheduler.acquire(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        depth = scheduler.queue_depth
+        scheduler.release()
+        return depth, scheduler.stats()
+
+    depth, stats = asyncio.run(run())
+    assert depth == 0
+    assert stats['in_flight'] == 0
+    assert stats['admitted'] == 1
+
+
+def test_try_acquire_never_jumps_the_queue():
+    async def run():
+        # One token: the first call spends it and the next caller has to queue for a refill
+        scheduler = make_scheduler(max_concurrency=2, rate_per_minute=1, burst=1)
+        assert scheduler.try_acquire()
+        scheduler.release()
+        waiter = asyncio.create_task(scheduler.acquire(1))
+        await asyncio.sleep(0)
+        jumped = scheduler.try_acquire()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return jumped
+
+    assert asyncio.run(run()) is False
@@ -0,0 +1,47 @@
+"""MessageGate: canned blurbs only for messages that are really about music."""
+
+import pytest
+from message_gate import IGNORE, LLM, LOCAL, MessageGate
+from music_knowledge import MusicKnowledge
+
+@pytest.fixture(scope='module')
+def music():
+    return MusicKnowledge()
+
+
+@pytest.fixture
+def gate(music):
+    return MessageGate(music, llm_threshold=3.0, local_threshold=1.0)
+
+
+@pytest.mark.parametrize('content', [
+    "my memory is bad today",  # emo
+    "remove that demo pls",  # emo
+    "sitting on a stool lol",  # Tool
+    "the used car was cheap",  # The Used
+])
+def test_everyday_words_get_no_blurb(gate, content):
+    assert gate.decide(content, channel_id=1).action == IGNORE
+
+
+def test_band_mention_gets_a_blurb(gate):
+    decision = gate.decide("have you heard The Ramones?", channel_id=1)
+    assert decision.action == LOCAL
+    assert "The Ramones" in decision.reply
+
+
+def test_lowercase_band_counts_alongside_other_music_talk(gate):
+    decision = gate.decide("the used are all over my playlist", channel_id=1)
+    assert decision.action == LOCAL
+    assert "The Used" in decision.reply
+
+
+def test_blurbs_wait_out_the_channel_cooldown(gate):
+    assert gate.decide("Paramore live was unreal", channel_id=1).action == LOCAL
+    assert gate.decide("Paramore live was unreal", channel_id=1).action == IGNORE
+    assert gate.decide("Paramore live was unreal", channel_id=2).action == LOCAL
+
+
+def test_bot_name_is_matched_as_a_word(gate):
+    assert gate.decide("hey raven, you up?", channel_id=1).action == LLM
+    assert gate.decide("I'm ravenous", channel_id=1).action == IGNORE
@@ -0,0 +1,79 @@
+"""split_message: chunk sizes and the boundaries it refuses to cut through."""
+
+from outbound import FENCE, _balanced, split_message
+
+def squash(text: str) -> str:
+    return "".join(text.split())
+
+
+def test_short_text_is_one_stripped_chunk():
+    assert split_message("  hello there \n") == ["hello there"]
+    assert split_message("") == []
+
+
+def test_text_of_exactly_the_limit_is_not_split():
+    text = "x" * 50
+    assert split_message(text, 50) == [text]
+
+
+def test_chunks_fit_the_limit_and_keep_every_character():
+    text = " ".join(f"word{i}" for i in range(400))
+    chunks = split_message(text, 100)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert squash("".join(chunks)) == squash(text)
+
+
+def test_prefers_paragraph_breaks():
+    first = "First paragraph. " * 4
+    text = f"{first.strip()}\n\nSecond paragraph goes on. " + "More words here. " * 3
+    chunks = split_message(text, 100)
+    assert chunks[0] == first.strip()
+
+
+def test_sentence_boundary_keeps_its_punctuation():
+    text = "This sentence runs on until it ends here. " + "and then a long tail of words without stops " * 3
+    chunks = split_message(text, 60)
+    assert chunks[0] == "This sentence runs on until it ends here."
+
+
+def test_does_not_cut_inside_inline_markdown():
+    # The last space within the limit is inside the bold span; the one before it is not
+    text = "intro words " * 4 + "**bold words bold words bold words**" + " trailing words" * 6
+    chunks = split_message(text, 80)
+    assert chunks[0] == ("intro words " * 4).strip()
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    assert all(_balanced(chunk) for chunk in chunks)
+
+
+def test_code_blocks_are_closed_and_reopened_at_the_seam():
+    code = "\n".join(f"    line_{i} = {i}" for i in range(20))
+    text = f"Here you go:\n{FENCE}python\n{code}\n{FENCE}"
+    chunks = split_message(text, 120)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    for chunk in chunks:
+        assert chunk.count(FENCE) % 2 == 0
+    for chunk in chunks[1:]:
+        assert chunk.startswith(f"{FENCE}python\n")
+    # Indentation survives the seam
+    assert chunks[1].split("\n")[1].startswith("    line_")
+
+
+def test_never_splits_an_emoji_sequence():
+    family = "\U0001F468‍\U0001F469‍\U0001F467"
+    flag = "\U0001F1EC\U0001F1E7"
+    for emoji in (family, flag, "\U0001F44D\U0001F3FD"):
+        text = emoji * 40
+        chunks = split_message(text, 50)
+        assert "".join(chunks) == text
+        assert all(len(chunk) <= 50 for chunk in chunks)
+        assert all(len(chunk) % len(emoji) == 0 for chunk in chunks)
+
+
+def test_never_splits_a_mention():
+    mention = "<@123456789012345678>"
+    text = "a" * 40 + mention + "b" * 40
+    chunks = split_message(text, 50)
+    assert any(mention in chunk for chunk in chunks)
+    assert "".join(chunks) == text
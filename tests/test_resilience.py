@@ -0,0 +1,150 @@
+"""CircuitBreaker state machine and half-open probe ownership."""
+
+import pytest
+import resilience
+from config import Config
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+def tripped(clock, threshold: int = 3, cooldown: float = 10.0) -> CircuitBreaker:
+    breaker = CircuitBreaker(threshold=threshold, window=30.0, cooldown=cooldown)
+    for _ in range(threshold):
+        breaker.failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_closed_breaker_allows_calls_that_are_not_probes(clock):
+    breaker = CircuitBreaker(threshold=3, window=30.0, cooldown=10.0)
+    assert breaker.allow() is False
+    assert not breaker.is_open
+
+
+def test_opens_after_threshold_failures_within_window(clock):
+    breaker = CircuitBreaker(threshold=3, window=30.0, cooldown=10.0)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_failures_outside_the_window_do_not_add_up(clock):
+    breaker = CircuitBreaker(threshold=3, window=30.0, cooldown=10.0)
+    breaker.failure()
+    breaker.failure()
+    clock.now += 31
+    breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_success_while_closed_clears_failures(clock):
+    breaker = CircuitBreaker(threshold=3, window=30.0, cooldown=10.0)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_open_breaker_refuses_until_cooldown(clock):
+    breaker = tripped(clock)
+    assert breaker.allow() is None
+    assert breaker.rejected == 1
+    clock.now += 9.9
+    assert breaker.allow() is None
+    assert breaker.rejected == 2
+
+
+def test_failures_from_calls_started_before_opening_are_ignored(clock):
+    breaker = tripped(clock)
+    breaker.failure()
+    clock.now += 10
+    assert breaker.allow() is True
+
+
+def test_only_one_probe_after_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    assert breaker.allow() is True
+    assert breaker.state == HALF_OPEN
+    assert breaker.is_open
+    assert breaker.allow() is None
+
+
+def test_probe_success_closes(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    probe = breaker.allow()
+    breaker.success(probe)
+    assert breaker.state == CLOSED
+    assert breaker.allow() is False
+
+
+def test_probe_failure_reopens_with_longer_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    breaker.failure(breaker.allow())
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+    clock.now += 10
+    assert breaker.allow() is None
+    clock.now += 10
+    assert breaker.allow() is True
+
+
+def test_cooldown_growth_is_capped(clock):
+    breaker = tripped(clock, cooldown=Config.BREAKER_MAX_COOLDOWN / 2)
+    for _ in range(3):
+        clock.now += Config.BREAKER_MAX_COOLDOWN
+        breaker.failure(breaker.allow())
+    clock.now += Config.BREAKER_MAX_COOLDOWN
+    assert breaker.allow() is True
+
+
+def test_probe_success_resets_cooldown(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    breaker.failure(breaker.allow())
+    clock.now += 20
+    breaker.success(breaker.allow())
+    for _ in range(3):
+        breaker.failure()
+    clock.now += 10
+    assert breaker.allow() is True
+
+
+def test_calls_that_do_not_hold_the_probe_cannot_settle_it(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    assert breaker.allow() is True
+    # Calls admitted before the breaker opened finish while the probe is out
+    breaker.success(False)
+    assert breaker.state == HALF_OPEN
+    breaker.failure(False)
+    assert breaker.state == HALF_OPEN
+    breaker.release(False)
+    assert breaker.allow() is None
+
+
+def test_released_probe_frees_the_slot_for_another(clock):
+    breaker = tripped(clock)
+    clock.now += 10
+    breaker.release(breaker.allow())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is True
@@ -0,0 +1,78 @@
+"""ResponseCache keys, name placeholders and the prompts cached replies come from."""
+
+import pytest
+from context_store import UserContext
+from personality import PersonalityEngine
+from response_cache import ResponseCache
+
+def fill(cache: ResponseCache, key, reply: str, username: str):
+    for _ in range(cache.variants):
+        cache.put(key, reply, username)
+
+
+def test_name_is_replaced_only_as_a_whole_word():
+    cache = ResponseCache(variants=1)
+    key = cache.make_key("hi raven", None, False)
+    fill(cache, key, "Always happy to see you, Al! Al's back 🖤", "Al")
+    assert cache.get(key, "Sam") == "Always happy to see you, Sam! Sam's back 🖤"
+
+
+def test_names_with_punctuation_are_replaced():
+    cache = ResponseCache(variants=1)
+    key = cache.make_key("hi raven", None, False)
+    fill(cache, key, "hey xX.emo.Xx! welcome", "xX.emo.Xx")
+    assert cache.get(key, "Sam") == "hey Sam! welcome"
+
+
+def test_returning_users_share_keys_by_familiarity():
+    cache = ResponseCache()
+    first = cache.make_key("hi raven", UserContext("my cat died", "", 2), False)
+    second = cache.make_key("Hi Raven!!", UserContext("something else", "", 5), False)
+    assert first is not None
+    assert first == second
+    assert first != cache.make_key("hi raven", None, False)
+    assert first != cache.make_key("hi raven", UserContext("", "", 50), False)
+
+
+def test_dm_and_music_flags_split_keys():
+    cache = ResponseCache()
+    key = cache.make_key("hi raven", None, False)
+    assert key != cache.make_key("hi raven", None, False, is_dm=True)
+    assert key != cache.make_key("hi raven", None, True)
+
+
+def test_long_messages_are_not_cached():
+    cache = ResponseCache()
+    assert cache.make_key("word " * 40, None, False) is None
+    assert cache.bypassed == 1
+
+
+def test_serves_only_once_the_variant_pool_is_full():
+    cache = ResponseCache(variants=2)
+    key = cache.make_key("hi raven", None, False)
+    cache.put(key, "hey you", "Al")
+    assert cache.get(key, "Sam") is None
+    cache.put(key, "hi there", "Al")
+    assert cache.get(key, "Sam") in ("hey you", "hi there")
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return PersonalityEngine()
+
+
+def test_cacheable_prompt_leaves_out_what_the_user_said(engine):
+    context = UserContext("my ex is called Jamie", "", 4)
+    prompt = engine._build_context_prompt("hi raven", context, "Al", cacheable=True)
+    assert "Jamie" not in prompt
+    assert "4 times" not in prompt
+    # Users in the same bucket get the same prompt apart from their name
+    other = engine._build_context_prompt("hi raven", UserContext("something else", "", 6), "Al", cacheable=True)
+    assert prompt == other
+
+
+def test_uncached_prompt_keeps_the_full_context(engine):
+    context = UserContext("my ex is called Jamie", "", 4)
+    prompt = engine._build_context_prompt("hi raven", context, "Al")
+    assert "Jamie" in prompt
+    assert "4 times" in prompt